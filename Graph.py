@@ -1,167 +1,208 @@
 
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")  # files only, and each worker process gets its own pyplot
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
-import os
+
+from correlation import correlate, stratified_sample
+from metrics_state import load_sketches, state_path_for
+from render_cache import render_cache
+from storage import load_metrics, metrics_path
 
 # -----------------------------
-# Load Calculated Metrics
+# Batch chart renderer
 # -----------------------------
-df = pd.read_csv("calculated_metrics.csv")
-
-# Ensure Date column exists
-if "Date" in df.columns:
-    df["Date"] = pd.to_datetime(df["Date"])
+# Every figure is an independent job: (output file, draw function, args,
+# columns it reads). Jobs whose figure is already in render_cache for this
+# dataset version are copied instead of redrawn; the rest run across a
+# process pool (matplotlib is not thread-safe), and each worker receives
+# only the columns its job needs.
+#
+# Histograms, box and violin plots are drawn from the quantile sketches
+# saved at ingestion (sketches.py) when they exist, so those jobs ship a few
+# hundred numbers instead of a full column and no KDE is fitted. The
+# correlation heatmap gets a matrix computed in one pass (correlation.py)
+# and the pairplot a stratified sample of PAIRPLOT_SAMPLE_ROWS rows.
+#
+# seaborn (and the scipy it pulls in) is imported inside the draw functions
+# that use it, so workers that only draw line, area or sketch figures never
+# load it.
+#
+#   python Graph.py --workers 8 [--force]
 
-# Create folder for saving graphs
 output_folder = "graphs"
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
 
-# -----------------------------
-# LINE CHARTS / TIME SERIES
-# -----------------------------
 line_columns = ["Sales", "Profit", "Net_Profit_%", "Operating_Margin_%", "Daily_Sales",
                 "Avg_Resolution_Time", "Utilization_%", "Stock_Turnover", "On_Time_Delivery_%",
                 "CLV", "CAC", "ROI_%", "Lead_Conversion_Rate_%"]
+area_columns = ["Sales", "Profit", "Daily_Sales"]
+bar_columns = ["Profit_Margin_%","Gross_Margin_%","Conversion_Rate_%","Retention_Rate_%","Churn_Rate_%","Contribution_%"]
+pie_columns = ["Contribution_%"]
+scatter_pairs = [("Sales","Profit"), ("Marketing_Spend","Revenue"), ("CLV","CAC")]
+pairplot_cols = ["Sales", "Profit", "Net_Profit_%", "Operating_Margin_%"]
+funnel_stages = ["Leads","Converted_Leads","Customers"]
 
-for col in line_columns:
-    if col in df.columns and "Date" in df.columns:
-        plt.figure(figsize=(10,5))
-        plt.plot(df["Date"], df[col], marker='o')
-        plt.title(f"{col} Over Time")
-        plt.xlabel("Date")
-        plt.ylabel(col)
-        plt.grid(True)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f"{output_folder}/{col}_line.png")
-        plt.close()
+
+# -----------------------------
+# LINE CHARTS / TIME SERIES
+# -----------------------------
+def draw_line(df, col):
+    plt.figure(figsize=(10,5))
+    plt.plot(df["Date"], df[col], marker='o')
+    plt.title(f"{col} Over Time")
+    plt.xlabel("Date")
+    plt.ylabel(col)
+    plt.grid(True)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
 
 # -----------------------------
 # AREA / STACKED AREA CHART
 # -----------------------------
-area_columns = ["Sales", "Profit", "Daily_Sales"]
-existing_cols = [col for col in area_columns if col in df.columns and "Date" in df.columns]
-if existing_cols:
+def draw_stacked_area(df, cols):
     plt.figure(figsize=(10,5))
-    plt.stackplot(df["Date"], df[existing_cols].T, labels=existing_cols, alpha=0.6)
+    plt.stackplot(df["Date"], df[cols].T, labels=cols, alpha=0.6)
     plt.title("Stacked Area Chart")
     plt.xlabel("Date")
     plt.ylabel("Value")
     plt.legend()
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/stacked_area_chart.png")
-    plt.close()
 
 # -----------------------------
 # BAR CHARTS
 # -----------------------------
-bar_columns = ["Profit_Margin_%","Gross_Margin_%","Conversion_Rate_%","Retention_Rate_%","Churn_Rate_%","Contribution_%"]
-for col in bar_columns:
-    if col in df.columns and "Date" in df.columns:
-        plt.figure(figsize=(10,5))
-        sns.barplot(x=df["Date"], y=df[col], palette="viridis")
-        plt.title(f"{col} Over Time")
-        plt.xlabel("Date")
-        plt.ylabel(col)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.savefig(f"{output_folder}/{col}_bar.png")
-        plt.close()
+def draw_bar(df, col):
+    import seaborn as sns
+    plt.figure(figsize=(10,5))
+    sns.barplot(x=df["Date"], y=df[col], palette="viridis")
+    plt.title(f"{col} Over Time")
+    plt.xlabel("Date")
+    plt.ylabel(col)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
 
 # -----------------------------
 # PIE / DONUT CHARTS
 # -----------------------------
-pie_columns = ["Contribution_%"]
-for col in pie_columns:
-    if col in df.columns:
-        plt.figure(figsize=(7,7))
-        plt.pie(df[col], labels=df.index, autopct='%1.1f%%', startangle=140)
-        plt.title(f"{col} Distribution")
-        plt.tight_layout()
-        plt.savefig(f"{output_folder}/{col}_pie.png")
-        plt.close()
+def draw_pie(df, col):
+    plt.figure(figsize=(7,7))
+    plt.pie(df[col], labels=df.index, autopct='%1.1f%%', startangle=140)
+    plt.title(f"{col} Distribution")
+    plt.tight_layout()
 
 # -----------------------------
 # HISTOGRAMS
 # -----------------------------
-numeric_cols = df.select_dtypes(include='number').columns
-for col in numeric_cols:
+def draw_hist(df, col):
+    import seaborn as sns
     plt.figure(figsize=(8,5))
     sns.histplot(df[col], bins=10, kde=True, color='skyblue')
     plt.title(f"Distribution of {col}")
     plt.xlabel(col)
     plt.ylabel("Frequency")
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/{col}_hist.png")
-    plt.close()
 
 # -----------------------------
 # BOX / VIOLIN PLOTS
 # -----------------------------
-for col in numeric_cols:
+def draw_box(df, col):
+    import seaborn as sns
     plt.figure(figsize=(8,5))
     sns.boxplot(x=df[col], color='lightgreen')
     plt.title(f"Boxplot of {col}")
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/{col}_box.png")
-    plt.close()
 
+def draw_violin(df, col):
+    import seaborn as sns
     plt.figure(figsize=(8,5))
     sns.violinplot(x=df[col], color='lightblue')
     plt.title(f"Violin Plot of {col}")
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/{col}_violin.png")
-    plt.close()
+
+# -----------------------------
+# SKETCH-BASED DISTRIBUTIONS
+# -----------------------------
+# Same figures from precomputed statistics; `_` is the (empty) frame.
+def draw_hist_sketch(_, col, counts, edges):
+    plt.figure(figsize=(8,5))
+    plt.stairs(counts, edges, fill=True, color='skyblue', edgecolor='steelblue')
+    plt.title(f"Distribution of {col}")
+    plt.xlabel(col)
+    plt.ylabel("Frequency (approx.)")
+    plt.tight_layout()
+
+def draw_box_sketch(_, col, stats):
+    plt.figure(figsize=(8,5))
+    plt.gca().bxp([{**stats, "label": col}], vert=False, showfliers=False, patch_artist=True,
+                  boxprops={"facecolor": "lightgreen"})
+    plt.title(f"Boxplot of {col}")
+    plt.tight_layout()
+
+def draw_violin_sketch(_, col, stats):
+    plt.figure(figsize=(8,5))
+    plt.gca().violin([stats], vert=False, showmedians=True)
+    plt.title(f"Violin Plot of {col}")
+    plt.tight_layout()
+
+def sketch_stats(sketch, bins=10, density_points=30):
+    # (hist args, box stats, violin stats) for one column's KLL sketch
+    counts, edges = sketch.histogram(bins)
+    fine, fine_edges = sketch.histogram(density_points)
+    density = np.convolve(fine, np.ones(5) / 5, mode="same") / (sketch.n * np.diff(fine_edges))
+    box = sketch.box()
+    # Axes.violin needs a mean even though it is not drawn (showmeans=False)
+    violin = {"coords": (fine_edges[:-1] + fine_edges[1:]) / 2, "vals": density,
+              "mean": box["med"], "median": box["med"], "min": sketch.min, "max": sketch.max}
+    return (counts, edges), box, violin
 
 # -----------------------------
 # SCATTER PLOTS (Relationships)
 # -----------------------------
-scatter_pairs = [("Sales","Profit"), ("Marketing_Spend","Revenue"), ("CLV","CAC")]
-for x,y in scatter_pairs:
-    if x in df.columns and y in df.columns:
-        plt.figure(figsize=(8,5))
-        sns.scatterplot(x=df[x], y=df[y])
-        sns.regplot(x=df[x], y=df[y], scatter=False, color='red')  # trendline
-        plt.title(f"{y} vs {x}")
-        plt.xlabel(x)
-        plt.ylabel(y)
-        plt.tight_layout()
-        plt.savefig(f"{output_folder}/{x}_vs_{y}_scatter.png")
-        plt.close()
+def draw_scatter(df, x, y):
+    import seaborn as sns
+    plt.figure(figsize=(8,5))
+    sns.scatterplot(x=df[x], y=df[y])
+    sns.regplot(x=df[x], y=df[y], scatter=False, color='red')  # trendline
+    plt.title(f"{y} vs {x}")
+    plt.xlabel(x)
+    plt.ylabel(y)
+    plt.tight_layout()
 
 # -----------------------------
 # CORRELATION HEATMAP
 # -----------------------------
-if len(numeric_cols) > 1:
+HEATMAP_ANNOTATE_MAX = 20     # wider matrices are unreadable with numbers in every cell
+
+def draw_heatmap(_, cols, matrix):
+    import seaborn as sns
     plt.figure(figsize=(12,10))
-    sns.heatmap(df[numeric_cols].corr(), annot=True, fmt=".2f", cmap="coolwarm")
+    sns.heatmap(pd.DataFrame(matrix, index=cols, columns=cols), annot=len(cols) <= HEATMAP_ANNOTATE_MAX,
+                fmt=".2f", cmap="coolwarm", vmin=-1, vmax=1)
     plt.title("Correlation Between Metrics")
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/correlation_heatmap.png")
-    plt.close()
 
 # -----------------------------
 # PAIRPLOT
 # -----------------------------
-pairplot_cols = ["Sales", "Profit", "Net_Profit_%", "Operating_Margin_%"]
-existing_pair_cols = [col for col in pairplot_cols if col in df.columns]
-if len(existing_pair_cols) >= 2:
-    sns.pairplot(df[existing_pair_cols])
-    plt.savefig(f"{output_folder}/pairplot.png")
-    plt.close()
+def draw_pairplot(df, cols):
+    import seaborn as sns
+    sns.pairplot(df[cols])
 
 # -----------------------------
 # CUMULATIVE / ROLLING
 # -----------------------------
-if "Sales" in df.columns:
+def draw_cumulative(df):
     plt.figure(figsize=(10,5))
     plt.plot(df["Date"], df["Sales"].cumsum(), marker='o', label="Cumulative Sales")
-    if "Sales" in df.columns:
-        plt.plot(df["Date"], df["Sales"].rolling(3).mean(), marker='x', label="3M Rolling Avg")
+    plt.plot(df["Date"], df["Sales"].rolling(3).mean(), marker='x', label="3M Rolling Avg")
     plt.title("Cumulative Sales & Rolling Average")
     plt.xlabel("Date")
     plt.ylabel("Sales")
@@ -169,21 +210,144 @@ if "Sales" in df.columns:
     plt.grid(True)
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/cumulative_rolling_sales.png")
-    plt.close()
 
 # -----------------------------
 # SIMPLE FUNNEL-LIKE PLOT (Leads → Converted Leads → Customers)
 # -----------------------------
-if all(col in df.columns for col in ["Leads","Converted_Leads","Customers"]):
-    stages = ["Leads","Converted_Leads","Customers"]
-    values = [df[stage].sum() for stage in stages]
+def draw_funnel(df):
+    values = [df[stage].sum() for stage in funnel_stages]
     plt.figure(figsize=(6,5))
-    plt.barh(stages, values, color=['skyblue','orange','green'])
+    plt.barh(funnel_stages, values, color=['skyblue','orange','green'])
     plt.title("Funnel: Leads → Converted Leads → Customers")
     plt.xlabel("Count")
     plt.tight_layout()
-    plt.savefig(f"{output_folder}/funnel_leads.png")
-    plt.close()
 
-print(f"\n All possible graphs generated and saved in the folder '{output_folder}'")
+
+DRAW = {fn.__name__: fn for fn in [
+    draw_line, draw_stacked_area, draw_bar, draw_pie, draw_hist, draw_box, draw_violin,
+    draw_scatter, draw_heatmap, draw_pairplot, draw_cumulative, draw_funnel,
+    draw_hist_sketch, draw_box_sketch, draw_violin_sketch,
+]}
+
+
+# -----------------------------
+# Jobs
+# -----------------------------
+def build_jobs(columns, numeric_cols, sketches=None):
+    # (filename, draw function name, args, columns read by the job)
+    quantile_sketches = sketches.quantiles if sketches is not None else {}
+    has_date = "Date" in columns
+    jobs = []
+    for col in line_columns:
+        if col in columns and has_date:
+            jobs.append((f"{col}_line.png", "draw_line", (col,), ["Date", col]))
+    existing_cols = [col for col in area_columns if col in columns and has_date]
+    if existing_cols:
+        jobs.append(("stacked_area_chart.png", "draw_stacked_area", (existing_cols,), ["Date"] + existing_cols))
+    for col in bar_columns:
+        if col in columns and has_date:
+            jobs.append((f"{col}_bar.png", "draw_bar", (col,), ["Date", col]))
+    for col in pie_columns:
+        if col in columns:
+            jobs.append((f"{col}_pie.png", "draw_pie", (col,), [col]))
+    stats = {col: sketch_stats(quantile_sketches[col]) for col in numeric_cols if col in quantile_sketches}
+    for col in numeric_cols:
+        if col in stats:
+            jobs.append((f"{col}_hist.png", "draw_hist_sketch", (col, *stats[col][0]), []))
+        else:
+            jobs.append((f"{col}_hist.png", "draw_hist", (col,), [col]))
+    for col in numeric_cols:
+        if col in stats:
+            jobs.append((f"{col}_box.png", "draw_box_sketch", (col, stats[col][1]), []))
+            jobs.append((f"{col}_violin.png", "draw_violin_sketch", (col, stats[col][2]), []))
+        else:
+            jobs.append((f"{col}_box.png", "draw_box", (col,), [col]))
+            jobs.append((f"{col}_violin.png", "draw_violin", (col,), [col]))
+    for x, y in scatter_pairs:
+        if x in columns and y in columns:
+            jobs.append((f"{x}_vs_{y}_scatter.png", "draw_scatter", (x, y), [x, y]))
+    if len(numeric_cols) > 1:
+        # The matrix is added to the args by job_input()
+        jobs.append(("correlation_heatmap.png", "draw_heatmap", (list(numeric_cols),), []))
+    existing_pair_cols = [col for col in pairplot_cols if col in columns]
+    if len(existing_pair_cols) >= 2:
+        jobs.append(("pairplot.png", "draw_pairplot", (existing_pair_cols,), existing_pair_cols))
+    if "Sales" in columns and has_date:
+        jobs.append(("cumulative_rolling_sales.png", "draw_cumulative", (), ["Date", "Sales"]))
+    if all(col in columns for col in funnel_stages):
+        jobs.append(("funnel_leads.png", "draw_funnel", (), funnel_stages))
+    return jobs
+
+
+def render_job(draw_name, args, frame):
+    # Runs in a worker process; returns (png bytes, seconds)
+    start = time.perf_counter()
+    DRAW[draw_name](frame, *args)
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png")
+    plt.close("all")
+    return buf.getvalue(), time.perf_counter() - start
+
+
+def job_input(df, draw_name, args, cols):
+    # (args, frame) sent to a worker. Only called for figures being redrawn,
+    # so a cached heatmap never pays for its correlation pass.
+    if draw_name == "draw_heatmap":
+        return args + (correlate(df, args[0])["matrix"],), None
+    if draw_name == "draw_pairplot":
+        return args, stratified_sample(df)[cols]
+    return args, df[cols] if cols else None
+
+
+def render_all(workers=None, force=False):
+    os.makedirs(output_folder, exist_ok=True)
+    data_path = metrics_path()
+    df = load_metrics()  # Date is already parsed by the storage layer
+    numeric_cols = list(df.select_dtypes(include='number').columns)
+    jobs = build_jobs(set(df.columns), numeric_cols, load_sketches(state_path_for(data_path)))
+
+    timings = {}
+    pending = []
+    for filename, draw_name, args, cols in jobs:
+        output_file = f"{output_folder}/{filename}"
+        if not force and render_cache.restore(data_path, {"figure": filename}, output_file):
+            timings[filename] = None
+        else:
+            pending.append((filename, draw_name, args, cols))
+
+    def store(filename, png):
+        render_cache.put(data_path, {"figure": filename}, png)
+        with open(f"{output_folder}/{filename}", "wb") as fh:
+            fh.write(png)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(pending) <= 1:
+        for filename, draw_name, args, cols in pending:
+            png, timings[filename] = render_job(draw_name, *job_input(df, draw_name, args, cols))
+            store(filename, png)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futures = {pool.submit(render_job, draw_name, *job_input(df, draw_name, args, cols)): filename
+                       for filename, draw_name, args, cols in pending}
+            for future in as_completed(futures):
+                png, timings[futures[future]] = future.result()
+                store(futures[future], png)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None, help="processes to render with (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="redraw figures even if they are up to date")
+    parser.add_argument("--timings", action="store_true", help="print how long every figure took")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    timings = render_all(args.workers, args.force)
+    rendered = {name: t for name, t in timings.items() if t is not None}
+    if args.timings:
+        for name, seconds in sorted(rendered.items(), key=lambda item: -item[1]):
+            print(f"{seconds:8.2f}s  {name}")
+    print(f"\n Rendered {len(rendered)} graphs ({len(timings) - len(rendered)} up to date, "
+          f"{sum(rendered.values()):.1f}s of render time) in {time.perf_counter() - start:.1f}s")
+    print(f" All possible graphs generated and saved in the folder '{output_folder}'")
@@ -1,35 +1,103 @@
-from flask import Flask, render_template, jsonify, request
-import pandas as pd
-import matplotlib.pyplot as plt
-import io
-import base64
+from flask import Flask, Response, g, render_template, jsonify, request
+import numpy as np
 import os
 from flask_cors import CORS
-from config import UPLOAD_FOLDER   # make sure config.py exists with UPLOAD_FOLDER path
+from werkzeug.utils import secure_filename
+from config import UPLOAD_FOLDER, UPLOAD_BLOCK_BYTES   # make sure config.py exists with UPLOAD_FOLDER path
+from data_cache import dataset_cache
+from storage import load_frame, temp_path
+from charts import chart_body, chart_data, chart_params, int_param, png_params, render_chart_png
+from render_cache import fingerprint, render_cache
+from metrics_query import FORMATS as QUERY_FORMATS, date_sorted, parse_query, select, stream
+from rollups import AGGS, RollupStore
+from summary import select as select_summary, summarize
+from correlation import correlate, submatrix, to_json as correlation_json
+from time_intelligence import series as time_series, to_json as time_series_json
+from sketches import distinct_params, distinct_report, distribution_params, distribution_report
+from jobs import job_runner
+from perf import perf, to_prometheus
+from datasets import DatasetError, content_hash, dataset_path, dataset_registry, dataset_sketches
 
 app = Flask(__name__)
 CORS(app)
 
+# ========== Instrumentation ==========
+# Every request is timed per route, with its load / compute / render /
+# serialize stages (perf.py); the numbers are served at /api/perf
+@app.before_request
+def perf_start():
+    rule = request.url_rule.rule if request.url_rule else None
+    g.perf = perf.start(f'{request.method} {rule}' if rule else None)
+
+@app.after_request
+def perf_status(response):
+    g.perf_status = response.status_code
+    return response
+
+@app.teardown_request
+def perf_finish(exc):
+    perf.finish(g.pop('perf', None), status=500 if exc is not None else g.pop('perf_status', None))
+
+def respond(body):
+    with perf.span('serialize'):
+        return jsonify(body)
+
+# ========== Datasets ==========
+@app.errorhandler(DatasetError)
+def dataset_error(e):
+    return jsonify({'status': 'error', 'message': str(e)}), e.status
+
+def _dataset_id():
+    # Every data endpoint takes ?dataset_id= (or "dataset_id" in a JSON body);
+    # without one it serves the default calculated_metrics file
+    return (request.get_json(silent=True) or {}).get('dataset_id') or request.args.get('dataset_id')
+
+def data_path():
+    return dataset_path(_dataset_id())
+
 # ========== File Upload ==========
 @app.route('/upload', methods=['POST'])
+@app.route('/api/upload', methods=['POST'])
 def upload_file():
+    # Stores the file as a dataset (deduplicated by content hash) and starts
+    # computing its metrics; poll /api/datasets/<dataset_id> until "ready"
     if 'file' not in request.files:
         return jsonify({'status': 'error', 'message': 'No file uploaded'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'status': 'error', 'message': 'Empty filename'}), 400
 
-    filepath = os.path.join(UPLOAD_FOLDER, file.filename)
+    filename = secure_filename(file.filename)
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    file.save(filepath)
-    return jsonify({'status': 'success', 'filename': file.filename})
+    tmp = temp_path(os.path.join(UPLOAD_FOLDER, filename))
+    digest = content_hash()
+    # Copy in fixed-size blocks so multi-GB uploads never sit in memory
+    try:
+        with open(tmp, 'wb') as out:
+            while block := file.stream.read(UPLOAD_BLOCK_BYTES):
+                digest.update(block)
+                out.write(block)
+        record, created = dataset_registry.add(tmp, filename, digest.hexdigest())
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return jsonify({'status': 'success', 'filename': filename, 'dataset_id': record['id'],
+                    'deduplicated': not created, 'dataset': record})
+
+@app.route('/api/datasets')
+def list_datasets():
+    return jsonify(dataset_registry.list())
+
+@app.route('/api/datasets/<dataset_id>', methods=['GET', 'DELETE'])
+def dataset(dataset_id):
+    if request.method == 'DELETE':
+        return jsonify({'status': 'success', 'deleted': dataset_registry.delete(dataset_id)['id']})
+    return jsonify(dataset_registry.get(dataset_id))
 
 # ========== Load Data Helper ==========
-def load_data():
-    df = pd.read_csv("calculated_metrics.csv")
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"])
-    return df
+def load_data(path=None):
+    # Shared, parsed once per file version -- do not mutate the result
+    return dataset_cache.get(path or data_path(), load_frame)
 
 # ========== Frontend ==========
 @app.route('/')
@@ -39,55 +107,217 @@ def home():
 # ========== API: Full Metrics ==========
 @app.route('/api/metrics')
 def get_metrics():
-    df = load_data()
-    return jsonify(df.to_dict(orient='records'))
+    # ?columns=&start=&end=&offset=&limit=&cursor=&format=records|columnar|ndjson
+    # (see metrics_query.py); the body is streamed block by block
+    path = data_path()
+    df = load_data(path)
+    try:
+        q = parse_query(request.args, fingerprint(path))
+        page = select(df, q, dataset_cache.derived(path, 'date_sorted', date_sorted, load_frame))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    headers = {'X-Next-Cursor': page.next_cursor} if page.next_cursor else {}
+    # Encoding happens as the body is sent; perf.stream times it and ends the
+    # request's trace once the last block is out
+    return Response(perf.stream(stream(page, q['format'])), mimetype=QUERY_FORMATS[q['format']], headers=headers)
 
 # ========== API: Summary ==========
 @app.route('/api/summary')
 def get_summary():
-    df = load_data()
-    summary = {
-        'total_sales': float(df['Sales'].sum()),
-        'avg_profit': float(df['Profit'].mean()),
-        'max_profit': float(df['Profit'].max()),
-        'min_profit': float(df['Profit'].min()),
+    # Statistics for every numeric column, computed once per dataset version
+    # (summary.py); ?columns= and ?aggs= narrow the response. The headline
+    # total_sales / avg_profit / max_profit / min_profit keys are kept.
+    summary = dataset_cache.derived(data_path(), 'summary', summarize, load_frame)
+    try:
+        body = select_summary(summary, _list_arg('columns'), _list_arg('aggs'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return respond(body)
+
+def _list_arg(name):
+    value = request.args.get(name)
+    return [v for v in value.split(',') if v] if value else None
+
+# ========== API: Correlation ==========
+@app.route('/api/correlation')
+def get_correlation():
+    # Pearson matrix of the numeric columns, computed once per dataset version
+    # (correlation.py). ?columns= narrows it, ?top=k adds the k most strongly
+    # correlated pairs.
+    result = dataset_cache.derived(data_path(), 'correlation', correlate, load_frame)
+    try:
+        columns = _list_arg('columns')
+        if columns:
+            result = submatrix(result, columns)
+        body = correlation_json(result, int_param(request.args, 'top', 0))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return respond(body)
+
+# ========== API: Sketches ==========
+@app.route('/api/distinct')
+def get_distinct():
+    # ?column=Customers&start=&end= -- HyperLogLog estimate with its error
+    # bound, from the sketches saved at ingestion (sketches.py)
+    try:
+        p = distinct_params(request.args)
+        body = distinct_report(dataset_sketches(_dataset_id()), p['column'], p['start'], p['end'])
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return respond(body)
+
+@app.route('/api/distribution')
+def get_distribution():
+    # ?column=Sales&q=0.1,0.5,0.9&bins=20&start=&end= -- quantiles, box plot
+    # statistics and a histogram from the column's KLL sketch
+    try:
+        p = distribution_params(request.args)
+        body = distribution_report(dataset_sketches(_dataset_id()), **p)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return respond(body)
+
+# ========== API: Rollups ==========
+def load_rollups():
+    # Built once per dataset version, shared like load_data()
+    return dataset_cache.derived(data_path(), 'rollups', RollupStore, load_frame)
+
+@app.route('/api/rollup')
+def get_rollup():
+    # ?metric=Sales&grain=month&start=&end=&aggs=sum,mean -- columnar, one
+    # entry per bucket (labelled by its start date); empty buckets are skipped
+    try:
+        aggs = [a for a in request.args.get('aggs', ','.join(AGGS)).split(',') if a]
+        result = load_rollups().query(
+            request.args.get('metric') or 'Sales',
+            request.args.get('grain') or 'month',
+            request.args.get('start') or None,
+            request.args.get('end') or None,
+            aggs,
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    body = {
+        'metric': request.args.get('metric') or 'Sales',
+        'grain': request.args.get('grain') or 'month',
+        'buckets': result.pop('buckets').strftime('%Y-%m-%d').tolist(),
     }
-    return jsonify(summary)
+    for agg, values in result.items():
+        body[agg] = [None if np.isnan(v) else v for v in values.astype(float).tolist()]
+    return respond(body)
+
+# ========== API: Time Intelligence ==========
+@app.route('/api/time-intelligence')
+def get_time_intelligence():
+    # ?metrics=Sales,Profit&grain=month&window=3&start=&end= -- totals,
+    # to-date sums, growth rates, CAGR and rolling means for every period
+    # (time_intelligence.py), from the memoized rollups
+    try:
+        grain = request.args.get('grain') or 'month'
+        window = int(request.args.get('window', 3))
+        result = time_series(load_rollups(), _list_arg('metrics') or ['Sales'], grain, window,
+                             request.args.get('start') or None, request.args.get('end') or None)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return respond({'grain': grain, 'window': window, **time_series_json(result)})
 
-# ========== API: Chart ==========
+# ========== Chart Data Helper ==========
+def _chart_request():
+    # /api/chart takes a JSON body; /api/chart.png also accepts a query string
+    return request.get_json(silent=True) or request.args
+
+# ========== API: Chart (data) ==========
 @app.route('/api/chart', methods=['POST'])
 def generate_chart():
-    data = request.json
-    chart_type = data.get('type', 'line')
-    metric = data.get('metric', 'Sales')
-    df = load_data()
-
-    plt.figure(figsize=(10, 5))
-    if chart_type == 'line':
-        plt.plot(df["Date"], df[metric], marker='o', color='#1E90FF')
-    elif chart_type == 'bar':
-        plt.bar(df["Date"], df[metric], color='#1E90FF')
-
-    plt.title(f"{metric} Over Time")
-    plt.xlabel("Date")
-    plt.ylabel(metric)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    plt.close()
-
-    return jsonify({'image': f'data:image/png;base64,{image_base64}'})
+    # Returns the series as compact columnar arrays; the dashboard draws it
+    # with Plotly. Optional body fields: metrics (several metrics on shared
+    # labels, under 'series'), points (target point count), start / end
+    # (viewport dates), method ('lttb' or 'minmax') and time_format ('iso',
+    # default, or 'epoch_ms').
+    try:
+        p = chart_params(_chart_request())
+        dates, series = chart_data(load_data(), p)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    return respond(chart_body(p, dates, series, (request.get_json(silent=True) or {}).get('time_format')))
+
+# ========== API: Chart (PNG, opt-in) ==========
+@app.route('/api/chart.png', methods=['GET', 'POST'])
+def chart_png():
+    # Same parameters as /api/chart plus width / height (pixels) and style
+    # (a matplotlib style name). Served from render_cache; the cache key is
+    # the ETag, so unchanged charts are answered with 304 Not Modified.
+    try:
+        p = png_params(_chart_request())
+        path = data_path()
+
+        key = render_cache.key(path, p)
+        if key in request.if_none_match:
+            return Response(status=304, headers={'ETag': f'"{key}"'})
+
+        def render():
+            dates, series = chart_data(load_data(path), p)
+            with perf.span('render'):
+                return render_chart_png(dates, series[p['metric']], p['metric'], p['type'], p['width'], p['height'], p['style'])
+        key, png = render_cache.get_or_render(path, p, render)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    response = Response(png, mimetype='image/png')
+    response.set_etag(key)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 # ========== API: Trigger Metrics Calculation ==========
 @app.route('/api/calculate-metrics')
 def calculate_metrics():
-    from metrics_calculator import main
-    main()
-    return jsonify({'status': 'success', 'message': 'Metrics calculated successfully'})
+    # ?dataset_id= recomputes an uploaded dataset, ?file=<name> the latest one
+    # uploaded under that name, otherwise the default metrics from Details.csv.
+    # Returns 202 with a job id at once; poll /api/jobs/<id> for the outcome.
+    # Triggering the same unchanged input again while its job is pending
+    # returns that job instead of starting another.
+    from ingest import submit_metrics_job
+    dataset_id = request.args.get('dataset_id')
+    if not dataset_id and request.args.get('file'):
+        dataset_id = dataset_registry.find(secure_filename(request.args['file']))['id']
+    if dataset_id:
+        record = dataset_registry.process(dataset_id)
+        status_url = f"/api/jobs/{record['job_id']}"
+        return jsonify({'status': 'accepted', 'job_id': record['job_id'], 'dataset_id': record['id'],
+                        'status_url': status_url}), 202, {'Location': status_url}
+    source = 'Details.csv'
+    if not os.path.exists(source):
+        return jsonify({'status': 'error', 'message': f'{source} not found'}), 404
+
+    job, created = submit_metrics_job(source)
+    status_url = f'/api/jobs/{job.id}'
+    return jsonify({'status': 'accepted', 'job_id': job.id, 'coalesced': not created,
+                    'status_url': status_url}), 202, {'Location': status_url}
+
+# ========== API: Jobs ==========
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in reversed(job_runner.recent())])
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': f'Unknown job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+# ========== API: Performance ==========
+@app.route('/api/perf')
+def get_perf():
+    # Latency percentiles per route and stage, cache hit ratios and the kept
+    # profiles; ?format=prometheus for the text exposition format
+    caches = {'datasets': dataset_cache.stats(), 'renders': render_cache.stats()}
+    if request.args.get('format') == 'prometheus':
+        return Response(to_prometheus(perf.snapshot(), caches), mimetype='text/plain; version=0.0.4')
+    return jsonify({**perf.snapshot(), 'caches': caches})
 
 # ========== Run App ==========
 if __name__ == '__main__':
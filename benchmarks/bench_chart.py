@@ -0,0 +1,75 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_storage import make_metrics_frame  # noqa: E402
+
+
+# -----------------------------
+# Latency benchmark: /api/chart data mode vs /api/chart.png
+# -----------------------------
+# Runs the Flask app in-process against a synthetic metrics file. The PNG
+# endpoint is measured cold (cache cleared before every call) and warm.
+#
+#   python benchmarks/bench_chart.py --rows 1000000 --repeat 20
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(0.95 * (len(samples) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--points", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        from storage import metrics_path, save_frame
+        save_frame(make_metrics_frame(args.rows), metrics_path())
+
+        import app as server
+        client = server.app.test_client()
+        body = {"metric": "Sales", "type": "line", "points": args.points}
+        client.post("/api/chart", json=body)  # parse the dataset once
+
+        def data_mode():
+            r = client.post("/api/chart", json=body)
+            assert r.status_code == 200
+            return r
+
+        def png_cold():
+            server.render_cache.invalidate(metrics_path())
+            assert client.post("/api/chart.png", json=body).status_code == 200
+
+        def png_warm():
+            assert client.post("/api/chart.png", json=body).status_code == 200
+
+        payload_kb = len(data_mode().data) / 1024
+        png_kb = len(client.post("/api/chart.png", json=body).data) / 1024
+
+        print(f"{args.rows:,} rows, {args.points} points, {args.repeat} calls each")
+        print(f"{'mode':<16} {'p50 ms':>8} {'p95 ms':>8} {'payload KB':>11}")
+        for name, fn, kb in [("data (json)", data_mode, payload_kb),
+                             ("png cold", png_cold, png_kb),
+                             ("png cached", png_warm, png_kb)]:
+            p50, p95 = timed(fn, args.repeat)
+            print(f"{name:<16} {p50:>8.1f} {p95:>8.1f} {kb:>11.1f}")
+        os.chdir(ROOT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_storage import peak_rss_mb  # noqa: E402
+
+
+# -----------------------------
+# Memory benchmark: whole-file metrics run vs chunked ingestion
+# -----------------------------
+# Peak RSS of the whole-file path grows with the input; the chunked path
+# should stay flat once the file is larger than a few chunks.
+#
+#   python benchmarks/bench_ingest_memory.py --rows 250000 1000000 4000000
+
+def write_details_csv(path, rows, block=250_000, seed=0):
+    # Written block by block so the generator itself stays small
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2015-01-01")
+    for offset in range(0, rows, block):
+        n = min(block, rows - offset)
+        pd.DataFrame({
+            "Date": (start + pd.to_timedelta(np.arange(offset, offset + n), unit="min")).strftime("%Y-%m-%d %H:%M"),
+            "Sales": rng.integers(100, 10_000, n),
+            "Profit": rng.integers(-500, 3_000, n),
+            "Cost": rng.integers(50, 8_000, n),
+            "Customers": rng.integers(1, 50_000, n),
+            "Conversions": rng.integers(0, 100, n),
+            "Retained_Customers": rng.integers(0, 500, n),
+            "Revenue": rng.integers(1_000, 20_000, n),
+            "Marketing_Spend": rng.integers(100, 2_000, n),
+            "Region": rng.choice(["North", "South", "East", "West"], n),
+        }).to_csv(path, mode="w" if offset == 0 else "a", header=offset == 0, index=False)
+
+
+def child(mode, input_path, output_path, chunksize):
+    import contextlib
+    import io
+
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "full":
+            from metrics_calculator import main
+            main(input_path, output_path)
+        else:
+            from ingest import ingest_csv
+            ingest_csv(input_path, output_path, chunksize=int(chunksize))
+    print(f"{time.perf_counter() - start:.3f} {peak_rss_mb() - baseline_mb:.1f}")
+
+
+def run_child(mode, input_path, output_path, chunksize):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, input_path, output_path, str(chunksize)],
+        check=True, capture_output=True, text=True, cwd=ROOT,
+    ).stdout.split()
+    return float(out[0]), float(out[1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[250_000, 1_000_000, 4_000_000])
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--format", default="feather", choices=["feather", "parquet", "csv"])
+    parser.add_argument("--child", nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    print(f"{'rows':>10} {'input MB':>9}  {'mode':<8} {'time':>8}  peak RSS growth")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            input_path = os.path.join(tmp, f"details_{rows}.csv")
+            write_details_csv(input_path, rows)
+            size_mb = os.path.getsize(input_path) / 1e6
+            for mode in ("full", "chunked"):
+                output_path = os.path.join(tmp, f"out_{mode}_{rows}.{args.format}")
+                elapsed, rss_mb = run_child(mode, input_path, output_path, args.chunksize)
+                print(f"{rows:>10,} {size_mb:>9.1f}  {mode:<8} {elapsed:>7.2f}s  {rss_mb:>8.1f} MB")
+            os.remove(input_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_storage import legacy_csv_load, peak_rss_mb  # noqa: E402
+from schema import read_csv, schema_path_for  # noqa: E402
+from storage import HAVE_PYARROW  # noqa: E402
+
+
+# -----------------------------
+# Load benchmark: default dtypes vs compact dtypes (schema.py)
+# -----------------------------
+# Loads a Details-style CSV (integer measures, float balances, a few text
+# dimensions) the legacy way and with compact dtypes -- first without a
+# recorded schema (infer + record), then with it -- for each CSV engine.
+# Every load runs in a fresh interpreter so peak RSS reflects that load only.
+#
+#   python benchmarks/bench_load_memory.py --rows 1000000
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+PRODUCTS = [f"Product {i:03d}" for i in range(200)]
+
+
+def make_details_csv(path, rows, seed=0):
+    rng = np.random.default_rng(seed)
+    pd.DataFrame({
+        "Date": pd.date_range("2015-01-01", periods=rows, freq="min").strftime("%Y-%m-%d"),
+        "Region": rng.choice(REGIONS, rows),
+        "Product": rng.choice(PRODUCTS, rows),
+        "Sales": rng.integers(100, 10_000, rows),
+        "Profit": rng.integers(-500, 3_000, rows),
+        "Cost": rng.integers(50, 8_000, rows),
+        "Customers": rng.integers(0, 50, rows),
+        "Conversions": rng.integers(0, 20, rows),
+        "Revenue": rng.integers(100, 20_000, rows),
+        "Marketing_Spend": rng.integers(0, 300, rows),
+        "Total_Debt": rng.uniform(0, 100, rows),
+        "Total_Equity": rng.uniform(0, 100, rows),
+    }).to_csv(path, index=False)
+
+
+def child(mode, path, engine):
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "legacy":
+        df = legacy_csv_load(path)
+    else:
+        df = read_csv(path, engine=engine)
+    elapsed = time.perf_counter() - start
+    frame_mb = df.memory_usage(deep=True).sum() / 1e6
+    print(f"{elapsed:.4f} {peak_rss_mb() - baseline_mb:.1f} {frame_mb:.1f}")
+
+
+def run_child(mode, path, engine="c"):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path, engine],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return float(out[0]), float(out[1]), float(out[2])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    engines = ["c"] + (["pyarrow"] if HAVE_PYARROW else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Details.csv")
+        make_details_csv(path, args.rows)
+        print(f"{args.rows:,} rows, {os.path.getsize(path) / 1e6:.1f} MB CSV\n")
+        print("load                          time   peak RSS growth   frame (deep)")
+
+        def report(name, mode, engine="c"):
+            elapsed, rss_mb, frame_mb = run_child(mode, path, engine)
+            print(f"{name:<26} {elapsed:8.3f}s  {rss_mb:10.1f} MB  {frame_mb:10.1f} MB")
+            return frame_mb
+
+        legacy_mb = report("legacy (read_csv)", "legacy")
+        for engine in engines:
+            if os.path.exists(schema_path_for(path)):
+                os.remove(schema_path_for(path))
+            report(f"compact {engine}, infer", "compact", engine)
+            compact_mb = report(f"compact {engine}, recorded", "compact", engine)
+        print(f"\nframe memory: {legacy_mb / compact_mb:.1f}x smaller with compact dtypes")
+
+
+if __name__ == "__main__":
+    main()
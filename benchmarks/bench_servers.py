@@ -0,0 +1,125 @@
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+
+from bench_storage import make_metrics_frame  # noqa: E402
+
+
+# -----------------------------
+# Load test: Flask (app.py) vs ASGI (main.py)
+# -----------------------------
+# Starts each server in its own process against the same synthetic metrics
+# file, drives it with --concurrency clients for --seconds, and reports
+# requests/sec and latency percentiles. Every client loops over the request
+# mix; 'png' asks for a new image size each time so it always renders.
+#
+#   python benchmarks/bench_servers.py --rows 1000000 --concurrency 32 --seconds 20
+
+SERVERS = {
+    'flask': [sys.executable, '-c', 'import sys, app; app.app.run(port=int(sys.argv[1]), threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'main:app', '--log-level', 'warning', '--port'],
+}
+
+REQUESTS = {
+    'summary': lambda i: ('GET', '/api/summary', None),
+    'chart': lambda i: ('POST', '/api/chart', {'metric': 'Sales', 'points': 2000}),
+    'png': lambda i: ('GET', f'/api/chart.png?metric=Profit&points=500&width={600 + i % 400}', None),
+    'metrics': lambda i: ('GET', '/api/metrics', None),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(name, workdir):
+    port = free_port()
+    env = {**os.environ, 'PYTHONPATH': ROOT}
+    proc = subprocess.Popen(SERVERS[name] + [str(port)], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(base + '/api/summary', timeout=30).status_code == 200:
+                return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f'{name} server did not start')
+
+
+async def drive(base, mix, concurrency, seconds):
+    latencies, errors = [], 0
+    stop = time.perf_counter() + seconds
+    counter = iter(range(10**9))
+
+    async def client(http):
+        nonlocal errors
+        while time.perf_counter() < stop:
+            i = next(counter)
+            method, url, body = REQUESTS[mix[i % len(mix)]](i)
+            start = time.perf_counter()
+            try:
+                r = await http.request(method, url, json=body)
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=120, limits=limits) as http:
+        begin = time.perf_counter()
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - begin
+    return latencies, errors, elapsed
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] * 1000 if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--mix', default='summary,chart,chart,png', help=f"comma list of {', '.join(REQUESTS)}")
+    parser.add_argument('--servers', default='flask,asgi')
+    args = parser.parse_args()
+    mix = args.mix.split(',')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        from storage import metrics_path, save_frame
+        save_frame(make_metrics_frame(args.rows), os.path.join(tmp, metrics_path()))
+
+        print(f"{args.rows:,} rows, {args.concurrency} clients, {args.seconds:g}s, mix={args.mix}")
+        print(f"{'server':<8} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name in args.servers.split(','):
+            proc, base = start_server(name, tmp)
+            try:
+                asyncio.run(drive(base, mix, 2, 2))    # warm caches and worker pools
+                latencies, errors, elapsed = asyncio.run(drive(base, mix, args.concurrency, args.seconds))
+            finally:
+                proc.terminate()
+                proc.wait()
+            print(f"{name:<8} {len(latencies):>9} {len(latencies) / elapsed:>8.1f} "
+                  f"{percentile(latencies, 0.5):>8.1f} {percentile(latencies, 0.99):>8.1f} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded by the plotting code only; a server that imports one of these at
+# startup has lost its lazy imports
+HEAVY_MODULES = ["matplotlib", "matplotlib.pyplot", "seaborn", "scipy"]
+SERVERS = {"flask": "app", "asgi": "main"}
+
+
+# -----------------------------
+# Startup benchmark
+# -----------------------------
+# Imports each server module in a fresh interpreter, --repeat times, and
+# reports the median import time, the time to the first response
+# (GET /api/datasets, which reads no data) and which of HEAVY_MODULES the
+# import pulled in. Exits with status 1 if a median import takes longer
+# than --max-seconds or any heavy module was loaded, so CI catches an
+# eager import creeping back in.
+#
+#   python benchmarks/bench_startup.py --repeat 5 --max-seconds 3
+
+def child(server):
+    start = time.perf_counter()
+    module = __import__(SERVERS[server])
+    imported = time.perf_counter() - start
+    heavy = [m for m in HEAVY_MODULES if m in sys.modules]
+    if server == "asgi":
+        from fastapi.testclient import TestClient
+        client = TestClient(module.app).__enter__()
+    else:
+        client = module.app.test_client()
+    status = client.get("/api/datasets").status_code
+    first = time.perf_counter() - start
+    print(json.dumps({"import_seconds": imported, "first_response_seconds": first,
+                      "status": status, "heavy_modules": heavy}))
+
+
+def run_child(server, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", server],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", default=",".join(SERVERS), help=f"comma list of {', '.join(SERVERS)}")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per server")
+    parser.add_argument("--max-seconds", type=float, default=None, help="fail above this median import time")
+    parser.add_argument("--output", default=None, help="write the results as JSON")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    results = []
+    failed = False
+    print(f"{'server':<8} {'import p50':>11} {'first response p50':>19}  heavy modules")
+    with tempfile.TemporaryDirectory() as workdir:
+        for server in [s for s in args.servers.split(",") if s]:
+            runs = [run_child(server, workdir) for _ in range(args.repeat)]
+            heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+            result = {
+                "server": server,
+                "import_seconds": median([r["import_seconds"] for r in runs]),
+                "first_response_seconds": median([r["first_response_seconds"] for r in runs]),
+                "heavy_modules": heavy,
+                "runs": runs,
+            }
+            results.append(result)
+            print(f"{server:<8} {result['import_seconds']:10.3f}s {result['first_response_seconds']:18.3f}s  "
+                  f"{', '.join(heavy) or '-'}")
+            if heavy:
+                print(f"  {SERVERS[server]}.py imports {', '.join(heavy)} at startup")
+                failed = True
+            if args.max_seconds is not None and result["import_seconds"] > args.max_seconds:
+                print(f"  import takes longer than {args.max_seconds:.2f}s")
+                failed = True
+
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump({"python": sys.version.split()[0], "results": results}, fh, indent=1)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import HAVE_PYARROW, load_frame, save_frame  # noqa: E402
+
+
+# -----------------------------
+# Storage benchmark: CSV round-trip vs feather / parquet
+# -----------------------------
+# Every load runs in a fresh interpreter so peak RSS reflects that load only.
+#
+#   python benchmarks/bench_storage.py --rows 1000000
+
+def make_metrics_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "Date": pd.date_range("2015-01-01", periods=rows, freq="min"),
+        "Sales": rng.integers(100, 10_000, rows),
+        "Profit": rng.normal(500, 250, rows),
+        "Cost": rng.integers(50, 8_000, rows),
+        "Customers": rng.integers(1, 500, rows),
+        "Revenue": rng.normal(5_000, 1_000, rows),
+        "Marketing_Spend": rng.normal(800, 200, rows),
+    })
+    df["Profit_Margin_%"] = df["Profit"] / df["Sales"] * 100
+    df["Gross_Margin_%"] = (df["Sales"] - df["Cost"]) / df["Sales"] * 100
+    df["ROI_%"] = (df["Revenue"] - df["Marketing_Spend"]) / df["Marketing_Spend"] * 100
+    df["Contribution_%"] = df["Sales"] / df["Sales"].sum() * 100
+    return df
+
+
+def legacy_csv_load(path, columns=None):
+    # What the readers did before storage.py existed
+    df = pd.read_csv(path, usecols=columns)
+    if "Date" in df.columns:
+        df["Date"] = pd.to_datetime(df["Date"])
+    return df
+
+
+def peak_rss_mb():
+    # VmHWM is reset on exec, unlike ru_maxrss which a child inherits from
+    # the (large) benchmark parent on Linux.
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode, path, columns):
+    columns = columns.split(",") if columns else None
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == "legacy":
+        df = legacy_csv_load(path, columns)
+    else:
+        df = load_frame(path, columns=columns)
+    elapsed = time.perf_counter() - start
+    # Touch every column so lazily mapped pages are counted too
+    df.sum(numeric_only=True)
+    print(f"{elapsed:.4f} {peak_rss_mb() - baseline_mb:.1f}")
+
+
+def run_child(mode, path, columns):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, path, ",".join(columns or [])],
+        check=True, capture_output=True, text=True,
+    ).stdout.split()
+    return float(out[0]), float(out[1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    df = make_metrics_frame(args.rows)
+    formats = ["csv"] + (["feather", "parquet"] if HAVE_PYARROW else [])
+    projections = {"all columns": None, "Date+Sales": ["Date", "Sales"]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for fmt in formats:
+            start = time.perf_counter()
+            paths[fmt] = save_frame(df, os.path.join(tmp, "metrics." + fmt), fmt=fmt)
+            write_s = time.perf_counter() - start
+            size_mb = os.path.getsize(paths[fmt]) / 1e6
+            print(f"write {fmt:<8} {write_s:8.3f}s  {size_mb:8.1f} MB on disk")
+
+        print(f"\nload ({args.rows:,} rows)         time   peak RSS growth")
+        for label, columns in projections.items():
+            cases = [("csv (legacy)", "legacy", paths["csv"])]
+            cases += [(fmt, "storage", paths[fmt]) for fmt in formats]
+            for name, mode, path in cases:
+                elapsed, rss_mb = run_child(mode, path, columns)
+                print(f"{label:<12} {name:<14} {elapsed:8.3f}s  {rss_mb:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_storage import peak_rss_mb  # noqa: E402
+from datagen import write_details_csv  # noqa: E402
+
+
+# -----------------------------
+# Benchmark suite
+# -----------------------------
+# Generates Details.csv-shaped data (datagen.py) for every --rows size and
+# times each case in a fresh interpreter, working in a scratch directory
+# that holds the generated Details.csv and the metrics files computed from
+# it. Peak RSS growth is measured per case, as in bench_storage.py.
+#
+#   metrics  metrics_calculator.main (whole file) and ingest.ingest_csv
+#            (chunked), both writing calculated_metrics
+#   api      every endpoint through the Flask test client (or --server asgi
+#            for main.py): the first request with cold caches ("seconds"),
+#            then --repeat warm requests (p50 / p95)
+#   charts   Graph.render_all and dashboard_plot.py, redrawing everything
+#
+# Results go to a JSON file tagged with the commit, so two runs can be
+# compared -- the comparison exits with status 1 if any case got slower
+# than --threshold:
+#
+#   python benchmarks/bench_suite.py --rows 100000 1000000 --output base.json
+#   python benchmarks/bench_suite.py --rows 100000 1000000 --compare base.json
+
+API_REQUESTS = {
+    "metrics": ("GET", "/api/metrics?limit=1000", None),
+    "summary": ("GET", "/api/summary", None),
+    "correlation": ("GET", "/api/correlation?top=5", None),
+    "rollup": ("GET", "/api/rollup?metric=Sales&grain=month", None),
+    "time_intelligence": ("GET", "/api/time-intelligence?metrics=Sales,Profit&grain=month", None),
+    "distinct": ("GET", "/api/distinct?column=Customers", None),
+    "distribution": ("GET", "/api/distribution?column=Sales&bins=20", None),
+    "chart": ("POST", "/api/chart", {"metric": "Sales", "points": 2000}),
+    "chart_png": ("GET", "/api/chart.png?metric=Sales&points=2000", None),
+}
+SUITES = {
+    "metrics": ["metrics_calculator", "ingest"],
+    "api": list(API_REQUESTS),
+    "charts": ["graph", "dashboard"],
+}
+
+
+# -----------------------------
+# Cases (run in the child process)
+# -----------------------------
+def run_metrics(case, options):
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case == "metrics_calculator":
+            from metrics_calculator import main
+            main("Details.csv")
+        else:
+            from ingest import ingest_csv
+            ingest_csv("Details.csv")
+    return {}
+
+
+def _client(server):
+    # -> request(method, url, body) returning the status code
+    if server == "asgi":
+        from fastapi.testclient import TestClient
+        import main
+        client = TestClient(main.app).__enter__()
+    else:
+        import app
+        client = app.app.test_client()
+
+    def request(method, url, body):
+        response = client.post(url, json=body) if method == "POST" else client.get(url)
+        return response.status_code
+    return request
+
+
+def run_api(case, options):
+    method, url, body = API_REQUESTS[case]
+    request = _client(options["server"])
+    start = time.perf_counter()
+    status = request(method, url, body)
+    cold = time.perf_counter() - start
+    warm = []
+    for _ in range(options["repeat"]):
+        start = time.perf_counter()
+        request(method, url, body)
+        warm.append(time.perf_counter() - start)
+    warm.sort()
+    return {"status": status, "seconds": cold,
+            "warm_p50": warm[len(warm) // 2] if warm else None,
+            "warm_p95": warm[min(int(len(warm) * 0.95), len(warm) - 1)] if warm else None}
+
+
+def run_charts(case, options):
+    os.environ["MPLBACKEND"] = "Agg"
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case == "graph":
+            from Graph import render_all
+            timings = render_all(workers=options["workers"], force=True)
+            return {"figures": len(timings)}
+        import runpy
+        runpy.run_path(os.path.join(ROOT, "dashboard_plot.py"), run_name="__main__")
+    return {"figures": 1}
+
+
+RUNNERS = {"metrics": run_metrics, "api": run_api, "charts": run_charts}
+
+
+def child(suite, case, options):
+    baseline_mb = peak_rss_mb()
+    start = time.perf_counter()
+    result = RUNNERS[suite](case, json.loads(options))
+    result["wall_seconds"] = time.perf_counter() - start
+    result.setdefault("seconds", result["wall_seconds"])
+    result["peak_rss_mb"] = peak_rss_mb() - baseline_mb
+    print(json.dumps(result))
+
+
+def run_child(workdir, suite, case, options):
+    # Render caches are cleared so every case draws for real
+    shutil.rmtree(os.path.join(workdir, "graphs", "cache"), ignore_errors=True)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", suite, case, json.dumps(options)],
+        cwd=workdir, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+# -----------------------------
+# Results
+# -----------------------------
+def environment():
+    import numpy
+    import pandas
+
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        "commit": git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(base, current, threshold):
+    # Prints every case side by side; returns the cases slower than threshold
+    def key(r):
+        return r["suite"], r["case"], r["rows"]
+    before = {key(r): r for r in base["results"]}
+    print(f"\n{'case':<34} {'rows':>10} {'base':>9} {'now':>9} {'ratio':>7}")
+    slower = []
+    for r in current["results"]:
+        old = before.get(key(r))
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        flag = "  <-- slower" if ratio > threshold else ""
+        print(f"{r['suite'] + '/' + r['case']:<34} {r['rows']:>10,} {old['seconds']:8.3f}s {r['seconds']:8.3f}s "
+              f"{ratio:6.2f}x{flag}")
+        if ratio > threshold:
+            slower.append(r)
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000], help="1k .. 50M")
+    parser.add_argument("--start", default="2020-01-01")
+    parser.add_argument("--end", default="2024-12-31")
+    parser.add_argument("--columns", default=None, help="comma list of input columns (default: all)")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma list of {', '.join(SUITES)}")
+    parser.add_argument("--cases", default=None, help="comma list of case names to run (default: all)")
+    parser.add_argument("--server", default="flask", choices=["flask", "asgi"])
+    parser.add_argument("--repeat", type=int, default=20, help="warm requests per endpoint")
+    parser.add_argument("--workers", type=int, default=1, help="processes for Graph.render_all")
+    parser.add_argument("--output", default=None, help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    suites = [s for s in args.suites.split(",") if s]
+    columns = [c for c in args.columns.split(",") if c] if args.columns else None
+    cases = set(args.cases.split(",")) if args.cases else None
+    options = {"server": args.server, "repeat": args.repeat, "workers": args.workers}
+    report = {
+        "environment": environment(),
+        "config": {"rows": args.rows, "start": args.start, "end": args.end, "columns": columns,
+                   "suites": suites, "server": args.server, "repeat": args.repeat},
+        "results": [],
+    }
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as workdir:
+            start = time.perf_counter()
+            write_details_csv(os.path.join(workdir, "Details.csv"), rows, args.start, args.end, columns)
+            print(f"\n{rows:,} rows generated in {time.perf_counter() - start:.1f}s")
+
+            # api and charts read the metrics files, so ingestion always runs
+            todo = [(s, c) for s in SUITES if s in suites for c in SUITES[s] if cases is None or c in cases]
+            if "metrics" not in suites or (cases is not None and "ingest" not in cases):
+                run_child(workdir, "metrics", "ingest", options)
+            for suite, case in todo:
+                try:
+                    result = run_child(workdir, suite, case, options)
+                except subprocess.CalledProcessError as e:
+                    result = {"error": e.stderr.strip().splitlines()[-1] if e.stderr.strip() else str(e),
+                              "seconds": None}
+                result = {"suite": suite, "case": case, "rows": rows, **result}
+                report["results"].append(result)
+                if result["seconds"] is None:
+                    print(f"{suite + '/' + case:<34} failed: {result['error']}")
+                else:
+                    print(f"{suite + '/' + case:<34} {result['seconds']:8.3f}s  {result['peak_rss_mb']:8.1f} MB"
+                          + (f"  warm p50 {result['warm_p50'] * 1000:.1f} ms" if result.get("warm_p50") else ""))
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         f"{report['environment']['commit'] or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fh:
+        json.dump(report, fh, indent=1)
+    print(f"\nResults written to '{output}'")
+
+    if args.compare:
+        with open(args.compare) as fh:
+            base = json.load(fh)
+        report["results"] = [r for r in report["results"] if r["seconds"] is not None]
+        base["results"] = [r for r in base["results"] if r["seconds"] is not None]
+        slower = compare(base, report, args.threshold)
+        if slower:
+            print(f"\n{len(slower)} case(s) more than {args.threshold:.2f}x slower than {args.compare}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
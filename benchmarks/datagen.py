@@ -0,0 +1,156 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics_calculator import METRICS  # noqa: E402
+from storage import HAVE_PYARROW  # noqa: E402
+
+
+# -----------------------------
+# Synthetic Details.csv generator
+# -----------------------------
+# Writes Details.csv-shaped data: a Date column plus every raw input column
+# the metric registry in metrics_calculator.py reads, with plausible ranges
+# and the obvious relations between columns (Converted_Leads <= Leads, Cost
+# a share of Sales, ...). Rows are spread evenly over [start, end] in date
+# order and written block by block, so 50M rows need no more memory than
+# one block. The same arguments and seed always give the same data.
+#
+#   python benchmarks/datagen.py --rows 1000000 --start 2020-01-01 --end 2024-12-31
+#   python benchmarks/datagen.py --rows 5000 --columns Sales,Profit,Customers --output small.csv
+
+BLOCK_ROWS = 1_000_000
+
+
+def _ints(lo, hi):
+    return lambda rng, n, out: rng.integers(lo, hi, n)
+
+
+def _floats(lo, hi, decimals=2):
+    return lambda rng, n, out: np.round(rng.uniform(lo, hi, n), decimals)
+
+
+def _share(of, lo, hi):
+    # An integer share of another column, e.g. conversions out of customers
+    return lambda rng, n, out: np.floor(out[of] * rng.uniform(lo, hi, n)).astype(np.int64)
+
+
+def _profit(rng, n, out):
+    # Sales - Cost - overhead, so some rows lose money
+    return out["Sales"] - out["Cost"] - rng.integers(0, 1_500, n)
+
+
+# Column -> generator; a generator may read columns defined above it
+COLUMNS = {
+    "Sales": _ints(100, 10_000),
+    "Cost": _share("Sales", 0.3, 0.9),
+    "Profit": _profit,
+    "Revenue": _ints(1_000, 20_000),
+    "Marketing_Spend": _ints(100, 2_000),
+    "Operating_Income": _share("Revenue", 0.05, 0.35),
+    "Net_Profit": _share("Operating_Income", 0.5, 0.9),
+    "Customers": _ints(1, 500),
+    "Conversions": _share("Customers", 0.0, 0.6),
+    "Retained_Customers": _share("Customers", 0.3, 0.95),
+    "Leads": _ints(10, 2_000),
+    "Converted_Leads": _share("Leads", 0.02, 0.3),
+    "Customer_Lifetime_Revenue": _floats(100, 5_000),
+    "Customer_Acquisition_Cost": _floats(10, 500),
+    "Resolved_Tickets": _ints(0, 200),
+    "Resolution_Time_Hours": _floats(0, 2_000, 1),
+    "Employee_Available_Hours": _ints(80, 200),
+    "Employee_Worked_Hours": _share("Employee_Available_Hours", 0.5, 1.0),
+    "Stock_Avg": _ints(50, 5_000),
+    "Stock_Sold": _ints(0, 10_000),
+    "Total_Delivery": _ints(1, 500),
+    "On_Time_Delivery": _share("Total_Delivery", 0.6, 1.0),
+    "Total_Debt": _floats(0, 1_000_000),
+    "Total_Equity": _floats(10_000, 2_000_000),
+    "Working_Capital_CurrentAssets": _floats(10_000, 1_000_000),
+    "Working_Capital_CurrentLiabilities": _floats(10_000, 800_000),
+}
+
+
+def input_columns():
+    # Every raw column the metric registry reads; one added to the registry
+    # without an entry above still gets generated, as small integers
+    raw = {col for inputs, _ in METRICS.values() for col in inputs if col not in METRICS}
+    return list(COLUMNS) + sorted(raw - set(COLUMNS))
+
+
+def _block(rng, n, names, missing):
+    out = {}
+    for name in input_columns():
+        out[name] = COLUMNS.get(name, _ints(0, 1_000))(rng, n, out)
+    block = {name: out[name] for name in names}
+    if missing:
+        for name, values in block.items():
+            holes = rng.random(n) < missing
+            if holes.any():
+                block[name] = np.where(holes, np.nan, values)
+    return block
+
+
+def write_details_csv(path, rows, start="2020-01-01", end="2024-12-31", columns=None, missing=0.0,
+                      seed=0, block_rows=BLOCK_ROWS):
+    # columns=None writes Date plus every input column; otherwise only the
+    # listed ones (Date included only if listed)
+    names = input_columns() if columns is None else list(columns)
+    unknown = [c for c in names if c != "Date" and c not in input_columns()]
+    if unknown:
+        raise ValueError(f"Unknown column '{unknown[0]}'")
+    if columns is None:
+        names = ["Date"] + names
+    rng = np.random.default_rng(seed)
+    first, last = pd.Timestamp(start), pd.Timestamp(end)
+    span_days = (last - first).days + 1
+
+    writer = schema = None
+    with open(path, "wb") as sink:
+        sink.write((",".join(names) + "\n").encode())
+        for offset in range(0, rows, block_rows):
+            n = min(block_rows, rows - offset)
+            block = _block(rng, n, [c for c in names if c != "Date"], missing)
+            if "Date" in names:
+                days = (np.arange(offset, offset + n) * span_days) // rows
+                block["Date"] = (first + pd.to_timedelta(days, unit="D")).strftime("%Y-%m-%d")
+            frame = pd.DataFrame(block)[names]
+            if HAVE_PYARROW:
+                # Several times faster than DataFrame.to_csv at these sizes
+                import pyarrow
+                import pyarrow.csv
+                table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    options = pyarrow.csv.WriteOptions(include_header=False, quoting_style="none")
+                    writer = pyarrow.csv.CSVWriter(sink, schema, write_options=options)
+                writer.write_table(table.cast(schema))
+            else:
+                frame.to_csv(sink, header=False, index=False)
+        if writer is not None:
+            writer.close()
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--start", default="2020-01-01")
+    parser.add_argument("--end", default="2024-12-31")
+    parser.add_argument("--columns", default=None, help="comma list (default: Date and every input column)")
+    parser.add_argument("--missing", type=float, default=0.0, help="share of values left empty")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="Details.csv")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    columns = [c for c in args.columns.split(",") if c] if args.columns else None
+    write_details_csv(args.output, args.rows, args.start, args.end, columns, args.missing, args.seed)
+    print(f"{args.rows:,} rows, {os.path.getsize(args.output) / 1e6:.1f} MB written to "
+          f"'{args.output}' in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,162 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from config import CHART_MAX_POINTS, CHART_PNG_MAX_PIXELS
+from downsample import downsample
+from perf import perf
+
+
+# -----------------------------
+# Chart data and rendering shared by app.py (Flask) and main.py (ASGI)
+# -----------------------------
+# Request parsing is framework-neutral: both servers pass any mapping of
+# parameters (JSON body or query string) to chart_params().
+
+# Bad values raise ValueError, which both servers answer with a 400.
+
+MIN_POINTS = 3          # fewest points LTTB can draw (first, one bucket, last)
+
+
+def int_param(params, name, default):
+    # A non-negative integer parameter; missing, null or '' gives default
+    value = params.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"'{name}' must be a non-negative integer")
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a non-negative integer") from None
+    if number < 0:
+        raise ValueError(f"'{name}' must be a non-negative integer")
+    return number
+
+
+def chart_points(params):
+    # Requested point count, capped at CHART_MAX_POINTS and at least
+    # MIN_POINTS; 0 asks for the cap. Only with CHART_MAX_POINTS = 0 (no
+    # cap configured) does 0 send the series without downsampling.
+    points = int_param(params, 'points', CHART_MAX_POINTS)
+    if CHART_MAX_POINTS:
+        points = min(points or CHART_MAX_POINTS, CHART_MAX_POINTS)
+    return max(points, MIN_POINTS) if points else 0
+
+
+def metric_list(params):
+    # metrics: a JSON list or a comma list; defaults to [metric]
+    value = params.get('metrics')
+    if isinstance(value, str):
+        value = [m for m in value.split(',') if m]
+    if value and not (isinstance(value, list) and all(isinstance(m, str) for m in value)):
+        raise ValueError("'metrics' must be a list of column names")
+    return list(dict.fromkeys(value)) if value else [params.get('metric') or 'Sales']
+
+
+def chart_params(params):
+    metrics = metric_list(params)
+    return {
+        'metric': metrics[0],
+        'metrics': metrics,
+        'type': params.get('type') or 'line',
+        'start': params.get('start') or None,
+        'end': params.get('end') or None,
+        'points': chart_points(params),
+        'method': params.get('method') or None,
+    }
+
+
+def png_params(params):
+    # chart_params() plus the image options of /api/chart.png
+    p = chart_params(params)
+    p['width'] = min(int_param(params, 'width', 1000) or 1000, CHART_PNG_MAX_PIXELS)
+    p['height'] = min(int_param(params, 'height', 500) or 500, CHART_PNG_MAX_PIXELS)
+    p['style'] = chart_style(params.get('style'))
+    return p
+
+
+def chart_style(name):
+    # Only a named matplotlib style: style.context() also takes file paths
+    # and URLs, which must never come from a request
+    if not name or name == 'default':
+        return 'default'
+    import matplotlib.style
+    if not isinstance(name, str) or name not in matplotlib.style.available:
+        raise ValueError(f"Unknown style '{name}'")
+    return name
+
+
+def chart_series(df, metrics, start=None, end=None, points=CHART_MAX_POINTS, method=None, chart_type='line'):
+    # (dates, {metric: values}) inside the [start, end] viewport, reduced to
+    # at most `points` rows (0 keeps every row). Line charts default to LTTB,
+    # everything else to min/max buckets so spikes survive. Every metric
+    # keeps the same rows -- those where all of them have a value, and the
+    # union of the rows each one's downsampling picks out of its share of
+    # the budget -- so values at the same position belong together.
+    dates = df["Date"].to_numpy()
+    columns = [pd.to_numeric(df[m], errors='coerce').to_numpy(dtype=float) for m in metrics]
+
+    keep = np.logical_and.reduce([~np.isnan(values) for values in columns])
+    if start:
+        keep &= dates >= np.datetime64(pd.Timestamp(start))
+    if end:
+        keep &= dates <= np.datetime64(pd.Timestamp(end))
+    dates, columns = dates[keep], [values[keep] for values in columns]
+
+    if points and len(dates) > points:
+        method = method or ('lttb' if chart_type == 'line' else 'minmax')
+        x = dates.astype('datetime64[ns]').astype(np.int64)
+        share = max(points // len(columns), MIN_POINTS)
+        idx = np.unique(np.concatenate([downsample(x, values, share, method) for values in columns]))
+        dates, columns = dates[idx], [values[idx] for values in columns]
+    return dates, dict(zip(metrics, columns))
+
+
+def chart_data(df, p):
+    unknown = [m for m in p['metrics'] if m not in df.columns]
+    if unknown:
+        raise ValueError(f"Unknown metric '{unknown[0]}'")
+    with perf.span('compute:chart'):
+        return chart_series(df, p['metrics'], p['start'], p['end'], p['points'], p['method'], p['type'])
+
+
+def chart_body(p, dates, series, time_format=None):
+    # /api/chart response: 'values' is the first metric, 'series' every one
+    return {'metric': p['metric'], 'type': p['type'], 'labels': chart_labels(dates, time_format),
+            'values': series[p['metric']].tolist(),
+            'series': {name: values.tolist() for name, values in series.items()}}
+
+
+def chart_labels(dates, time_format=None):
+    if time_format == 'epoch_ms':
+        return dates.astype('datetime64[ms]').astype(np.int64).tolist()
+    return np.datetime_as_string(dates, unit='s').tolist()
+
+
+def render_chart_png(dates, values, metric, chart_type, width=1000, height=500, style='default'):
+    # Object-oriented matplotlib API: no pyplot global state, no shared lock,
+    # safe to call from threads or worker processes. matplotlib is imported
+    # on the first render, not with the server, and always draws on the
+    # non-interactive Agg canvas whatever the configured backend.
+    import matplotlib.style
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    with matplotlib.style.context(style):
+        fig = Figure(figsize=(width / 100, height / 100), dpi=100)
+        FigureCanvasAgg(fig)
+        ax = fig.subplots()
+        if chart_type == 'bar':
+            ax.bar(dates, values, color='#1E90FF')
+        else:
+            ax.plot(dates, values, marker='o', color='#1E90FF')
+        ax.set_title(f"{metric} Over Time")
+        ax.set_xlabel("Date")
+        ax.set_ylabel(metric)
+        ax.tick_params(axis='x', labelrotation=45)
+        fig.tight_layout()
+
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png')
+    return buf.getvalue()
@@ -1,2 +1,90 @@
 import os
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
\ No newline at end of file
+UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
+
+# Output of metrics_calculator.py, read by the API and the plotting scripts.
+# Format is one of feather (default, memory-mapped), parquet or csv; the
+# file extension follows the format, see storage.py.
+METRICS_BASENAME = 'calculated_metrics'
+METRICS_FORMAT = os.environ.get('MORPH_METRICS_FORMAT', 'feather')
+
+# Upper bound for parsed DataFrames kept in memory by data_cache.py
+CACHE_MAX_BYTES = int(os.environ.get('MORPH_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+# Chunked ingestion (ingest.py): rows parsed per chunk, and bytes copied per
+# block when an upload is streamed to disk
+INGEST_CHUNK_ROWS = int(os.environ.get('MORPH_INGEST_CHUNK_ROWS', 100_000))
+UPLOAD_BLOCK_BYTES = 1024 * 1024
+
+# Default and maximum point count for /api/chart series (0 = no cap and no
+# downsampling)
+CHART_MAX_POINTS = 2000
+
+# /api/chart.png: largest width / height accepted, in pixels
+CHART_PNG_MAX_PIXELS = 4000
+
+# Rendered PNG cache (render_cache.py): on-disk tier and in-memory budget
+RENDER_CACHE_DIR = os.path.join('graphs', 'cache')
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Background jobs (jobs.py): worker threads, how many finished jobs
+# /api/jobs remembers, and where their status files are shared between
+# server processes
+JOB_WORKERS = int(os.environ.get('MORPH_JOB_WORKERS', 2))
+JOB_HISTORY = 100
+JOBS_DIR = os.path.join(os.getcwd(), 'jobs')
+
+# ASGI server (main.py): threads for pandas / file work, processes for
+# matplotlib renders
+ASGI_DATA_WORKERS = int(os.environ.get('MORPH_ASGI_DATA_WORKERS', 4))
+ASGI_RENDER_WORKERS = int(os.environ.get('MORPH_ASGI_RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+
+# /api/metrics encodes and sends this many rows at a time (metrics_query.py)
+METRICS_STREAM_BLOCK_ROWS = 10_000
+
+# Uploaded datasets (datasets.py): one directory per dataset plus the
+# registry index
+DATASETS_DIR = os.path.join(os.getcwd(), 'datasets')
+
+# /api/summary (summary.py): quantiles reported, rows sampled to estimate
+# them, and rows per block of the single statistics pass
+SUMMARY_QUANTILES = (0.25, 0.5, 0.75)
+SUMMARY_SAMPLE_ROWS = 100_000
+SUMMARY_BLOCK_ROWS = 65_536
+
+# Sketches (sketches.py), built during ingestion and kept in the state
+# sidecar: HyperLogLog precision (2^p registers, ~1.04/sqrt(2^p) relative
+# error), KLL compactor size (rank error ~1/k), the columns counted
+# distinctly, and the columns that also get a quantile sketch per month
+HLL_PRECISION = 12
+KLL_K = 200
+SKETCH_DISTINCT_COLUMNS = ('Customers',)
+SKETCH_BUCKET_COLUMNS = ('Sales', 'Profit')
+
+# Correlation (correlation.py): rows per block of the matrix pass, and rows
+# drawn by stratified sampling for pairplots
+CORRELATION_BLOCK_ROWS = 65_536
+PAIRPLOT_SAMPLE_ROWS = 5_000
+
+# Loading (schema.py): CSV parser ('c' or 'pyarrow', multi-threaded, used
+# when installed), and when a text column becomes a category -- at most
+# this many distinct values and this share of the rows; where the inferred
+# schemas are recorded
+CSV_ENGINE = os.environ.get('MORPH_CSV_ENGINE', 'c')
+CATEGORY_MAX_VALUES = 10_000
+CATEGORY_MAX_RATIO = 0.5
+SCHEMA_CACHE_DIR = os.path.join('cache', 'schemas')
+
+# Instrumentation (perf.py, served at /api/perf): on/off, samples kept per
+# latency histogram, and the opt-in profiler -- share of requests run under
+# cProfile, and the duration above which their profile is kept
+PERF_ENABLED = os.environ.get('MORPH_PERF', '1') != '0'
+PERF_WINDOW = 1024
+PERF_PROFILE_RATE = float(os.environ.get('MORPH_PERF_PROFILE_RATE', 0))
+PERF_PROFILE_SLOW_MS = float(os.environ.get('MORPH_PERF_PROFILE_SLOW_MS', 500))
+PERF_PROFILE_DIR = os.path.join(os.getcwd(), 'profiles')
+
+# Startup warm-up (warmup.py, run by gunicorn.conf.py before workers fork):
+# which metrics files to load -- 'none', 'default' (calculated_metrics) or
+# 'all' (plus every ready dataset) -- and the derived values built for each
+WARM_DATASETS = os.environ.get('MORPH_WARM', 'default')
+WARM_DERIVED = ('date_sorted', 'summary', 'rollups', 'correlation')
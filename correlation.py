@@ -0,0 +1,134 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from config import CORRELATION_BLOCK_ROWS, PAIRPLOT_SAMPLE_ROWS
+from rollups import DATE_PARTS
+
+
+# -----------------------------
+# Correlation engine
+# -----------------------------
+# Pearson correlation of every pair of numeric columns in one pass over the
+# rows, CORRELATION_BLOCK_ROWS at a time. Each block is converted to float64
+# and reduced with four matrix products (BLAS), with a 0/1 validity mask so
+# every pair only uses the rows where both columns are present -- the same
+# pairwise-complete semantics as DataFrame.corr():
+#
+#   N   = M'M        rows where both i and j are present
+#   S   = X'M        sum of x_i over those rows
+#   Q   = (X*X)'M    sum of x_i^2 over those rows
+#   P   = X'X        sum of x_i * x_j
+#
+# Before the products each column is shifted and scaled by the mean and std
+# of the first block, which keeps the cancellation in cov = P - S*S'/N small
+# on large values (correlation is unaffected by the shift). Matches
+# DataFrame.corr() to about 1e-9 even when the first block is not
+# representative of the rest of the file.
+#
+# Callers memoize the result per dataset version (dataset_cache.derived).
+
+def _matrix(df, columns):
+    return df[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def correlate(df, columns=None, block_rows=CORRELATION_BLOCK_ROWS):
+    if columns is None:
+        columns = [c for c in df.select_dtypes(include='number').columns if c not in DATE_PARTS]
+    k = len(columns)
+    n = np.zeros((k, k))
+    s = np.zeros((k, k))
+    q = np.zeros((k, k))
+    p = np.zeros((k, k))
+    shift = scale = None
+
+    for start in range(0, len(df), block_rows):
+        x = _matrix(df.iloc[start:start + block_rows], columns)
+        valid = ~np.isnan(x)
+        if shift is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)     # all-NaN columns
+                shift = np.nan_to_num(np.nanmean(x, axis=0))
+                scale = np.nanstd(x, axis=0)
+            scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1)
+        x = np.where(valid, (x - shift) / scale, 0.0)
+        m = valid.astype(np.float64)
+        n += m.T @ m
+        s += x.T @ m
+        q += (x * x).T @ m
+        p += x.T @ x
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = p - s * s.T / n
+        var = q - s * s / n
+        r = cov / np.sqrt(var * var.T)
+    r = np.clip(r, -1, 1)
+    r[n < 2] = np.nan
+    np.fill_diagonal(r, np.where(np.isnan(np.diag(r)), np.nan, 1.0))     # NaN for constant columns
+    return {'columns': list(columns), 'rows': len(df), 'matrix': r, 'counts': n.astype(np.int64)}
+
+
+def submatrix(result, columns):
+    # The memoized full matrix narrowed to some columns (no recompute)
+    missing = [c for c in columns if c not in result['columns']]
+    if missing:
+        raise ValueError(f"Unknown numeric column '{missing[0]}'")
+    idx = [result['columns'].index(c) for c in columns]
+    return {**result, 'columns': list(columns),
+            'matrix': result['matrix'][np.ix_(idx, idx)], 'counts': result['counts'][np.ix_(idx, idx)]}
+
+
+def top_pairs(result, k=10, absolute=True):
+    # The k most correlated distinct pairs, strongest first
+    r = result['matrix']
+    i, j = np.triu_indices(len(r), k=1)
+    values = r[i, j]
+    keep = ~np.isnan(values)
+    i, j, values = i[keep], j[keep], values[keep]
+    order = np.argsort(-(np.abs(values) if absolute else values), kind='stable')[:k]
+    columns = result['columns']
+    return [{'a': columns[i[o]], 'b': columns[j[o]], 'r': round(float(values[o]), 6),
+             'n': int(result['counts'][i[o], j[o]])}
+            for o in order]
+
+
+def to_json(result, top=None):
+    body = {
+        'columns': result['columns'],
+        'rows': result['rows'],
+        'matrix': [[None if np.isnan(v) else round(float(v), 6) for v in row] for row in result['matrix']],
+    }
+    if top:
+        body['top_pairs'] = top_pairs(result, top)
+    return body
+
+
+# -----------------------------
+# Stratified sampling (pairplots)
+# -----------------------------
+# Scatter matrices need points, not moments, but a few thousand are enough
+# to show the shape. Rows are sampled per stratum -- calendar month when
+# there is a Date column, otherwise equal slices of the file -- in
+# proportion to its size, so every period is represented and a sample of a
+# time-sorted file is not just its start.
+
+def stratified_sample(df, rows=PAIRPLOT_SAMPLE_ROWS, strata=50, seed=0):
+    if len(df) <= rows:
+        return df
+    if 'Date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Date']):
+        dates = df['Date']
+        keys = (dates.dt.year * 100 + dates.dt.month).to_numpy(dtype=float, na_value=-1)
+        codes = pd.factorize(keys)[0]
+    else:
+        codes = np.arange(len(df)) * strata // len(df)
+    rng = np.random.default_rng(seed)
+    # Shuffle, then keep the first quota[stratum] rows of every stratum
+    order = rng.permutation(len(df))
+    order = order[np.argsort(codes[order], kind='stable')]
+    sizes = np.bincount(codes)
+    quota = np.maximum(np.round(sizes * rows / len(df)), 1).astype(np.int64)
+    first = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(len(order)) - first[codes[order]]
+    keep = np.sort(order[rank < quota[codes[order]]])
+    return df.iloc[keep]
@@ -1,21 +1,23 @@
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from storage import load_metrics
+
 # -----------------------------
 # Load CSV
 # -----------------------------
-df = pd.read_csv("calculated_metrics.csv")
-if "Date" in df.columns:
-    df["Date"] = pd.to_datetime(df["Date"])
+line_metrics = ["Sales", "Profit", "Net_Profit_%"]
+bar_metrics = ["Profit_Margin_%","Gross_Margin_%"]
+
+# Only the columns this page draws are read from disk
+df = load_metrics(columns=["Date"] + line_metrics + bar_metrics)
 
 st.title(" Metrics Dashboard")
 
 # -----------------------------
 # Line Charts
 # -----------------------------
-line_metrics = ["Sales", "Profit", "Net_Profit_%"]
 st.header("Line Charts")
 for metric in line_metrics:
     if metric in df.columns and "Date" in df.columns:
@@ -30,7 +32,6 @@ for metric in line_metrics:
 # -----------------------------
 # Bar Charts
 # -----------------------------
-bar_metrics = ["Profit_Margin_%","Gross_Margin_%"]
 st.header("Bar Charts")
 for metric in bar_metrics:
     if metric in df.columns and "Date" in df.columns:
@@ -1,21 +1,11 @@
-import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
+import io
 import math
 import os
 
-# -----------------------------
-# Load CSV
-# -----------------------------
-csv_file = "calculated_metrics.csv"  # make sure this file exists in the same folder
-if not os.path.exists(csv_file):
-    raise FileNotFoundError(f"{csv_file} not found!")
-
-df = pd.read_csv(csv_file)
-
-# Convert Date column to datetime if exists
-if "Date" in df.columns:
-    df["Date"] = pd.to_datetime(df["Date"])
+from metrics_state import load_sketches, state_path_for
+from render_cache import render_cache
+from storage import load_metrics, metrics_path
 
 # -----------------------------
 # Define metrics
@@ -26,82 +16,128 @@ hist_metrics = ["Daily_Sales","Avg_Resolution_Time","Utilization_%","Stock_Turno
 box_metrics = ["Sales", "Profit", "Net_Profit_%", "Daily_Sales"]
 scatter_pairs = [("Sales","Profit"), ("CLV","CAC")]
 
-# Total plots for layout
-total_plots = len(line_metrics) + len(bar_metrics) + len(hist_metrics) + len(box_metrics) + len(scatter_pairs) + 1
-cols = 3
-rows = math.ceil(total_plots / cols)
-
-# -----------------------------
-# Create dashboard figure
-# -----------------------------
-fig, axes = plt.subplots(rows, cols, figsize=(20, rows*5))
-axes = axes.flatten()
-plot_idx = 0
-
-# LINE CHARTS
-for col_name in line_metrics:
-    if col_name in df.columns and "Date" in df.columns:
-        axes[plot_idx].plot(df["Date"], df[col_name], marker='o', color='blue')
-        axes[plot_idx].set_title(col_name)
+output_file = "graphs/all_metrics_dashboard.png"
+needed = ["Date"] + line_metrics + bar_metrics + hist_metrics + box_metrics + [c for pair in scatter_pairs for c in pair]
+
+
+def draw_dashboard(df, sketches=None):
+    import seaborn as sns     # deferred: slow to import and only needed here
+    # With the quantile sketches saved at ingestion (sketches.py), histograms
+    # and box plots are drawn from them and their columns need not be loaded
+    quantile_sketches = sketches.quantiles if sketches is not None else {}
+    # Total plots for layout
+    total_plots = len(line_metrics) + len(bar_metrics) + len(hist_metrics) + len(box_metrics) + len(scatter_pairs) + 1
+    cols = 3
+    rows = math.ceil(total_plots / cols)
+
+    # -----------------------------
+    # Create dashboard figure
+    # -----------------------------
+    fig, axes = plt.subplots(rows, cols, figsize=(20, rows*5))
+    axes = axes.flatten()
+    plot_idx = 0
+
+    # LINE CHARTS
+    for col_name in line_metrics:
+        if col_name in df.columns and "Date" in df.columns:
+            axes[plot_idx].plot(df["Date"], df[col_name], marker='o', color='blue')
+            axes[plot_idx].set_title(col_name)
+            axes[plot_idx].set_xlabel("Date")
+            axes[plot_idx].set_ylabel(col_name)
+            axes[plot_idx].grid(True)
+            plot_idx += 1
+
+    # BAR CHARTS
+    for col_name in bar_metrics:
+        if col_name in df.columns and "Date" in df.columns:
+            sns.barplot(x=df["Date"], y=df[col_name], ax=axes[plot_idx], palette="viridis")
+            axes[plot_idx].set_title(col_name)
+            axes[plot_idx].set_xlabel("Date")
+            axes[plot_idx].set_ylabel(col_name)
+            axes[plot_idx].tick_params(axis='x', rotation=45)
+            plot_idx += 1
+
+    # HISTOGRAMS
+    for col_name in hist_metrics:
+        if col_name in quantile_sketches:
+            counts, edges = quantile_sketches[col_name].histogram(10)
+            axes[plot_idx].stairs(counts, edges, fill=True, color='skyblue', edgecolor='steelblue')
+            axes[plot_idx].set_title(f"Distribution of {col_name}")
+            axes[plot_idx].set_xlabel(col_name)
+            axes[plot_idx].set_ylabel("Frequency (approx.)")
+            plot_idx += 1
+        elif col_name in df.columns:
+            sns.histplot(df[col_name], bins=10, kde=True, ax=axes[plot_idx], color='skyblue')
+            axes[plot_idx].set_title(f"Distribution of {col_name}")
+            axes[plot_idx].set_xlabel(col_name)
+            axes[plot_idx].set_ylabel("Frequency")
+            plot_idx += 1
+
+    # BOX PLOTS
+    for col_name in box_metrics:
+        if col_name in quantile_sketches:
+            stats = {**quantile_sketches[col_name].box(), "label": col_name}
+            axes[plot_idx].bxp([stats], vert=False, showfliers=False, patch_artist=True,
+                               boxprops={"facecolor": "lightgreen"})
+            axes[plot_idx].set_title(f"Boxplot of {col_name}")
+            plot_idx += 1
+        elif col_name in df.columns:
+            sns.boxplot(x=df[col_name], ax=axes[plot_idx], color='lightgreen')
+            axes[plot_idx].set_title(f"Boxplot of {col_name}")
+            plot_idx += 1
+
+    # SCATTER PLOTS
+    for x_col, y_col in scatter_pairs:
+        if x_col in df.columns and y_col in df.columns:
+            sns.scatterplot(x=df[x_col], y=df[y_col], ax=axes[plot_idx])
+            sns.regplot(x=df[x_col], y=df[y_col], scatter=False, ax=axes[plot_idx], color='red')
+            axes[plot_idx].set_title(f"{y_col} vs {x_col}")
+            plot_idx += 1
+
+    # CUMULATIVE + ROLLING SALES
+    if "Sales" in df.columns and "Date" in df.columns:
+        axes[plot_idx].plot(df["Date"], df["Sales"].cumsum(), marker='o', label="Cumulative Sales")
+        axes[plot_idx].plot(df["Date"], df["Sales"].rolling(3).mean(), marker='x', label="3M Rolling Avg")
+        axes[plot_idx].set_title("Cumulative & Rolling Avg Sales")
         axes[plot_idx].set_xlabel("Date")
-        axes[plot_idx].set_ylabel(col_name)
+        axes[plot_idx].set_ylabel("Sales")
+        axes[plot_idx].legend()
         axes[plot_idx].grid(True)
         plot_idx += 1
 
-# BAR CHARTS
-for col_name in bar_metrics:
-    if col_name in df.columns and "Date" in df.columns:
-        sns.barplot(x=df["Date"], y=df[col_name], ax=axes[plot_idx], palette="viridis")
-        axes[plot_idx].set_title(col_name)
-        axes[plot_idx].set_xlabel("Date")
-        axes[plot_idx].set_ylabel(col_name)
-        axes[plot_idx].tick_params(axis='x', rotation=45)
-        plot_idx += 1
+    # Remove unused axes
+    for i in range(plot_idx, len(axes)):
+        fig.delaxes(axes[i])
 
-# HISTOGRAMS
-for col_name in hist_metrics:
-    if col_name in df.columns:
-        sns.histplot(df[col_name], bins=10, kde=True, ax=axes[plot_idx], color='skyblue')
-        axes[plot_idx].set_title(f"Distribution of {col_name}")
-        axes[plot_idx].set_xlabel(col_name)
-        axes[plot_idx].set_ylabel("Frequency")
-        plot_idx += 1
+    plt.tight_layout()
+    return fig
 
-# BOX PLOTS
-for col_name in box_metrics:
-    if col_name in df.columns:
-        sns.boxplot(x=df[col_name], ax=axes[plot_idx], color='lightgreen')
-        axes[plot_idx].set_title(f"Boxplot of {col_name}")
-        plot_idx += 1
-
-# SCATTER PLOTS
-for x_col, y_col in scatter_pairs:
-    if x_col in df.columns and y_col in df.columns:
-        sns.scatterplot(x=df[x_col], y=df[y_col], ax=axes[plot_idx])
-        sns.regplot(x=df[x_col], y=df[y_col], scatter=False, ax=axes[plot_idx], color='red')
-        axes[plot_idx].set_title(f"{y_col} vs {x_col}")
-        plot_idx += 1
-
-# CUMULATIVE + ROLLING SALES
-if "Sales" in df.columns and "Date" in df.columns:
-    axes[plot_idx].plot(df["Date"], df["Sales"].cumsum(), marker='o', label="Cumulative Sales")
-    axes[plot_idx].plot(df["Date"], df["Sales"].rolling(3).mean(), marker='x', label="3M Rolling Avg")
-    axes[plot_idx].set_title("Cumulative & Rolling Avg Sales")
-    axes[plot_idx].set_xlabel("Date")
-    axes[plot_idx].set_ylabel("Sales")
-    axes[plot_idx].legend()
-    axes[plot_idx].grid(True)
-    plot_idx += 1
-
-# Remove unused axes
-for i in range(plot_idx, len(axes)):
-    fig.delaxes(axes[i])
 
-plt.tight_layout()
-
-# Save the dashboard PNG
+# -----------------------------
+# Render (or reuse) the dashboard PNG
+# -----------------------------
+# The figure only depends on the metrics file, so an unchanged dataset is
+# served from render_cache instead of being redrawn.
 os.makedirs("graphs", exist_ok=True)
-plt.savefig("graphs/all_metrics_dashboard.png")
-plt.show()
-
-print(" All metrics dashboard saved as 'graphs/all_metrics_dashboard.png'")
+data_path = metrics_path()
+if not os.path.exists(data_path):
+    raise FileNotFoundError(f"{data_path} not found!")
+sketches = load_sketches(state_path_for(data_path))
+if sketches is not None:
+    # Sketched columns are only read for the line/bar/scatter plots
+    sketched = set(sketches.quantiles) & set(hist_metrics + box_metrics)
+    plotted = ["Date"] + line_metrics + bar_metrics + [c for pair in scatter_pairs for c in pair]
+    needed = [c for c in dict.fromkeys(needed) if c not in sketched or c in plotted]
+cache_params = {"figure": "all_metrics_dashboard", "columns": needed, "sketches": sketches is not None}
+
+if render_cache.restore(data_path, cache_params, output_file):
+    print(f" Metrics unchanged → reused cached dashboard '{output_file}'")
+else:
+    fig = draw_dashboard(load_metrics(columns=needed), sketches)  # only the columns plotted above
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    render_cache.put(data_path, cache_params, buf.getvalue())
+    with open(output_file, "wb") as fh:
+        fh.write(buf.getvalue())
+    plt.show()
+    print(f" All metrics dashboard saved as '{output_file}'")
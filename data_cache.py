@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import OrderedDict
+
+from config import CACHE_MAX_BYTES
+from perf import perf
+
+
+# -----------------------------
+# Shared in-process dataset cache
+# -----------------------------
+# One parsed DataFrame per source file. An entry is reused as long as the
+# file's (mtime, size) and its explicit version number are unchanged; the
+# metrics job calls bump_version() after writing a new file so readers
+# never wait for the filesystem timestamp to tick over.
+#
+# Cached frames are shared between requests: callers must treat them as
+# read-only and take a copy before mutating.
+#
+# derived() memoizes anything computed from a cached frame (rollups,
+# summaries, ...) under the same signature, so it is rebuilt at most once
+# per dataset version. Without a loader, build() gets the path itself, for
+# values read from a small file rather than computed from a frame.
+
+class DatasetCache:
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # path -> (signature, df, nbytes)
+        self._versions = {}             # path -> explicit version counter
+        self._load_locks = {}           # path -> lock held while parsing
+        self._derived = {}              # (path, name) -> (signature, value)
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.derived_hits = 0
+        self.derived_builds = 0
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def signature(self, path):
+        key = self._key(path)
+        st = os.stat(key)
+        with self._lock:
+            version = self._versions.get(key, 0)
+        return (st.st_mtime_ns, st.st_size, version)
+
+    def get(self, path, loader):
+        key = self._key(path)
+        sig = self.signature(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == sig:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Parse outside the global lock, but only once per file: concurrent
+        # requests for the same file wait here and reuse the first result.
+        with load_lock:
+            sig = self.signature(key)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == sig:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                stale = entry is not None
+
+            df = loader(key)
+            nbytes = int(df.memory_usage(deep=True).sum())
+
+            with self._lock:
+                if stale:
+                    self.reloads += 1
+                else:
+                    self.misses += 1
+                self._entries[key] = (sig, df, nbytes)
+                self._entries.move_to_end(key)
+                self._evict()
+            return df
+
+    def derived(self, path, name, build, loader=None):
+        key = (self._key(path), name)
+        sig = self.signature(path)
+        with self._lock:
+            entry = self._derived.get(key)
+            if entry is not None and entry[0] == sig:
+                self.derived_hits += 1
+                return entry[1]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            sig = self.signature(path)
+            with self._lock:
+                entry = self._derived.get(key)
+                if entry is not None and entry[0] == sig:
+                    self.derived_hits += 1
+                    return entry[1]
+            source = self.get(path, loader) if loader else path
+            with perf.span(f'compute:{name}'):
+                value = build(source)
+            with self._lock:
+                self.derived_builds += 1
+                self._derived[key] = (sig, value)
+            return value
+
+    def bump_version(self, path):
+        key = self._key(path)
+        with self._lock:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            return self._versions[key]
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._derived.clear()
+            else:
+                key = self._key(path)
+                self._entries.pop(key, None)
+                for derived_key in [k for k in self._derived if k[0] == key]:
+                    del self._derived[derived_key]
+
+    def forget(self, path):
+        # For files that are gone for good (deleted datasets)
+        self.invalidate(path)
+        key = self._key(path)
+        with self._lock:
+            self._versions.pop(key, None)
+            for lock_key in [k for k in self._load_locks if k == key or (isinstance(k, tuple) and k[0] == key)]:
+                del self._load_locks[lock_key]
+
+    def _evict(self):
+        # Least recently used first; the newest entry always stays so a
+        # single oversized dataset can still be served.
+        total = sum(e[2] for e in self._entries.values())
+        # Values derived from an evicted frame go with it.
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, (_, _, nbytes) = self._entries.popitem(last=False)
+            for derived_key in [k for k in self._derived if k[0] == key]:
+                del self._derived[derived_key]
+            total -= nbytes
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.reloads
+            return {
+                'entries': len(self._entries),
+                'bytes': sum(e[2] for e in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'reloads': self.reloads,
+                'evictions': self.evictions,
+                'derived_hits': self.derived_hits,
+                'derived_builds': self.derived_builds,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+dataset_cache = DatasetCache()
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from config import DATASETS_DIR
+from data_cache import dataset_cache
+from jobs import job_runner
+from metrics_state import load_sketches, state_path_for
+from render_cache import render_cache
+from schema import forget_schema
+from storage import FORMATS, metrics_path, read_schema, resolve_format, temp_path
+
+
+# -----------------------------
+# Dataset registry
+# -----------------------------
+# Every upload becomes a dataset with its own directory:
+#
+#   <DATASETS_DIR>/<id>/source.csv         the uploaded file
+#   <DATASETS_DIR>/<id>/metrics.<format>   its calculated metrics
+#
+# The id is derived from the SHA-256 of the content, so uploading identical
+# bytes again (under any name) returns the existing dataset. New datasets
+# are processed by a background job; their record (id, name, hash, size,
+# status, rows, schema, job id) lives in <DATASETS_DIR>/registry.json.
+#
+# Parsed frames are not held here: readers go through dataset_cache with the
+# dataset's metrics path, which keeps the least recently used datasets
+# within CACHE_MAX_BYTES, so a server can host many more datasets than fit
+# in memory. Requests without a dataset_id keep using the default
+# calculated_metrics file.
+#
+# Several server processes may share DATASETS_DIR: registry.json is read
+# again whenever it changed on disk, and every change reloads it, edits it
+# and replaces it atomically while holding registry.lock (flock; on
+# platforms without fcntl only the in-process lock applies).
+
+PROCESSING, READY, FAILED = 'processing', 'ready', 'failed'
+
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class DatasetError(Exception):
+    status = 400
+
+
+class DatasetNotFound(DatasetError):
+    status = 404
+
+
+class DatasetNotReady(DatasetError):
+    status = 409
+
+
+def content_hash():
+    # Fed block by block while an upload is written to disk
+    return hashlib.sha256()
+
+
+class DatasetRegistry:
+    def __init__(self, directory=DATASETS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._records = {}              # id -> record, as last read from disk
+        self._signature = None          # (inode, mtime, size) of that read
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, 'registry.json')
+
+    @property
+    def lock_path(self):
+        return os.path.join(self.directory, 'registry.lock')
+
+    def folder(self, dataset_id):
+        return os.path.join(self.directory, dataset_id)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        # Every save replaces the file, so the inode changes even when the
+        # mtime does not
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _load(self):
+        # Caller holds self._lock
+        signature = self._stat(self.index_path)
+        if signature != self._signature:
+            try:
+                with open(self.index_path) as fh:
+                    self._records = json.load(fh)
+            except FileNotFoundError:
+                self._records = {}
+            self._signature = signature
+        return self._records
+
+    def _save(self):
+        tmp = temp_path(self.index_path)
+        with open(tmp, 'w') as fh:
+            json.dump(self._records, fh, indent=1)
+        os.replace(tmp, self.index_path)
+        self._signature = self._stat(self.index_path)
+
+    @contextmanager
+    def _editing(self):
+        # Read-modify-write of the registry, exclusive across threads and
+        # processes: yields the current records, saves them afterwards
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                records = self._load()
+                yield records
+                self._save()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update(self, dataset_id, **fields):
+        with self._editing() as records:
+            record = records.get(dataset_id)
+            if record is not None:
+                record.update(fields)
+
+    # -----------------------------
+    # Register / process
+    # -----------------------------
+    def add(self, tmp_path, name, digest):
+        # Takes ownership of an uploaded file already written to tmp_path.
+        # Returns (record, created); created is False for a duplicate upload.
+        dataset_id = digest[:16]
+        with self._editing() as records:
+            record = records.get(dataset_id)
+            if record is not None and record['status'] != FAILED:
+                os.remove(tmp_path)
+                return dict(record), False
+            os.makedirs(self.folder(dataset_id), exist_ok=True)
+            os.replace(tmp_path, os.path.join(self.folder(dataset_id), 'source.csv'))
+            record = {
+                'id': dataset_id,
+                'name': name,
+                'hash': digest,
+                'size': os.path.getsize(os.path.join(self.folder(dataset_id), 'source.csv')),
+                'created_at': time.time(),
+                'status': PROCESSING,
+                'rows': None,
+                'schema': None,
+                'output': None,
+                'error': None,
+                'job_id': None,
+            }
+            records[dataset_id] = record
+        return self.process(dataset_id), True
+
+    def process(self, dataset_id):
+        # (Re)computes the dataset's metrics in the job pool; returns its record
+        record = self.get(dataset_id)
+        job, _ = job_runner.submit('dataset-metrics', self._run, {'dataset_id': dataset_id},
+                                   key=('dataset-metrics', dataset_id), lock=('dataset', dataset_id))
+        self._update(dataset_id, job_id=job.id)
+        return {**record, 'job_id': job.id}
+
+    def _run(self, job, dataset_id):
+        from ingest import ingest_csv
+        folder = self.folder(dataset_id)
+        output = os.path.join(folder, 'metrics' + FORMATS[resolve_format()])
+        self._update(dataset_id, status=PROCESSING, error=None)
+        try:
+            report, _ = ingest_csv(os.path.join(folder, 'source.csv'), output, progress=job.report)
+        except Exception as e:
+            self._update(dataset_id, status=FAILED, error=f"{type(e).__name__}: {e}")
+            raise
+        dataset_cache.bump_version(report['output'])
+        self._update(dataset_id, status=READY, rows=report['rows'],
+                     schema=read_schema(report['output']), output=os.path.basename(report['output']))
+        return report
+
+    # -----------------------------
+    # Lookup
+    # -----------------------------
+    def get(self, dataset_id):
+        with self._lock:
+            record = self._load().get(dataset_id)
+        if record is None:
+            raise DatasetNotFound(f"Unknown dataset '{dataset_id}'")
+        return dict(record)
+
+    def list(self):
+        with self._lock:
+            records = [dict(r) for r in self._load().values()]
+        return sorted(records, key=lambda r: r['created_at'])
+
+    def find(self, name):
+        # The latest dataset uploaded under this (sanitized) file name
+        matches = [r for r in self.list() if r['name'] == name]
+        if not matches:
+            raise DatasetNotFound(f"No dataset uploaded as '{name}'")
+        return matches[-1]
+
+    def metrics_path(self, dataset_id):
+        record = self.get(dataset_id)
+        if record['status'] != READY and record['output'] is None:
+            if record['status'] == FAILED:
+                raise DatasetNotReady(f"Dataset '{dataset_id}' failed to process: {record['error']}")
+            raise DatasetNotReady(f"Dataset '{dataset_id}' is still processing (job {record['job_id']})")
+        # While a dataset is reprocessed its previous output keeps being served
+        return os.path.join(self.folder(dataset_id), record['output'])
+
+    def delete(self, dataset_id):
+        record = self.get(dataset_id)
+        with self._editing() as records:
+            records.pop(dataset_id, None)
+        if record['output']:
+            output = os.path.join(self.folder(dataset_id), record['output'])
+            dataset_cache.forget(output)
+            dataset_cache.forget(state_path_for(output))
+            render_cache.invalidate(output)
+            forget_schema(output)
+        forget_schema(os.path.join(self.folder(dataset_id), 'source.csv'))
+        shutil.rmtree(self.folder(dataset_id), ignore_errors=True)
+        return record
+
+
+dataset_registry = DatasetRegistry()
+
+
+def dataset_path(dataset_id=None):
+    # Metrics file an API request reads: the dataset's, or the default one
+    return dataset_registry.metrics_path(dataset_id) if dataset_id else metrics_path()
+
+
+def dataset_sketches(dataset_id=None):
+    # Distinct-count / quantile sketches saved with the dataset's metrics,
+    # read once per version of the state file
+    path = state_path_for(dataset_path(dataset_id))
+    sketches = dataset_cache.derived(path, 'sketches', load_sketches) if os.path.exists(path) else None
+    if sketches is None:
+        raise DatasetNotReady("No sketches for this dataset yet: recalculate its metrics")
+    return sketches
@@ -0,0 +1,82 @@
+import numpy as np
+
+
+# -----------------------------
+# Series downsampling for charts
+# -----------------------------
+# Both methods return sorted row indices into the input, always keeping the
+# first and last point, so callers can slice any aligned arrays with them.
+#
+# lttb    Largest-Triangle-Three-Buckets: one point per bucket, picked to
+#         preserve the visual shape of a line chart
+# minmax  the lowest and highest point of every bucket: keeps spikes,
+#         good for bar charts and noisy data (returns up to 2 points/bucket)
+
+def _bucket_edges(n, n_buckets):
+    # Interior points 1..n-2 split into n_buckets near-equal ranges
+    return np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+
+
+def lttb(x, y, n_out):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = _bucket_edges(n, n_out - 2)
+    starts, stops = edges[:-1], edges[1:]
+
+    # Average of every bucket in one vectorized pass (prefix sums, x shifted
+    # to start at 0 to keep epoch timestamps precise); the "next bucket" of
+    # the last bucket is the final point.
+    x = x - x[0]
+    counts = stops - starts
+    cx = np.concatenate(([0.0], np.cumsum(x)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    next_x = np.append(((cx[stops] - cx[starts]) / counts)[1:], x[-1])
+    next_y = np.append(((cy[stops] - cy[starts]) / counts)[1:], y[-1])
+
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(len(starts)):
+        lo, hi = starts[i], stops[i]
+        bx, by = x[lo:hi], y[lo:hi]
+        # Twice the triangle area (A = last pick, B = candidate, C = next avg)
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+def minmax(x, y, n_out):
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    n_buckets = max((n_out - 2) // 2, 1)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+
+    edges = _bucket_edges(n, n_buckets)
+    starts, counts = edges[:-1], np.diff(edges)
+    inner = y[1:n - 1]
+    bucket = np.repeat(np.arange(n_buckets), counts)
+
+    def first_match(values):
+        # First row of each bucket equal to that bucket's extreme value
+        hits = np.flatnonzero(inner == np.repeat(values, counts))
+        _, first = np.unique(bucket[hits], return_index=True)
+        return hits[first] + 1
+
+    lows = first_match(np.fmin.reduceat(inner, starts - 1))
+    highs = first_match(np.fmax.reduceat(inner, starts - 1))
+    return np.unique(np.concatenate(([0], lows, highs, [n - 1])))
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def downsample(x, y, n_out, method="lttb"):
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}' (expected one of {', '.join(METHODS)})")
+    return METHODS[method](x, y, n_out)
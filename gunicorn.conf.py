@@ -0,0 +1,44 @@
+import gc
+import os
+
+
+# -----------------------------
+# gunicorn settings
+# -----------------------------
+# The app is imported once in the master (preload_app) and the metrics files
+# are parsed and their derived values built there (warmup.py) before the
+# workers fork, so every worker starts with warm caches and shares those
+# pages copy-on-write instead of loading its own copy. matplotlib is not
+# imported until a worker renders its first PNG.
+#
+#   gunicorn -c gunicorn.conf.py app:app                                  (Flask)
+#   gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker main:app  (ASGI)
+#
+# MORPH_WARM=none|default|all chooses what is preloaded (config.py). Each
+# worker still has its own caches: a file that changes after startup is
+# reloaded by every worker that reads it.
+#
+# Workers share state through files: the dataset registry is re-read and
+# rewritten under a file lock (datasets.py) and every job's status is saved
+# under JOBS_DIR (jobs.py), so a dataset uploaded to one worker and its job
+# are visible from all of them. Jobs still run in the worker that accepted
+# them, and /api/perf reports the worker that answers.
+
+bind = os.environ.get('MORPH_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('MORPH_WORKERS', 2))
+# Concurrency within the worker for Flask (gthread); the ASGI worker ignores it
+threads = int(os.environ.get('MORPH_THREADS', 4))
+preload_app = True
+timeout = 120
+
+
+def when_ready(server):
+    from warmup import warm
+    for entry in warm():
+        if entry['error']:
+            server.log.warning('warm-up of %s failed: %s', entry['path'], entry['error'])
+        else:
+            server.log.info('warmed %s in %.3fs (%s)', entry['path'], entry['seconds'], ', '.join(entry['built']))
+    # Objects alive now are never touched by the collector again, so the
+    # workers' collections do not write to (and un-share) their pages
+    gc.freeze()
@@ -0,0 +1,188 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from config import INGEST_CHUNK_ROWS, METRICS_BASENAME, METRICS_FORMAT
+from data_cache import dataset_cache
+from jobs import job_runner
+from metrics_calculator import METRICS, drop_undated, print_report, run, source_info, state_path_for, total_inputs
+from metrics_state import MetricsState, save_state
+from perf import perf
+from render_cache import render_cache
+from storage import FrameWriter, metrics_path
+
+
+# -----------------------------
+# Chunked ingestion
+# -----------------------------
+# Streams a CSV of any size through the metrics pipeline in fixed-size row
+# chunks, so peak memory depends on the chunk size, not the file size:
+#
+#   pass 1  sum the columns whole-column metrics need (Contribution_% needs
+#           total Sales), reading only those columns
+#   pass 2  validate/coerce each chunk, compute its per-row metrics, fold it
+#           into MetricsState (sums, min/max, per-period totals,
+#           rolling-window tail, distinct-count and quantile sketches per
+#           dataset and per month) and stream it to the output file
+#
+# Numeric columns are stored as float64 so every chunk has the same schema
+# regardless of where missing values fall.
+
+# Raw columns the metrics engine reads as numbers
+NUMERIC_INPUTS = {col for inputs, _ in METRICS.values() for col in inputs if col not in METRICS}
+NUMERIC_INPUTS |= {"Sales", "Customers"}
+
+
+def iter_chunks(path, chunksize=INGEST_CHUNK_ROWS, usecols=None):
+    return pd.read_csv(path, chunksize=chunksize, usecols=usecols)
+
+
+class ChunkValidator:
+    # Column kinds are fixed by the first chunk; every later chunk is coerced
+    # to them. Values that cannot be coerced become missing and are counted.
+    # Only metric inputs and columns with numbers in the first chunk are
+    # numeric: a column that is empty there (pandas reads it as float) is
+    # text, and text keeps every value as a string, so nothing is lost.
+    def __init__(self):
+        self.kinds = None
+        self.invalid = {}
+        self.dropped_rows = 0
+
+    @staticmethod
+    def _kind(name, series):
+        if name == "Date":
+            return "date"
+        if name in NUMERIC_INPUTS or (pd.api.types.is_numeric_dtype(series) and series.notna().any()):
+            return "number"
+        return "text"
+
+    def coerce(self, chunk):
+        if self.kinds is None:
+            self.kinds = {col: self._kind(col, chunk[col]) for col in chunk.columns}
+        elif list(chunk.columns) != list(self.kinds):
+            raise ValueError("CSV chunks do not share the same columns")
+
+        for col, kind in self.kinds.items():
+            raw = chunk[col]
+            if kind == "date":
+                values = pd.to_datetime(raw, errors="coerce")
+            elif kind == "number":
+                values = pd.to_numeric(raw, errors="coerce").astype(float)
+            else:
+                # Nullable strings: same arrow type in every chunk, even
+                # when a chunk holds no value (or only numbers) for it
+                values = raw.astype("string")
+            bad = int(values.isna().sum() - raw.isna().sum())
+            if bad:
+                self.invalid[col] = self.invalid.get(col, 0) + bad
+            chunk[col] = values
+
+        # Same policy as metrics_calculator.main: no Date, no row
+        chunk, dropped = drop_undated(chunk)
+        self.dropped_rows += dropped
+        return chunk
+
+
+def column_totals(path, chunksize=INGEST_CHUNK_ROWS):
+    header = pd.read_csv(path, nrows=0).columns
+    needed = [col for col in total_inputs() if col in header]
+    totals = dict.fromkeys(needed, 0.0)
+    if not needed:
+        return totals
+    # Rows dropped for a missing Date do not count towards the totals
+    usecols = needed + (["Date"] if "Date" in header else [])
+    for chunk in iter_chunks(path, chunksize, usecols=usecols):
+        chunk, _ = drop_undated(chunk)
+        for col in needed:
+            totals[col] += pd.to_numeric(chunk[col], errors="coerce").sum()
+    return totals
+
+
+def ingest_csv(input_path, output_path=None, fmt=None, chunksize=INGEST_CHUNK_ROWS, progress=None):
+    # progress, if given, is called as progress(stage=..., rows=...,
+    # chunks=..., fraction=...) when pass 1 ("totals") starts and after every
+    # pass-2 ("metrics") chunk; fraction is the share of input bytes consumed
+    start = time.perf_counter()
+    output_path = output_path or metrics_path(fmt=fmt or METRICS_FORMAT)
+    end = os.path.getsize(input_path)
+
+    if progress is not None:
+        progress(stage="totals", rows=0, chunks=0, fraction=0.0)
+    with perf.span("totals"):
+        totals = column_totals(input_path, chunksize)
+    state = MetricsState()
+    validator = ChunkValidator()
+    chunks = 0
+    # The output is written to a temporary file and renamed into place at the
+    # end, so the API keeps serving the previous version until this finishes
+    with FrameWriter(output_path, fmt) as writer, open(input_path, "rb") as source:
+        # Written out so that parsing each chunk is timed as its own stage
+        chunk_iter = iter_chunks(source, chunksize)
+        while True:
+            with perf.span("parse"):
+                chunk = next(chunk_iter, None)
+            if chunk is None:
+                break
+            with perf.span("compute"):
+                chunk = validator.coerce(chunk)
+                run(chunk, state, totals=totals)
+            with perf.span("write"):
+                writer.write(chunk)
+            chunks += 1
+            if progress is not None:
+                fraction = round(min(source.tell() / end, 1.0), 4) if end else 1.0
+                progress(stage="metrics", rows=state.rows, chunks=chunks, fraction=fraction)
+        if writer.chunks == 0:
+            raise ValueError(f"'{input_path}' has no rows")
+        output_path = writer.path
+
+    with perf.span("save"):
+        save_state(state_path_for(output_path), state, source_info(input_path, end))
+    render_cache.invalidate(output_path)
+    return {
+        "output": output_path,
+        "rows": state.rows,
+        "chunks": chunks,
+        "invalid_values": validator.invalid,
+        "dropped_rows": validator.dropped_rows,
+        "seconds": round(time.perf_counter() - start, 3),
+    }, state
+
+
+# -----------------------------
+# Background job (used by both servers' /api/calculate-metrics)
+# -----------------------------
+def run_metrics_job(job, source):
+    report, _ = ingest_csv(source, progress=job.report)
+    dataset_cache.bump_version(report["output"])
+    return report
+
+
+def submit_metrics_job(source):
+    # Coalesced on the input's identity (path, mtime, size); every job that
+    # writes the metrics output holds the same lock
+    st = os.stat(source)
+    return job_runner.submit(
+        "calculate-metrics", run_metrics_job, {"source": source},
+        key=("calculate-metrics", os.path.abspath(source), st.st_mtime_ns, st.st_size),
+        lock=METRICS_BASENAME,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="Details.csv")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--format", default=None, choices=["feather", "parquet", "csv"])
+    parser.add_argument("--chunksize", type=int, default=INGEST_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    report, state = ingest_csv(args.input, args.output, fmt=args.format, chunksize=args.chunksize)
+    print_report(state)
+    if report["invalid_values"]:
+        print("\n⚠️ Values that could not be parsed (set to missing):", report["invalid_values"])
+    if report["dropped_rows"]:
+        print(f"⚠️ Dropped {report['dropped_rows']} rows without a valid Date.")
+    print(f"\n✅ {report['rows']} rows in {report['chunks']} chunks. Saved to '{report['output']}'")
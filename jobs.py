@@ -0,0 +1,227 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_HISTORY, JOB_WORKERS, JOBS_DIR
+from perf import perf
+
+
+# -----------------------------
+# In-process background jobs
+# -----------------------------
+# Long-running work (the metrics computation) is handed to a small thread
+# pool instead of running inside a request thread. submit() returns at once
+# with a Job; /api/jobs/<id> reports its status, progress and timing.
+#
+#   coalescing  a job submitted with the same key as a queued or running job
+#               is not started again, the caller gets the existing job
+#   locks       jobs that declare the same lock (e.g. the output file they
+#               write) run one at a time; the others wait as 'queued'
+#
+# Finished jobs are kept for the last JOB_HISTORY submissions only.
+#
+# Each job's to_dict() is also written to <JOBS_DIR>/<id>.json (replaced
+# atomically on every change of status or progress), so with several server
+# processes /api/jobs/<id> answers for a job that another process runs.
+# The queue itself, coalescing and locks stay per process: the same input
+# triggered through two processes is computed twice, and both runs replace
+# the output file atomically.
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+
+class Job:
+    def __init__(self, kind, key, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.params = params
+        self.status = QUEUED
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.coalesced = 0           # later submissions answered by this job
+        self.on_change = None        # called with the job after report()
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    def report(self, **progress):
+        # Called from the job function; replaces the dict so readers always
+        # see a consistent snapshot
+        self.progress = {**self.progress, **progress}
+        if self.on_change is not None:
+            self.on_change(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        # A job read back from its status file, as last saved by its process
+        job = cls.__new__(cls)
+        job.key = None
+        job.on_change = None
+        for name in ('id', 'kind', 'status', 'params', 'progress', 'result', 'error', 'coalesced',
+                     'submitted_at', 'started_at', 'finished_at'):
+            setattr(job, name, data[name])
+        return job
+
+    def to_dict(self):
+        now = time.time()
+        started, finished = self.started_at, self.finished_at
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'params': self.params,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'coalesced': self.coalesced,
+            'submitted_at': self.submitted_at,
+            'started_at': started,
+            'finished_at': finished,
+            'queued_seconds': round((started or now) - self.submitted_at, 3),
+            'run_seconds': None if started is None else round((finished or now) - started, 3),
+        }
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS, history=JOB_HISTORY, directory=JOBS_DIR):
+        self.history = history
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()      # id -> Job, oldest first
+        self._active = {}               # key -> Job while queued / running
+        self._locks = {}                # lock name -> threading.Lock
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+    def submit(self, kind, fn, params=None, key=None, lock=None):
+        # Runs fn(job, **params) in the pool. Returns (job, created): created
+        # is False when an identical job was already queued or running.
+        params = params or {}
+        key = key if key is not None else (kind, repr(sorted(params.items())))
+        with self._lock:
+            existing = self._active.get(key)
+            if existing is not None and existing.active:
+                existing.coalesced += 1
+                self._store(existing)
+                return existing, False
+            job = Job(kind, key, params)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            run_lock = self._locks.setdefault(lock, threading.Lock()) if lock is not None else None
+            self._trim()
+        job.on_change = self._store
+        self._store(job)
+        self._pool.submit(self._run, job, fn, run_lock)
+        return job, True
+
+    def _run(self, job, fn, run_lock):
+        if run_lock is not None:
+            run_lock.acquire()
+        trace = perf.start(f'job {job.kind}')
+        try:
+            job.started_at = time.time()
+            job.status = RUNNING
+            self._store(job)
+            job.result = fn(job, **job.params)
+            job.status = SUCCEEDED
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+            traceback.print_exc()
+        finally:
+            job.finished_at = time.time()
+            self._store(job)
+            perf.finish(trace, status=500 if job.status == FAILED else 200)
+            if run_lock is not None:
+                run_lock.release()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history size
+        excess = len(self._jobs) - self.history
+        for job_id in [j.id for j in self._jobs.values() if not j.active][:max(excess, 0)]:
+            del self._jobs[job_id]
+            self._remove(job_id)
+
+    # -----------------------------
+    # Status files
+    # -----------------------------
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _store(self, job):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(job.id)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as fh:
+                json.dump(job.to_dict(), fh, default=str)
+            os.replace(tmp, path)
+        except OSError:
+            # The job itself goes on; only other processes lose sight of it
+            traceback.print_exc()
+
+    def _remove(self, job_id):
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _read(self, job_id):
+        try:
+            with open(self._path(job_id)) as fh:
+                return Job.from_dict(json.load(fh))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, job_id):
+        # This process's job, else the status file another process wrote
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and all(c in '0123456789abcdef' for c in job_id):
+            job = self._read(job_id)
+        return job
+
+    def recent(self):
+        # The last `history` jobs of every process sharing JOBS_DIR, oldest first
+        with self._lock:
+            jobs = dict(self._jobs)
+        try:
+            names = [n for n in os.listdir(self.directory) if n.endswith('.json')]
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            job_id = name[:-len('.json')]
+            if job_id not in jobs:
+                job = self._read(job_id)
+                if job is not None:
+                    jobs[job_id] = job
+        return sorted(jobs.values(), key=lambda j: j.submitted_at)[-self.history:]
+
+    def wait(self, job_id, timeout=None):
+        # For scripts and tests: poll until the job has finished
+        deadline = None if timeout is None else time.time() + timeout
+        job = self.get(job_id)
+        while job is not None and job.active:
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(0.05)
+        return job
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+job_runner = JobRunner()
@@ -0,0 +1,472 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from config import ASGI_DATA_WORKERS, ASGI_RENDER_WORKERS, UPLOAD_BLOCK_BYTES, UPLOAD_FOLDER
+from charts import chart_body, chart_data, chart_params, int_param, png_params, render_chart_png
+from correlation import correlate, submatrix, to_json as correlation_json
+from data_cache import dataset_cache
+from datasets import DatasetError, content_hash, dataset_path, dataset_registry, dataset_sketches
+from jobs import job_runner
+from metrics_query import FORMATS as QUERY_FORMATS, date_sorted, parse_query, select, stream
+from perf import perf, to_prometheus
+from render_cache import fingerprint, render_cache
+from rollups import AGGS, RollupStore
+from sketches import distinct_params, distinct_report, distribution_params, distribution_report
+from summary import select as select_summary, summarize
+from time_intelligence import series as time_series, to_json as time_series_json
+from storage import load_frame, temp_path
+
+
+# ========== ASGI server ==========
+# The same routes as app.py on FastAPI, for uvicorn:
+#
+#   uvicorn main:app --host 0.0.0.0 --port 8000
+#
+# The event loop never runs pandas or matplotlib itself. Data work (loading,
+# filtering, downsampling, JSON encoding) goes to a bounded thread pool and
+# PNG rendering to a bounded process pool, so a slow request occupies one
+# pool slot instead of the whole server. Uploads are parsed as they arrive
+# and written straight to UPLOAD_FOLDER, never buffered in full.
+
+_data_pool = ThreadPoolExecutor(max_workers=ASGI_DATA_WORKERS, thread_name_prefix='data')
+_render_pool = None
+
+
+def _get_render_pool():
+    # Started on first use; 'spawn' because forking a process that already
+    # runs threads can deadlock the child
+    global _render_pool
+    if _render_pool is None:
+        _render_pool = ProcessPoolExecutor(max_workers=ASGI_RENDER_WORKERS,
+                                           mp_context=multiprocessing.get_context('spawn'))
+    return _render_pool
+
+
+async def offload(fn, *args, **kwargs):
+    # The request's context goes along so spans in the pool thread land in
+    # its trace (perf.py)
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        _data_pool, context.run, perf.call, partial(fn, *args, **kwargs))
+
+
+async def render(*args):
+    return await asyncio.get_running_loop().run_in_executor(_get_render_pool(), render_chart_png, *args)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    _data_pool.shutdown(wait=False, cancel_futures=True)
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title='morph-ai backend', lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+
+
+def error(message, status=400):
+    return JSONResponse({'status': 'error', 'message': message}, status_code=status)
+
+
+def respond(body):
+    # Encodes the body where it is called (the data pool) instead of on the
+    # event loop, as its own 'serialize' span
+    with perf.span('serialize'):
+        return JSONResponse(body)
+
+
+# ========== Instrumentation ==========
+# Every request is timed per route, with its load / compute / render /
+# serialize stages (perf.py); the numbers are served at /api/perf. The
+# middleware is only installed when instrumentation is enabled.
+async def perf_middleware(request, call_next):
+    trace = perf.start(profile_thread=False)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get('route')
+        perf.finish(trace, f'{request.method} {route.path}' if route else None, status)
+
+
+if perf.enabled:
+    app.add_middleware(BaseHTTPMiddleware, dispatch=perf_middleware)
+
+
+@app.exception_handler(DatasetError)
+async def dataset_error(request, e):
+    return error(str(e), e.status)
+
+
+# ========== Load Data Helper ==========
+# Every data endpoint takes dataset_id (query string, or the JSON body for
+# the chart endpoints); without one it serves the default metrics file.
+def load_data(path):
+    # Shared with every request, parsed once per file version -- do not mutate
+    return dataset_cache.get(path, load_frame)
+
+
+def load_rollups(path):
+    return dataset_cache.derived(path, 'rollups', RollupStore, load_frame)
+
+
+# ========== File Upload ==========
+_UNSAFE_FILENAME = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def safe_filename(filename):
+    # Same rules as werkzeug's secure_filename for the names we accept
+    filename = os.path.basename(filename.replace('\\', '/'))
+    filename = _UNSAFE_FILENAME.sub('', '_'.join(filename.split()))
+    return filename.strip('._')
+
+
+class UploadWriter:
+    # Incremental multipart/form-data parser that writes the part named
+    # 'file' to a temporary file in UPLOAD_FOLDER as the bytes come in; the
+    # file is renamed to its final name only once the body is complete.
+    def __init__(self, boundary):
+        self.filename = None
+        self.tmp_path = None
+        self.digest = content_hash()
+        self._fh = None
+        self._writing = False
+        self._headers = {}
+        self._field = self._value = b''
+        self._parser = MultipartParser(boundary, callbacks={
+            'on_part_begin': self._part_begin,
+            'on_header_field': self._header_field,
+            'on_header_value': self._header_value,
+            'on_header_end': self._header_end,
+            'on_headers_finished': self._headers_finished,
+            'on_part_data': self._part_data,
+            'on_part_end': self._part_end,
+        })
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b''
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b'content-disposition', b''))
+        self._writing = options.get(b'name') == b'file' and self._fh is None
+        if self._writing:
+            self.filename = options.get(b'filename', b'').decode('utf-8', 'replace')
+            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            self.tmp_path = temp_path(os.path.join(UPLOAD_FOLDER, 'upload'))
+            self._fh = open(self.tmp_path, 'wb')
+
+    def _part_data(self, data, start, end):
+        if self._writing:
+            self.digest.update(data[start:end])
+            self._fh.write(data[start:end])
+
+    def _part_end(self):
+        if self._writing:
+            self._fh.close()
+            self._writing = False
+
+    def write(self, data):
+        self._parser.write(data)
+
+    def finish(self, data):
+        # Registers the upload as a dataset -> (file name, record, created);
+        # raises ValueError for a body without a usable file part
+        self._parser.write(data)
+        self._parser.finalize()
+        if self.filename is None:
+            raise ValueError('No file uploaded')
+        filename = safe_filename(self.filename)
+        if not filename:
+            raise ValueError('Empty filename')
+        record, created = dataset_registry.add(self.tmp_path, filename, self.digest.hexdigest())
+        self.tmp_path = None
+        return filename, record, created
+
+    def discard(self):
+        if self._fh is not None:
+            self._fh.close()
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+@app.post('/upload')
+@app.post('/api/upload')
+async def upload_file(request: Request):
+    # Same response as the Flask endpoint: the dataset id of the upload
+    # (deduplicated by content hash) whose metrics are being computed
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in options:
+        return error('No file uploaded')
+
+    writer = UploadWriter(options[b'boundary'])
+    block = bytearray()
+    try:
+        # Disk writes happen in the data pool, one block at a time
+        async for chunk in request.stream():
+            block += chunk
+            if len(block) >= UPLOAD_BLOCK_BYTES:
+                await offload(writer.write, bytes(block))
+                block.clear()
+        filename, record, created = await offload(writer.finish, bytes(block))
+    except ValueError as e:
+        return error(str(e))
+    finally:
+        writer.discard()
+    return {'status': 'success', 'filename': filename, 'dataset_id': record['id'],
+            'deduplicated': not created, 'dataset': record}
+
+
+@app.get('/api/datasets')
+async def list_datasets():
+    return dataset_registry.list()
+
+
+@app.get('/api/datasets/{dataset_id}')
+async def get_dataset(dataset_id: str):
+    return dataset_registry.get(dataset_id)
+
+
+@app.delete('/api/datasets/{dataset_id}')
+async def delete_dataset(dataset_id: str):
+    record = await offload(dataset_registry.delete, dataset_id)
+    return {'status': 'success', 'deleted': record['id']}
+
+
+# ========== API: Full Metrics ==========
+@app.get('/api/metrics')
+async def get_metrics(request: Request, dataset_id: str = None):
+    # Same parameters as the Flask endpoint (see metrics_query.py). Every
+    # block of the body is encoded in the data pool.
+    def prepare():
+        path = dataset_path(dataset_id)
+        q = parse_query(request.query_params, fingerprint(path))
+        sorted_dates = dataset_cache.derived(path, 'date_sorted', date_sorted, load_frame)
+        return q, select(load_data(path), q, sorted_dates)
+    try:
+        q, page = await offload(prepare)
+    except ValueError as e:
+        return error(str(e))
+
+    # Timed as the request's serialize stage; its trace ends with the body
+    pieces = perf.stream(stream(page, q['format']))
+
+    async def body():
+        while (piece := await offload(next, pieces, None)) is not None:
+            yield piece
+
+    headers = {'X-Next-Cursor': page.next_cursor} if page.next_cursor else {}
+    return StreamingResponse(body(), media_type=QUERY_FORMATS[q['format']], headers=headers)
+
+
+# ========== API: Summary ==========
+@app.get('/api/summary')
+async def get_summary(columns: str = None, aggs: str = None, dataset_id: str = None):
+    def summary():
+        memo = dataset_cache.derived(dataset_path(dataset_id), 'summary', summarize, load_frame)
+        return respond(select_summary(memo, columns and [c for c in columns.split(',') if c],
+                                      aggs and [a for a in aggs.split(',') if a]))
+    try:
+        return await offload(summary)
+    except ValueError as e:
+        return error(str(e))
+
+
+# ========== API: Correlation ==========
+@app.get('/api/correlation')
+async def get_correlation(columns: str = None, top: str = None, dataset_id: str = None):
+    def correlation():
+        result = dataset_cache.derived(dataset_path(dataset_id), 'correlation', correlate, load_frame)
+        if columns:
+            result = submatrix(result, [c for c in columns.split(',') if c])
+        return respond(correlation_json(result, int_param({'top': top}, 'top', 0)))
+    try:
+        return await offload(correlation)
+    except ValueError as e:
+        return error(str(e))
+
+
+# ========== API: Sketches ==========
+@app.get('/api/distinct')
+async def get_distinct(request: Request, dataset_id: str = None):
+    def report():
+        p = distinct_params(request.query_params)
+        return respond(distinct_report(dataset_sketches(dataset_id), p['column'], p['start'], p['end']))
+    try:
+        return await offload(report)
+    except ValueError as e:
+        return error(str(e))
+
+
+@app.get('/api/distribution')
+async def get_distribution(request: Request, dataset_id: str = None):
+    def report():
+        return respond(distribution_report(dataset_sketches(dataset_id), **distribution_params(request.query_params)))
+    try:
+        return await offload(report)
+    except ValueError as e:
+        return error(str(e))
+
+
+# ========== API: Rollups ==========
+@app.get('/api/rollup')
+async def get_rollup(metric: str = 'Sales', grain: str = 'month', start: str = None, end: str = None,
+                     aggs: str = ','.join(AGGS), dataset_id: str = None):
+    def query():
+        result = load_rollups(dataset_path(dataset_id)).query(metric, grain, start or None, end or None, [a for a in aggs.split(',') if a])
+        body = {'metric': metric, 'grain': grain,
+                'buckets': result.pop('buckets').strftime('%Y-%m-%d').tolist()}
+        for agg, values in result.items():
+            body[agg] = [None if np.isnan(v) else v for v in values.astype(float).tolist()]
+        return respond(body)
+    try:
+        return await offload(query)
+    except ValueError as e:
+        return error(str(e))
+
+
+# ========== API: Time Intelligence ==========
+@app.get('/api/time-intelligence')
+async def get_time_intelligence(metrics: str = 'Sales', grain: str = 'month', window: int = 3,
+                                start: str = None, end: str = None, dataset_id: str = None):
+    def query():
+        result = time_series(load_rollups(dataset_path(dataset_id)), [m for m in metrics.split(',') if m] or ['Sales'],
+                             grain, window, start or None, end or None)
+        return respond({'grain': grain, 'window': window, **time_series_json(result)})
+    try:
+        return await offload(query)
+    except ValueError as e:
+        return error(str(e))
+
+
+# ========== API: Chart (data) ==========
+async def _chart_request(request):
+    # JSON body when there is one, otherwise the query string
+    if request.method == 'POST':
+        try:
+            body = await request.json()
+            if isinstance(body, dict):
+                return body
+        except ValueError:
+            pass
+    return dict(request.query_params)
+
+
+@app.post('/api/chart')
+async def generate_chart(request: Request):
+    # Same body as the Flask endpoint: metric or metrics, type, points, start,
+    # end, method and time_format
+    params = await _chart_request(request)
+
+    def series():
+        p = chart_params(params)
+        dates, series = chart_data(load_data(dataset_path(params.get('dataset_id'))), p)
+        return respond(chart_body(p, dates, series, params.get('time_format')))
+    try:
+        return await offload(series)
+    except ValueError as e:
+        return error(str(e))
+
+
+# ========== API: Chart (PNG, opt-in) ==========
+@app.api_route('/api/chart.png', methods=['GET', 'POST'])
+async def chart_png(request: Request):
+    try:
+        params = await _chart_request(request)
+        p = png_params(params)
+        path = dataset_path(params.get('dataset_id'))
+        key = await offload(render_cache.key, path, p)
+        if f'"{key}"' in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers={'ETag': f'"{key}"'})
+
+        key, png = await offload(render_cache.get, path, p)
+        if png is None:
+            dates, series = await offload(lambda: chart_data(load_data(path), p))
+            with perf.span('render'):
+                png = await render(dates, series[p['metric']], p['metric'], p['type'], p['width'], p['height'], p['style'])
+            key = await offload(render_cache.put, path, p, png)
+    except ValueError as e:
+        return error(str(e))
+    return Response(png, media_type='image/png',
+                    headers={'ETag': f'"{key}"', 'Cache-Control': 'no-cache'})
+
+
+# ========== API: Performance ==========
+@app.get('/api/perf')
+async def get_perf(format: str = 'json'):
+    # Latency percentiles per route and stage, cache hit ratios and the kept
+    # profiles; ?format=prometheus for the text exposition format
+    caches = {'datasets': dataset_cache.stats(), 'renders': render_cache.stats()}
+    if format == 'prometheus':
+        return PlainTextResponse(to_prometheus(perf.snapshot(), caches),
+                                 media_type='text/plain; version=0.0.4')
+    return {**perf.snapshot(), 'caches': caches}
+
+
+# ========== API: Trigger Metrics Calculation ==========
+@app.get('/api/calculate-metrics', status_code=202)
+async def calculate_metrics(file: str = None, dataset_id: str = None):
+    # ?dataset_id= recomputes an uploaded dataset, ?file=<name> the latest one
+    # uploaded under that name, otherwise the default metrics from Details.csv
+    from ingest import submit_metrics_job
+    if not dataset_id and file:
+        dataset_id = (await offload(dataset_registry.find, safe_filename(file)))['id']
+    if dataset_id:
+        record = await offload(dataset_registry.process, dataset_id)
+        status_url = f"/api/jobs/{record['job_id']}"
+        return JSONResponse({'status': 'accepted', 'job_id': record['job_id'], 'dataset_id': record['id'],
+                             'status_url': status_url}, status_code=202, headers={'Location': status_url})
+    source = 'Details.csv'
+    if not os.path.exists(source):
+        return error(f'{source} not found', 404)
+
+    job, created = submit_metrics_job(source)
+    status_url = f'/api/jobs/{job.id}'
+    return JSONResponse({'status': 'accepted', 'job_id': job.id, 'coalesced': not created,
+                         'status_url': status_url}, status_code=202, headers={'Location': status_url})
+
+
+# ========== API: Jobs ==========
+@app.get('/api/jobs')
+async def list_jobs():
+    return [job.to_dict() for job in reversed(job_runner.recent())]
+
+
+@app.get('/api/jobs/{job_id}')
+async def get_job(job_id: str):
+    job = job_runner.get(job_id)
+    if job is None:
+        return error(f'Unknown job {job_id}', 404)
+    return job.to_dict()
+
+
+# ========== Run App ==========
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run('main:app', port=8000)
@@ -1,117 +1,349 @@
+import argparse
+import io
+import os
+import zlib
+
 import pandas as pd
 import numpy as np
 
+from config import METRICS_FORMAT
+from metrics_state import MetricsState, load_state, save_state, state_path_for
+from perf import perf
+from render_cache import render_cache
+from schema import apply_schema, infer_schema, read_csv
+from storage import append_frame, format_of, load_frame, metrics_path, read_columns, save_frame
+
+
+# -----------------------------
+# Division helpers
+# -----------------------------
+# Every ratio metric divides through these, so a zero (or missing)
+# denominator always yields NaN -- never inf, never an exception.
+def safe_div(num, den):
+    num = np.asarray(num, dtype=float)
+    den = np.asarray(den, dtype=float)
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=(den != 0) & ~np.isnan(den))
+    return out
+
+def pct(num, den):
+    return safe_div(num, den) * 100
+
+
 # -----------------------------
-# Load Data from CSV
+# Metric registry
 # -----------------------------
-df = pd.read_csv("Details.csv")
+# name -> (input columns, formula). Inputs may be raw columns or other
+# metrics; formulas receive a dict of float arrays keyed by input name.
+# Registry order is the column order of the saved output.
+#
+# Metrics that depend on whole-column totals (per_row=False) change for
+# every existing row when rows are appended, so incremental runs recompute
+# them over the full column. They read totals via c.total(name), which
+# chunked runs pre-fill with the sum over the whole file.
+METRICS = {}
+COLUMN_METRICS = set()
+
+def register(name, inputs, formula, per_row=True):
+    METRICS[name] = (tuple(inputs), formula)
+    if not per_row:
+        COLUMN_METRICS.add(name)
+
+# RATIOS & PERCENTAGES
+register("Profit_Margin_%", ["Profit", "Sales"], lambda c: pct(c["Profit"], c["Sales"]))
+register("Gross_Margin_%", ["Sales", "Cost"], lambda c: pct(c["Sales"] - c["Cost"], c["Sales"]))
+register("Conversion_Rate_%", ["Conversions", "Customers"], lambda c: pct(c["Conversions"], c["Customers"]))
+register("Retention_Rate_%", ["Retained_Customers", "Customers"], lambda c: pct(c["Retained_Customers"], c["Customers"]))
+register("Churn_Rate_%", ["Retention_Rate_%"], lambda c: (1 - c["Retention_Rate_%"] / 100) * 100)
+register("Contribution_%", ["Sales"], lambda c: pct(c["Sales"], c.total("Sales")), per_row=False)
+
+# OPERATIONAL METRICS
+register("Avg_Resolution_Time", ["Resolution_Time_Hours", "Resolved_Tickets"],
+         lambda c: safe_div(c["Resolution_Time_Hours"], c["Resolved_Tickets"]))
+register("Utilization_%", ["Employee_Worked_Hours", "Employee_Available_Hours"],
+         lambda c: pct(c["Employee_Worked_Hours"], c["Employee_Available_Hours"]))
+register("Stock_Turnover", ["Stock_Sold", "Stock_Avg"], lambda c: safe_div(c["Stock_Sold"], c["Stock_Avg"]))
+register("On_Time_Delivery_%", ["On_Time_Delivery", "Total_Delivery"],
+         lambda c: pct(c["On_Time_Delivery"], c["Total_Delivery"]))
+
+# CUSTOMER & MARKETING METRICS
+register("CLV", ["Customer_Lifetime_Revenue"], lambda c: c["Customer_Lifetime_Revenue"])
+register("CAC", ["Customer_Acquisition_Cost"], lambda c: c["Customer_Acquisition_Cost"])
+register("ROI_%", ["Revenue", "Marketing_Spend"], lambda c: pct(c["Revenue"] - c["Marketing_Spend"], c["Marketing_Spend"]))
+register("Lead_Conversion_Rate_%", ["Converted_Leads", "Leads"], lambda c: pct(c["Converted_Leads"], c["Leads"]))
+
+# FINANCIAL METRICS
+register("Net_Profit_%", ["Net_Profit", "Revenue"], lambda c: pct(c["Net_Profit"], c["Revenue"]))
+register("Operating_Margin_%", ["Operating_Income", "Revenue"], lambda c: pct(c["Operating_Income"], c["Revenue"]))
+register("Working_Capital", ["Working_Capital_CurrentAssets", "Working_Capital_CurrentLiabilities"],
+         lambda c: c["Working_Capital_CurrentAssets"] - c["Working_Capital_CurrentLiabilities"])
+register("Debt_to_Equity", ["Total_Debt", "Total_Equity"], lambda c: safe_div(c["Total_Debt"], c["Total_Equity"]))
+
+
+class Columns(dict):
+    # Float arrays by column name, plus optional precomputed column totals
+    def __init__(self, totals=None):
+        super().__init__()
+        self.totals = totals or {}
+
+    def total(self, name):
+        return self.totals[name] if name in self.totals else np.nansum(self[name])
+
+
+def total_inputs():
+    # Raw columns whose whole-file totals the per_row=False metrics need
+    return sorted({col for name in COLUMN_METRICS for col in METRICS[name][0] if col not in METRICS})
+
+
+def resolve_order(columns, metrics=None):
+    # Dependency-ordered list of metrics to evaluate. With metrics=None every
+    # metric whose inputs are available is included; an explicitly requested
+    # metric that cannot be computed raises KeyError.
+    columns = set(columns)
+    order, state = [], {}
+
+    def visit(name, required):
+        if state.get(name) == "done":
+            return True
+        if state.get(name) == "visiting":
+            raise ValueError(f"Circular metric dependency at '{name}'")
+        state[name] = "visiting"
+        inputs, _ = METRICS[name]
+        ok = True
+        for col in inputs:
+            if col in METRICS and col not in columns:
+                ok = visit(col, required) and ok
+            elif col not in columns:
+                if required:
+                    raise KeyError(f"Metric '{name}' needs column '{col}'")
+                ok = False
+        state[name] = "done" if ok else "skipped"
+        if ok:
+            order.append(name)
+        return ok
+
+    for name in (METRICS if metrics is None else metrics):
+        if name not in METRICS:
+            raise KeyError(f"Unknown metric '{name}'")
+        visit(name, required=metrics is not None)
+    return order
+
+
+def compute_metrics(df, metrics=None, totals=None):
+    # Evaluate the requested metrics in one pass over float arrays and return
+    # them as a new frame on df's index; df itself is not modified.
+    order = resolve_order(df.columns, metrics)
+    arrays = Columns(totals)
+    for name in order:
+        inputs, formula = METRICS[name]
+        for col in inputs:
+            if col not in arrays:
+                arrays[col] = df[col].to_numpy(dtype=float, na_value=np.nan)
+        arrays[name] = formula(arrays)
+    wanted = order if metrics is None else list(dict.fromkeys(metrics))
+    return pd.DataFrame({name: arrays[name] for name in wanted}, index=df.index, copy=False)
+
 
 # -----------------------------
 # Safe Date Handling
 # -----------------------------
-if "Date" in df.columns:
+def drop_undated(df):
+    # Time intelligence needs a date on every row: rows whose Date is missing
+    # or unparseable are dropped -- by full, incremental and chunked runs
+    # alike, so they agree on row counts and totals. -> (df, dropped)
+    if "Date" not in df.columns:
+        return df, 0
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    missing = df["Date"].isna()
+    if not missing.any():
+        return df, 0
+    return df[~missing].reset_index(drop=True), int(missing.sum())
+
+def add_date_parts(df):
     df["Date"] = pd.to_datetime(df["Date"])
     df["Year"] = df["Date"].dt.year
     df["Month"] = df["Date"].dt.month
     df["Quarter"] = df["Date"].dt.quarter
-else:
-    print("⚠️ No 'Date' column found → Skipping time intelligence calculations.")
+
 
 # -----------------------------
-# BASIC CALCULATIONS
+# REPORT
 # -----------------------------
-if "Sales" in df.columns:
-    print("\n--- BASIC METRICS ---")
-    print("Sum of Sales:", df["Sales"].sum())
-    print("Average Sales:", df["Sales"].mean())
-    print("Min Sales:", df["Sales"].min(), " | Max Sales:", df["Sales"].max())
+# Basic metrics and time intelligence come from MetricsState, which keeps
+# running aggregates so appended rows can be folded in incrementally.
+def print_report(state):
+    basic = state.basic()
+    if "sales_sum" in basic:
+        print("\n--- BASIC METRICS ---")
+        print("Sum of Sales:", basic["sales_sum"])
+        print("Average Sales:", basic["sales_mean"])
+        print("Min Sales:", basic["sales_min"], " | Max Sales:", basic["sales_max"])
+    if "distinct_customers" in basic:
+        print("Distinct Customers:", basic["distinct_customers"])
+
+    ti = state.time_intelligence()
+    if ti is not None:
+        print("\n--- TIME INTELLIGENCE ---")
+        print("MTD:", ti["mtd"], "| QTD:", ti["qtd"], "| YTD:", ti["ytd"])
+        print("Previous Year Sales:", ti["previous_year_sales"])
+        print("YOY Growth %:", ti["yoy_growth"])
+        print("MOM Growth %:", ti["mom_growth"])
+        print("CAGR %:", ti["cagr"])
 
-if "Customers" in df.columns:
-    print("Distinct Customers:", df["Customers"].nunique())
 
 # -----------------------------
-# TIME INTELLIGENCE
+# Pipeline
 # -----------------------------
-if "Date" in df.columns and "Sales" in df.columns:
-    latest_month = df["Month"].max()
-    latest_quarter = df["Quarter"].max()
-    latest_year = df["Year"].max()
+def run(df, state=None, totals=None):
+    # Adds date parts, Rolling_Avg_3M and every available metric to df in
+    # place and folds the rows into `state` (a new one if not given),
+    # including its distinct-count and quantile sketches.
+    # `totals` overrides column sums when df is only part of the data.
+    state = state if state is not None else MetricsState()
+    if "Date" in df.columns:
+        add_date_parts(df)
+    elif state.rows == 0:
+        print("⚠️ No 'Date' column found → Skipping time intelligence calculations.")
 
-    mtd = df[df["Month"] == latest_month]["Sales"].sum()
-    qtd = df[df["Quarter"] == latest_quarter]["Sales"].sum()
-    ytd = df[df["Year"] == latest_year]["Sales"].sum()
-    previous_year_sales = df[df["Year"] == latest_year - 1]["Sales"].sum()
+    rolling = state.update(df)
+    if rolling is not None:
+        df["Rolling_Avg_3M"] = rolling
 
-    yoy_growth = ((ytd - previous_year_sales) / previous_year_sales * 100) if previous_year_sales else None
-    mom_growth = ((df.iloc[-1]["Sales"] - df.iloc[-2]["Sales"]) / df.iloc[-2]["Sales"] * 100) if len(df) > 1 else None
+    for name, values in compute_metrics(df, totals=totals).items():
+        df[name] = values
+    # Whole-column metrics change for old rows on append, so a sketch of
+    # them could not be updated incrementally
+    state.sketches.update(df, skip=COLUMN_METRICS)
+    return state
 
-    df["Rolling_Avg_3M"] = df["Sales"].rolling(3).mean()
-
-    start_value = df.iloc[0]["Sales"]
-    end_value = df.iloc[-1]["Sales"]
-    n_years = (df["Date"].iloc[-1] - df["Date"].iloc[0]).days / 365
-    cagr = ((end_value / start_value) ** (1/n_years) - 1) * 100 if n_years > 0 else None
-
-    print("\n--- TIME INTELLIGENCE ---")
-    print("MTD:", mtd, "| QTD:", qtd, "| YTD:", ytd)
-    print("Previous Year Sales:", previous_year_sales)
-    print("YOY Growth %:", yoy_growth)
-    print("MOM Growth %:", mom_growth)
-    print("CAGR %:", cagr)
 
 # -----------------------------
-# RATIOS & PERCENTAGES
+# Incremental mode
 # -----------------------------
-if all(col in df.columns for col in ["Profit","Sales"]):
-    df["Profit_Margin_%"] = df["Profit"] / df["Sales"] * 100
-if all(col in df.columns for col in ["Sales","Cost"]):
-    df["Gross_Margin_%"] = (df["Sales"] - df["Cost"]) / df["Sales"] * 100
-if all(col in df.columns for col in ["Conversions","Customers"]):
-    df["Conversion_Rate_%"] = df["Conversions"] / df["Customers"] * 100
-if all(col in df.columns for col in ["Retained_Customers","Customers"]):
-    df["Retention_Rate_%"] = df["Retained_Customers"] / df["Customers"] * 100
-    df["Churn_Rate_%"] = (1 - df["Retention_Rate_%"] / 100) * 100
-if "Sales" in df.columns:
-    df["Contribution_%"] = df["Sales"] / df["Sales"].sum() * 100
+# The state sidecar records how far into the source file we got (byte
+# offset), its header and a checksum of the bytes just before the offset.
+# If the file was only appended to, the next run parses just the new bytes.
+TAIL_CHECK_BYTES = 64
 
-# -----------------------------
-# OPERATIONAL METRICS
-# -----------------------------
-if all(col in df.columns for col in ["Resolution_Time_Hours","Resolved_Tickets"]):
-    df["Avg_Resolution_Time"] = df["Resolution_Time_Hours"] / df["Resolved_Tickets"]
-if all(col in df.columns for col in ["Employee_Worked_Hours","Employee_Available_Hours"]):
-    df["Utilization_%"] = df["Employee_Worked_Hours"] / df["Employee_Available_Hours"] * 100
-if all(col in df.columns for col in ["Stock_Sold","Stock_Avg"]):
-    df["Stock_Turnover"] = df["Stock_Sold"] / df["Stock_Avg"]
-if all(col in df.columns for col in ["On_Time_Delivery","Total_Delivery"]):
-    df["On_Time_Delivery_%"] = df["On_Time_Delivery"] / df["Total_Delivery"] * 100
+def source_info(input_path, offset):
+    with open(input_path, "rb") as fh:
+        header = fh.readline().decode("utf-8-sig").rstrip("\r\n")
+        fh.seek(max(offset - TAIL_CHECK_BYTES, 0))
+        tail = fh.read(min(offset, TAIL_CHECK_BYTES))
+    return {
+        "path": os.path.abspath(input_path),
+        "offset": offset,
+        "header": header,
+        "tail_crc": zlib.crc32(tail),
+    }
 
-# -----------------------------
-# CUSTOMER & MARKETING METRICS
-# -----------------------------
-if "Customer_Lifetime_Revenue" in df.columns:
-    df["CLV"] = df["Customer_Lifetime_Revenue"]
-if "Customer_Acquisition_Cost" in df.columns:
-    df["CAC"] = df["Customer_Acquisition_Cost"]
-if all(col in df.columns for col in ["Revenue","Marketing_Spend"]):
-    df["ROI_%"] = (df["Revenue"] - df["Marketing_Spend"]) / df["Marketing_Spend"] * 100
-if all(col in df.columns for col in ["Converted_Leads","Leads"]):
-    df["Lead_Conversion_Rate_%"] = df["Converted_Leads"] / df["Leads"] * 100
+def _is_appended(input_path, source):
+    if source is None or source["path"] != os.path.abspath(input_path):
+        return False
+    if os.path.getsize(input_path) < source["offset"]:
+        return False
+    current = source_info(input_path, source["offset"])
+    return current["header"] == source["header"] and current["tail_crc"] == source["tail_crc"]
 
-# -----------------------------
-# FINANCIAL METRICS
-# -----------------------------
-if all(col in df.columns for col in ["Net_Profit","Revenue"]):
-    df["Net_Profit_%"] = df["Net_Profit"] / df["Revenue"] * 100
-if all(col in df.columns for col in ["Operating_Income","Revenue"]):
-    df["Operating_Margin_%"] = df["Operating_Income"] / df["Revenue"] * 100
-if all(col in df.columns for col in ["Working_Capital_CurrentAssets","Working_Capital_CurrentLiabilities"]):
-    df["Working_Capital"] = df["Working_Capital_CurrentAssets"] - df["Working_Capital_CurrentLiabilities"]
-if all(col in df.columns for col in ["Total_Debt","Total_Equity"]):
-    df["Debt_to_Equity"] = df["Total_Debt"] / df["Total_Equity"]
+def _read_appended(input_path, source, end):
+    with open(input_path, "rb") as fh:
+        fh.seek(source["offset"])
+        data = fh.read(end - source["offset"])
+    names = pd.read_csv(io.StringIO(source["header"]), nrows=0).columns
+    # Parsed like a whole-file load (dates, compact dtypes); the widths are
+    # settled over old and new rows together when the output is rewritten
+    return read_csv(io.BytesIO(data), names=names)
 
-# -----------------------------
-# SAVE RESULTS
-# -----------------------------
-df.to_csv("calculated_metrics.csv", index=False)
-print("\n✅ Metrics calculated successfully. Saved to 'calculated_metrics.csv'")
+# Only the new rows are parsed and folded into the state, but the output
+# file is only appended to in place (O(new rows)) when it is csv and the
+# input has none of the per_row=False metrics' columns (no Sales -> no
+# Contribution_%). Otherwise -- including the default feather output --
+# the whole output is read, extended and written back (O(all rows)):
+# whole-column metrics change for old rows too, and feather/parquet files
+# cannot be appended to. The returned report says which happened:
+#
+#   {"rows": new rows, "dropped_rows": ..., "mode": "append" | "rewrite" | "none",
+#    "reason": why the output was rewritten, or None}
+def append_rows(input_path, output_path, state_path, source, state, fmt=None):
+    end = os.path.getsize(input_path)
+    new, dropped = drop_undated(_read_appended(input_path, source, end))
+    report = {"rows": len(new), "dropped_rows": dropped, "mode": "none", "reason": None}
+    if dropped:
+        print(f"⚠️ Dropped {dropped} new rows without a valid Date.")
+    if len(new) == 0:
+        print("No new rows since the last run.")
+        return output_path, state, report
+
+    inputs = list(new.columns)
+    run(new, state)
+    column_metrics = [name for name in METRICS if name in COLUMN_METRICS and name in new.columns]
+
+    if column_metrics or format_of(output_path) != "csv":
+        report["mode"] = "rewrite"
+        if column_metrics:
+            report["reason"] = f"whole-column metrics ({', '.join(column_metrics)}) change for every row"
+        else:
+            report["reason"] = f"{format_of(output_path)} files cannot be appended to"
+        existing = load_frame(output_path, round_trip=True, compact_dtypes=False)
+        combined = pd.concat([existing, new[existing.columns]], ignore_index=True)
+        # Input columns get the dtypes a full run would infer over all rows
+        # (concat widens int8 + int16, and mixed categories become object)
+        apply_schema(combined, infer_schema(combined[[c for c in inputs if c in combined.columns]]))
+        for name, values in compute_metrics(combined, column_metrics).items():
+            combined[name] = values
+        output_path = save_frame(combined, output_path, fmt=fmt)
+    else:
+        report["mode"] = "append"
+        append_frame(new[read_columns(output_path)], output_path)
+
+    save_state(state_path, state, source_info(input_path, end))
+    render_cache.invalidate(output_path)
+    if report["mode"] == "append":
+        print(f"Appended {len(new)} new rows.")
+    else:
+        print(f"Added {len(new)} new rows by rewriting the whole output: {report['reason']}.")
+    return output_path, state, report
+
+
+def main(input_path="Details.csv", output_path=None, fmt=None, incremental=False):
+    output_path = output_path or metrics_path(fmt=fmt or METRICS_FORMAT)
+    state_path = state_path_for(output_path)
+
+    if incremental:
+        source, state = load_state(state_path)
+        if state is not None and os.path.exists(output_path) and _is_appended(input_path, source):
+            output_path, state, _ = append_rows(input_path, output_path, state_path, source, state, fmt=fmt)
+            print_report(state)
+            print(f"\n✅ Metrics updated incrementally. Saved to '{output_path}'")
+            return output_path
+        print("⚠️ No usable incremental state → recomputing everything.")
+
+    end = os.path.getsize(input_path)
+    with perf.span("load"):
+        df, dropped = drop_undated(read_csv(input_path))
+    if dropped:
+        print(f"⚠️ Dropped {dropped} rows without a valid Date.")
+    with perf.span("compute"):
+        state = run(df)
+    print_report(state)
+
+    # -----------------------------
+    # SAVE RESULTS
+    # -----------------------------
+    with perf.span("save"):
+        output_path = save_frame(df, output_path, fmt=fmt)
+        save_state(state_path_for(output_path), state, source_info(input_path, end))
+    render_cache.invalidate(output_path)
+    print(f"\n✅ Metrics calculated successfully. Saved to '{output_path}'")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default="Details.csv")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--format", default=None, choices=["feather", "parquet", "csv"])
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process rows appended to the input since the last run")
+    args = parser.parse_args()
+    main(args.input, args.output, fmt=args.format, incremental=args.incremental)
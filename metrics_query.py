@@ -0,0 +1,168 @@
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+
+from config import METRICS_STREAM_BLOCK_ROWS
+
+
+# -----------------------------
+# /api/metrics: projection, filtering, pagination and streamed encoding
+# -----------------------------
+# Shared by app.py and main.py. Parameters (query string):
+#
+#   columns  comma-separated column names (default: all)
+#   start    first Date to include, end: last Date to include
+#   offset   rows to skip / limit: maximum rows to return (default: all)
+#   cursor   opaque token from a previous page's next_cursor
+#   format   records  JSON array of row objects (default)
+#            columnar {"columns": [...], "data": {column: [values]}, ...}
+#            ndjson   one JSON object per line
+#
+# Bodies are produced METRICS_STREAM_BLOCK_ROWS rows at a time by pandas'
+# JSON encoder, so neither memory nor time-to-first-byte grows with the
+# number of rows sent. The next page's cursor is returned in the
+# X-Next-Cursor header (and in the columnar body); cursors are tied to the
+# dataset version and rejected once the file has been rewritten.
+#
+# Values are encoded as main.py always sent them: dates as ISO 8601 strings
+# and floats with pandas' default precision (10 decimal places). For the
+# Flask server this changed the dates of format=records, which used to be
+# RFC 1123 strings ("Wed, 01 Jan 2020 00:00:00 GMT"), and NaN is now null.
+
+FORMATS = {
+    'records': 'application/json',
+    'columnar': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    value = int(value)
+    if value < 0:
+        raise ValueError(f"'{name}' must not be negative")
+    return value
+
+
+def encode_cursor(offset, version):
+    raw = json.dumps({'o': offset, 'v': version}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, version):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        offset, cursor_version = int(data['o']), data['v']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('Invalid cursor')
+    if cursor_version != version:
+        raise ValueError('Cursor expired: the dataset has changed since it was issued')
+    return offset
+
+
+def parse_query(params, version):
+    # `version` identifies the dataset file (see render_cache.fingerprint)
+    fmt = params.get('format') or 'records'
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    columns = params.get('columns')
+    cursor = params.get('cursor')
+    return {
+        'columns': [c for c in columns.split(',') if c] if columns else None,
+        'start': params.get('start') or None,
+        'end': params.get('end') or None,
+        'offset': decode_cursor(cursor, version) if cursor else (_int(params, 'offset') or 0),
+        'limit': _int(params, 'limit'),
+        'format': fmt,
+        'version': version,
+    }
+
+
+def date_sorted(df):
+    # Memoized per dataset version by the callers (dataset_cache.derived)
+    return 'Date' in df.columns and bool(df['Date'].is_monotonic_increasing)
+
+
+class Page:
+    # The rows of one response, taken from the shared frame a block at a time
+    # while the body is written; nothing is copied up front.
+    def __init__(self, df, columns, positions, next_cursor):
+        self.df = df
+        self.columns = columns
+        self._column_idx = df.columns.get_indexer(columns)
+        self.positions = positions      # range, or an array of row positions
+        self.next_cursor = next_cursor
+
+    def __len__(self):
+        return len(self.positions)
+
+    def blocks(self, block_rows, column=None):
+        cols = self._column_idx if column is None else self.df.columns.get_loc(column)
+        for start in range(0, len(self.positions), block_rows):
+            rows = self.positions[start:start + block_rows]
+            if isinstance(rows, range):
+                rows = slice(rows.start, rows.stop)
+            yield self.df.iloc[rows, cols]
+
+
+def select(df, q, is_sorted=False):
+    columns = q['columns'] or list(df.columns)
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Unknown column '{missing[0]}'")
+
+    positions = range(len(df))
+    if q['start'] or q['end']:
+        if 'Date' not in df.columns:
+            raise ValueError("start/end need a 'Date' column")
+        dates = df['Date']
+        if is_sorted:
+            lo = dates.searchsorted(pd.Timestamp(q['start']), side='left') if q['start'] else 0
+            hi = dates.searchsorted(pd.Timestamp(q['end']), side='right') if q['end'] else len(df)
+            positions = range(lo, hi)
+        else:
+            keep = np.ones(len(df), dtype=bool)
+            if q['start']:
+                keep &= (dates >= pd.Timestamp(q['start'])).to_numpy()
+            if q['end']:
+                keep &= (dates <= pd.Timestamp(q['end'])).to_numpy()
+            positions = np.flatnonzero(keep)
+
+    total = len(positions)
+    begin = min(q['offset'], total)
+    stop = total if q['limit'] is None else min(begin + q['limit'], total)
+    next_cursor = encode_cursor(stop, q['version']) if stop < total else None
+    return Page(df, columns, positions[begin:stop], next_cursor)
+
+
+def _json(data, orient, **kwargs):
+    # ISO dates, NaN as null, floats to 10 decimal places (pandas' default;
+    # more would show binary rounding noise such as 3334.849999999999909)
+    return data.to_json(orient=orient, date_format='iso', **kwargs)
+
+
+def stream(page, fmt, block_rows=METRICS_STREAM_BLOCK_ROWS):
+    # Generator of str pieces making up the response body
+    if fmt == 'ndjson':
+        for block in page.blocks(block_rows):
+            yield _json(block, 'records', lines=True)
+        return
+
+    if fmt == 'records':
+        yield '['
+        for i, block in enumerate(page.blocks(block_rows)):
+            yield ('' if i == 0 else ',') + _json(block, 'records')[1:-1]
+        yield ']'
+        return
+
+    yield '{"columns":' + json.dumps(page.columns) + ',"rows":' + str(len(page)) + ',"data":{'
+    for c, column in enumerate(page.columns):
+        yield ('' if c == 0 else ',') + json.dumps(column) + ':['
+        for i, block in enumerate(page.blocks(block_rows, column)):
+            yield ('' if i == 0 else ',') + _json(block, 'values')[1:-1]
+        yield ']'
+    yield '},"next_cursor":' + json.dumps(page.next_cursor) + '}'
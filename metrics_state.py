@@ -0,0 +1,232 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from sketches import SketchSet
+
+
+# -----------------------------
+# Running aggregates for the metrics pipeline
+# -----------------------------
+# Everything metrics_calculator reports besides the per-row ratio columns
+# (basic metrics, time intelligence, the 3-row rolling average) is derived
+# from this state. A full run feeds every row through update() once; an
+# incremental run loads the saved state and feeds only the appended rows,
+# so both paths share one code path and agree with each other.
+#
+# Distinct customers and per-column distributions are kept as mergeable
+# sketches (sketches.py): a fixed few KB per column however many rows or
+# customers there are, at the cost of documented approximation error.
+
+ROLLING_WINDOW = 3
+
+# Bumped whenever the saved layout changes; older state files are ignored
+# and the next run recomputes from scratch
+STATE_VERSION = 3
+
+
+def rolling_mean(values, window=ROLLING_WINDOW, history=()):
+    # Trailing mean over `window` rows, NaN until the window is full.
+    # `history` holds the rows that precede `values` in the full series.
+    x = np.concatenate([np.asarray(history, dtype=float), np.asarray(values, dtype=float)])
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = np.lib.stride_tricks.sliding_window_view(x, window).sum(axis=1) / window
+    return out[len(history):]
+
+
+def _add(totals, keys, values):
+    # totals[key] += sum(values for that key), NaNs skipped like Series.sum()
+    sums = values.groupby(keys.to_numpy()).sum()
+    for key, value in sums.items():
+        key = int(key)
+        totals[key] = totals.get(key, 0) + value
+
+
+def _plain(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class MetricsState:
+    def __init__(self):
+        self.rows = 0
+        self.has_sales = False
+        self.has_customers = False
+        # BASIC
+        self.sales_sum = 0
+        self.sales_count = 0
+        self.sales_min = None
+        self.sales_max = None
+        self.sketches = SketchSet()     # filled by metrics_calculator.run()
+        # TIME INTELLIGENCE
+        self.sales_by_month = {}
+        self.sales_by_quarter = {}
+        self.sales_by_year = {}
+        self.sales_tail = []          # last ROLLING_WINDOW - 1 Sales values
+        self.first_sales = None
+        self.first_date = None
+        self.last_date = None
+
+    # -----------------------------
+    # Feed rows
+    # -----------------------------
+    def update(self, chunk):
+        # chunk: rows in source order, with Date parsed and Year/Month/Quarter
+        # already added. Returns the Rolling_Avg_3M values for these rows, or
+        # None when the data has no Date/Sales.
+        if len(chunk) == 0:
+            return None
+        rolling = None
+
+        if "Sales" in chunk.columns:
+            self.has_sales = True
+            sales = chunk["Sales"]
+            self.sales_sum = self.sales_sum + sales.sum()
+            self.sales_count += int(sales.count())
+            lo, hi = sales.min(), sales.max()
+            if not np.isnan(lo):
+                self.sales_min = lo if self.sales_min is None else min(self.sales_min, lo)
+                self.sales_max = hi if self.sales_max is None else max(self.sales_max, hi)
+
+        if "Customers" in chunk.columns:
+            self.has_customers = True
+
+        if "Date" in chunk.columns and "Sales" in chunk.columns:
+            sales = chunk["Sales"]
+            # Months and quarters are keyed with their year (202403, 20241) so
+            # MTD/QTD only cover the latest month/quarter of the latest year
+            _add(self.sales_by_month, chunk["Year"] * 100 + chunk["Month"], sales)
+            _add(self.sales_by_quarter, chunk["Year"] * 10 + chunk["Quarter"], sales)
+            _add(self.sales_by_year, chunk["Year"], sales)
+
+            rolling = rolling_mean(sales, history=self.sales_tail)
+            history = self.sales_tail + [float(v) for v in sales.iloc[-(ROLLING_WINDOW - 1):]]
+            self.sales_tail = history[-(ROLLING_WINDOW - 1):]
+
+            if self.first_date is None:
+                self.first_sales = float(sales.iloc[0])
+                self.first_date = chunk["Date"].iloc[0]
+            self.last_date = chunk["Date"].iloc[-1]
+
+        self.rows += len(chunk)
+        return rolling
+
+    # -----------------------------
+    # Reports
+    # -----------------------------
+    def basic(self):
+        basic = {}
+        if self.has_sales:
+            basic["sales_sum"] = self.sales_sum
+            basic["sales_mean"] = self.sales_sum / self.sales_count if self.sales_count else np.nan
+            basic["sales_min"] = self.sales_min
+            basic["sales_max"] = self.sales_max
+        if self.has_customers and "Customers" in self.sketches.distinct:
+            # HyperLogLog estimate, see sketches.py for the error bound
+            basic["distinct_customers"] = int(round(self.sketches.distinct_sketch("Customers").estimate()))
+        return basic
+
+    def time_intelligence(self):
+        if self.first_date is None:
+            return None
+        latest_month = max(self.sales_by_month)
+        latest_quarter = max(self.sales_by_quarter)
+        latest_year = max(self.sales_by_year)
+
+        mtd = self.sales_by_month[latest_month]
+        qtd = self.sales_by_quarter[latest_quarter]
+        ytd = self.sales_by_year[latest_year]
+        previous_year_sales = self.sales_by_year.get(latest_year - 1, 0)
+
+        yoy_growth = ((ytd - previous_year_sales) / previous_year_sales * 100) if previous_year_sales else None
+        # Latest calendar month against the one before it (not the last two
+        # rows, which depends on row order); time_intelligence.py has the
+        # full series
+        year, month = divmod(latest_month, 100)
+        previous_month = latest_month - 1 if month > 1 else (year - 1) * 100 + 12
+        previous_month_sales = self.sales_by_month.get(previous_month, 0)
+        mom_growth = ((mtd - previous_month_sales) / previous_month_sales * 100) if previous_month_sales else None
+        last = np.float64(self.sales_tail[-1])
+
+        start_value = np.float64(self.first_sales)
+        end_value = last
+        n_years = (self.last_date - self.first_date).days / 365
+        cagr = ((end_value / start_value) ** (1/n_years) - 1) * 100 if n_years > 0 else None
+
+        return {
+            "mtd": mtd, "qtd": qtd, "ytd": ytd,
+            "previous_year_sales": previous_year_sales,
+            "yoy_growth": yoy_growth, "mom_growth": mom_growth, "cagr": cagr,
+        }
+
+    # -----------------------------
+    # Persistence (JSON sidecar next to the metrics output)
+    # -----------------------------
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "has_sales": self.has_sales,
+            "has_customers": self.has_customers,
+            "sales_sum": _plain(self.sales_sum),
+            "sales_count": self.sales_count,
+            "sales_min": _plain(self.sales_min),
+            "sales_max": _plain(self.sales_max),
+            "sketches": self.sketches.to_dict(),
+            "sales_by_month": {str(k): _plain(v) for k, v in self.sales_by_month.items()},
+            "sales_by_quarter": {str(k): _plain(v) for k, v in self.sales_by_quarter.items()},
+            "sales_by_year": {str(k): _plain(v) for k, v in self.sales_by_year.items()},
+            "sales_tail": self.sales_tail,
+            "first_sales": self.first_sales,
+            "first_date": None if self.first_date is None else self.first_date.isoformat(),
+            "last_date": None if self.last_date is None else self.last_date.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.rows = data["rows"]
+        state.has_sales = data["has_sales"]
+        state.has_customers = data["has_customers"]
+        state.sales_sum = data["sales_sum"]
+        state.sales_count = data["sales_count"]
+        state.sales_min = data["sales_min"]
+        state.sales_max = data["sales_max"]
+        state.sketches = SketchSet.from_dict(data["sketches"])
+        state.sales_by_month = {int(k): v for k, v in data["sales_by_month"].items()}
+        state.sales_by_quarter = {int(k): v for k, v in data["sales_by_quarter"].items()}
+        state.sales_by_year = {int(k): v for k, v in data["sales_by_year"].items()}
+        state.sales_tail = data["sales_tail"]
+        state.first_sales = data["first_sales"]
+        state.first_date = None if data["first_date"] is None else pd.Timestamp(data["first_date"])
+        state.last_date = None if data["last_date"] is None else pd.Timestamp(data["last_date"])
+        return state
+
+
+def state_path_for(output_path):
+    return os.path.splitext(output_path)[0] + ".state.json"
+
+
+def save_state(path, state, source):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as fh:
+        # dumps() runs the C encoder; dump() would encode in Python
+        fh.write(json.dumps({"version": STATE_VERSION, "source": source, "state": state.to_dict()}))
+    os.replace(tmp, path)
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None, None
+    with open(path) as fh:
+        data = json.load(fh)
+    if data.get("version") != STATE_VERSION:
+        return None, None
+    return data["source"], MetricsState.from_dict(data["state"])
+
+
+def load_sketches(path):
+    # The SketchSet saved in a state sidecar, or None
+    _, state = load_state(path)
+    return None if state is None else state.sketches
@@ -0,0 +1,292 @@
+import contextvars
+import cProfile
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from config import PERF_ENABLED, PERF_PROFILE_DIR, PERF_PROFILE_RATE, PERF_PROFILE_SLOW_MS, PERF_WINDOW
+
+
+# -----------------------------
+# Performance instrumentation
+# -----------------------------
+# Every request (and every background job) is a trace; code inside it marks
+# its stages with spans:
+#
+#   with perf.span('load'):        parse a dataset file (storage.load_frame)
+#   with perf.span('compute'):     build a derived value (data_cache.derived)
+#   with perf.span('render'):      draw a PNG
+#   with perf.span('serialize'):   encode the response body
+#
+# When the trace ends its total and every stage are added to rolling
+# histograms keyed by route ("GET /api/summary") and stage; snapshot() turns
+# them into p50/p95/p99 over the last PERF_WINDOW samples plus lifetime
+# count and sum. Spans nest: 'compute' includes the 'load' it triggers.
+# A streamed body is wrapped with stream(): producing its pieces is the
+# 'serialize' stage, and the trace is only recorded once the stream closes,
+# so the route's latency covers the whole body, not the first byte.
+# Spans outside any trace (CLI runs) are recorded under the route '-'.
+#
+# Profiling is opt-in: with PERF_PROFILE_RATE > 0 that share of traces runs
+# under cProfile, and the ones slower than PERF_PROFILE_SLOW_MS are written
+# to PERF_PROFILE_DIR as .prof files (python -m pstats <file>).
+#
+# Disabled (MORPH_PERF=0), span() returns a shared no-op context manager and
+# start() returns None, so instrumented code pays one attribute check.
+#
+# Everything lives in this process: with several server processes each one
+# reports its own numbers.
+
+QUANTILES = (0.5, 0.95, 0.99)
+CACHE_GAUGES = ('entries', 'bytes', 'max_bytes', 'hit_ratio')
+NO_ROUTE = '-'
+
+_NULL = nullcontext()
+_DONE = object()
+_current = contextvars.ContextVar('perf_trace', default=None)
+
+
+class Histogram:
+    def __init__(self, window=PERF_WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        out = {'count': self.count, 'sum': self.total}
+        for q in QUANTILES:
+            # nearest rank, as Prometheus summaries report
+            out[f'p{round(q * 100)}'] = ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else None
+        return out
+
+
+class Trace:
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.spans = []                 # (stage, seconds), in completion order
+        self.profiler = None
+        self.status = None
+        self.finished = False
+        self.streaming = False          # recorded by stream() rather than finish()
+
+
+class Perf:
+    def __init__(self, enabled=PERF_ENABLED, profile_rate=PERF_PROFILE_RATE,
+                 profile_slow_ms=PERF_PROFILE_SLOW_MS, profile_dir=PERF_PROFILE_DIR):
+        self.enabled = enabled
+        self.profile_rate = profile_rate
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._routes = {}               # route -> Histogram of whole requests
+        self._stages = {}               # (route, stage) -> Histogram
+        self._errors = {}               # route -> responses with status >= 500
+        self._profiles = deque(maxlen=20)
+        self.started_at = time.time()
+
+    def start(self, route=None, profile_thread=True):
+        # Opens a trace for the current context; profile_thread=False when
+        # the work runs in other threads (each call() is profiled instead)
+        if not self.enabled:
+            return None
+        trace = Trace(route)
+        if self.profile_rate and random.random() < self.profile_rate:
+            trace.profiler = cProfile.Profile()
+            if profile_thread:
+                trace.profiler.enable()
+        trace.token = _current.set(trace)
+        return trace
+
+    def finish(self, trace, route=None, status=None):
+        if trace is None:
+            return
+        _current.reset(trace.token)
+        trace.route = route or trace.route or NO_ROUTE
+        trace.status = status
+        trace.finished = True
+        if not trace.streaming:
+            self._record(trace)
+
+    def _record(self, trace):
+        seconds = time.perf_counter() - trace.started
+        if trace.profiler is not None:
+            trace.profiler.disable()
+            if seconds * 1000 >= self.profile_slow_ms:
+                self._save_profile(trace.profiler, trace.route, seconds)
+        with self._lock:
+            self._hist(self._routes, trace.route).add(seconds)
+            for stage, span_seconds in trace.spans:
+                self._hist(self._stages, (trace.route, stage)).add(span_seconds)
+            if trace.status is not None and trace.status >= 500:
+                self._errors[trace.route] = self._errors.get(trace.route, 0) + 1
+
+    @contextmanager
+    def trace(self, route):
+        # start()/finish() for work that is not a request, e.g. a job
+        trace = self.start(route)
+        try:
+            yield trace
+        finally:
+            self.finish(trace)
+
+    def call(self, fn, *args, **kwargs):
+        # Runs fn under the current trace's profiler, if it has one; for
+        # work handed to another thread (main.py's offload)
+        trace = _current.get()
+        if trace is None or trace.profiler is None:
+            return fn(*args, **kwargs)
+        trace.profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            trace.profiler.disable()
+
+    def stream(self, pieces):
+        # Wraps the iterator of a streamed response body (see above); call it
+        # inside the request, before the handler returns
+        trace = _current.get()
+        if trace is None:
+            return pieces
+        trace.streaming = True
+        return self._stream(trace, pieces)
+
+    def _stream(self, trace, pieces):
+        seconds = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                piece = next(pieces, _DONE)
+                seconds += time.perf_counter() - start
+                if piece is _DONE:
+                    return
+                yield piece
+        finally:
+            # Exhausted or closed early (client gone): either way the trace
+            # ends here, or in finish() if the handler has not returned yet
+            trace.spans.append(('serialize', seconds))
+            trace.streaming = False
+            if trace.finished:
+                self._record(trace)
+
+    def span(self, stage):
+        if not self.enabled:
+            return _NULL
+        return self._span(stage)
+
+    @contextmanager
+    def _span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            trace = _current.get()
+            if trace is not None:
+                trace.spans.append((stage, seconds))
+            else:
+                with self._lock:
+                    self._hist(self._stages, (NO_ROUTE, stage)).add(seconds)
+
+    @staticmethod
+    def _hist(table, key):
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram()
+        return hist
+
+    def _save_profile(self, profiler, route, seconds):
+        name = '_'.join(route.replace('/', ' ').split()) or 'trace'
+        path = os.path.join(self.profile_dir, f'{int(time.time() * 1000)}-{name}.prof')
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError:
+            return
+        with self._lock:
+            self._profiles.append({'route': route, 'seconds': round(seconds, 4), 'file': path,
+                                   'at': time.time()})
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: {**hist.summary(), 'errors': self._errors.get(route, 0), 'stages': {}}
+                      for route, hist in self._routes.items()}
+            for (route, stage), hist in self._stages.items():
+                routes.setdefault(route, {'stages': {}})['stages'][stage] = hist.summary()
+            return {
+                'enabled': self.enabled,
+                'uptime_seconds': round(time.time() - self.started_at, 3),
+                'window': PERF_WINDOW,
+                'routes': routes,
+                'profiles': list(self._profiles),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._stages.clear()
+            self._errors.clear()
+            self._profiles.clear()
+
+
+# -----------------------------
+# Prometheus text format
+# -----------------------------
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def _summary_lines(name, summary, **labels):
+    lines = []
+    for q in QUANTILES:
+        value = summary[f'p{round(q * 100)}']
+        if value is not None:
+            lines.append(f'{name}{{{_labels(**labels, quantile=q)}}} {value:.6f}')
+    lines.append(f'{name}_sum{{{_labels(**labels)}}} {summary["sum"]:.6f}')
+    lines.append(f'{name}_count{{{_labels(**labels)}}} {summary["count"]}')
+    return lines
+
+
+def to_prometheus(snapshot, caches=None):
+    # snapshot() (and {name: cache.stats()}) in the text exposition format
+    lines = ['# HELP morph_request_seconds Request latency by route.',
+             '# TYPE morph_request_seconds summary']
+    for route, data in snapshot['routes'].items():
+        if 'count' in data:
+            lines += _summary_lines('morph_request_seconds', data, route=route)
+    lines += ['# HELP morph_stage_seconds Time spent in a stage (load, compute, render, serialize, ...).',
+              '# TYPE morph_stage_seconds summary']
+    for route, data in snapshot['routes'].items():
+        for stage, summary in data['stages'].items():
+            lines += _summary_lines('morph_stage_seconds', summary, route=route, stage=stage)
+    lines += ['# HELP morph_request_errors_total Responses with a 5xx status.',
+              '# TYPE morph_request_errors_total counter']
+    for route, data in snapshot['routes'].items():
+        if data.get('errors'):
+            lines.append(f'morph_request_errors_total{{{_labels(route=route)}}} {data["errors"]}')
+
+    caches = caches or {}
+    for key in dict.fromkeys(key for stats in caches.values() for key in stats):
+        kind = 'gauge' if key in CACHE_GAUGES else 'counter'
+        metric = f'morph_cache_{key}' + ('_total' if kind == 'counter' else '')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, stats in caches.items():
+            if key in stats:
+                lines.append(f'{metric}{{{_labels(cache=name)}}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+perf = Perf()
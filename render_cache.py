@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from config import RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES
+
+
+# -----------------------------
+# Rendered-chart cache
+# -----------------------------
+# Entries are addressed by a hash of (dataset fingerprint, render params):
+# metric, chart type, size, style, viewport... Two tiers:
+#
+#   memory  LRU bounded by RENDER_CACHE_MAX_BYTES
+#   disk    <RENDER_CACHE_DIR>/<dataset tag>/<fingerprint>/<key>.png
+#
+# The fingerprint changes whenever the dataset file is rewritten, so stale
+# images are never served; the first write under a new fingerprint removes
+# the older fingerprints of that dataset from disk. The metrics job also
+# calls invalidate() after producing a new version. The entry key doubles
+# as the HTTP ETag.
+
+def _digest(text, size=16):
+    return hashlib.blake2b(text.encode(), digest_size=size).hexdigest()
+
+
+def dataset_tag(path):
+    return _digest(os.path.abspath(path), 6)
+
+
+def fingerprint(path):
+    st = os.stat(path)
+    return _digest(f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}", 8)
+
+
+def entry_key(fp, params):
+    return _digest(json.dumps([fp, params], sort_keys=True, default=str))
+
+
+class RenderCache:
+    def __init__(self, directory=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()    # key -> (dataset tag, png bytes)
+        self._bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, dataset_path, params):
+        return entry_key(fingerprint(dataset_path), params)
+
+    def _disk_path(self, dataset_path, fp, key):
+        return os.path.join(self.directory, dataset_tag(dataset_path), fp, key + ".png")
+
+    # -----------------------------
+    # Lookup / store
+    # -----------------------------
+    def get(self, dataset_path, params):
+        fp = fingerprint(dataset_path)
+        key = entry_key(fp, params)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return key, entry[1]
+
+        disk_path = self._disk_path(dataset_path, fp, key)
+        try:
+            with open(disk_path, "rb") as fh:
+                data = fh.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return key, None
+        with self._lock:
+            self.disk_hits += 1
+        self._remember(key, dataset_tag(dataset_path), data)
+        return key, data
+
+    def put(self, dataset_path, params, data):
+        fp = fingerprint(dataset_path)
+        key = entry_key(fp, params)
+        self._remember(key, dataset_tag(dataset_path), data)
+
+        disk_path = self._disk_path(dataset_path, fp, key)
+        fp_dir = os.path.dirname(disk_path)
+        if not os.path.isdir(fp_dir):
+            self._prune_disk(dataset_path, keep=fp)
+            os.makedirs(fp_dir, exist_ok=True)
+        tmp = f"{disk_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, disk_path)
+        return key
+
+    def get_or_render(self, dataset_path, params, render):
+        key, data = self.get(dataset_path, params)
+        if data is None:
+            data = render()
+            key = self.put(dataset_path, params, data)
+        return key, data
+
+    def restore(self, dataset_path, params, output_file):
+        # Write a cached image to output_file; False if it has to be rendered
+        _, data = self.get(dataset_path, params)
+        if data is None:
+            return False
+        with open(output_file, "wb") as fh:
+            fh.write(data)
+        return True
+
+    # -----------------------------
+    # Invalidation
+    # -----------------------------
+    def invalidate(self, dataset_path):
+        tag = dataset_tag(dataset_path)
+        with self._lock:
+            for key in [k for k, (t, _) in self._memory.items() if t == tag]:
+                self._bytes -= len(self._memory.pop(key)[1])
+        shutil.rmtree(os.path.join(self.directory, tag), ignore_errors=True)
+
+    def _prune_disk(self, dataset_path, keep):
+        root = os.path.join(self.directory, dataset_tag(dataset_path))
+        if not os.path.isdir(root):
+            return
+        for name in os.listdir(root):
+            if name != keep:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    def _remember(self, key, tag, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = (tag, data)
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes and len(self._memory) > 1:
+                _, (_, old) = self._memory.popitem(last=False)
+                self._bytes -= len(old)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._memory),
+                'bytes': self._bytes,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+            }
+
+
+render_cache = RenderCache()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+
+# -----------------------------
+# Time-bucket rollups
+# -----------------------------
+# Built once per dataset version (app.py memoizes the store through
+# dataset_cache.derived). The rows are scanned a single time to produce the
+# day table: sum / min / max / count of every numeric column per calendar
+# day. Week, month, quarter and year are rolled up from the day table, never
+# from the rows; mean is sum / count at query time, so it is exact at every
+# grain. A query slices one sorted bucket index with searchsorted, so its
+# cost depends on the number of buckets, not rows.
+#
+#   store = RollupStore(df)
+#   store.query("Sales", "month", start="2024-01-01", aggs=["sum", "mean"])
+
+GRAINS = {"day": "D", "week": "W", "month": "M", "quarter": "Q", "year": "Y"}
+AGGS = ("sum", "mean", "min", "max", "count")
+
+# Calendar parts added by metrics_calculator; rolling them up means nothing
+DATE_PARTS = {"Year", "Month", "Quarter"}
+
+
+class RollupStore:
+    def __init__(self, df):
+        if "Date" not in df.columns:
+            raise ValueError("Rollups need a 'Date' column")
+        self.metrics = [col for col in df.select_dtypes(include="number").columns
+                        if col not in DATE_PARTS]
+        self.tables = {}
+
+        dated = df[df["Date"].notna()]
+        grouped = dated[self.metrics].groupby(dated["Date"].dt.floor("D").to_numpy())
+        day = {"sum": grouped.sum(), "min": grouped.min(), "max": grouped.max(), "count": grouped.count()}
+        self.tables["day"] = day
+        for grain, freq in GRAINS.items():
+            if grain != "day":
+                self.tables[grain] = self._roll(day, freq)
+        self.rows = len(dated)
+
+    @staticmethod
+    def _roll(day, freq):
+        buckets = day["sum"].index.to_period(freq).start_time
+        return {
+            "sum": day["sum"].groupby(buckets).sum(),
+            "min": day["min"].groupby(buckets).min(),
+            "max": day["max"].groupby(buckets).max(),
+            "count": day["count"].groupby(buckets).sum(),
+        }
+
+    def query(self, metric, grain="month", start=None, end=None, aggs=AGGS):
+        # {'buckets': DatetimeIndex of bucket starts, agg: ndarray, ...} for
+        # the buckets that start inside [start, end]
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric '{metric}'")
+        if grain not in self.tables:
+            raise ValueError(f"Unknown grain '{grain}' (expected one of {', '.join(GRAINS)})")
+        unknown = [agg for agg in aggs if agg not in AGGS]
+        if unknown:
+            raise ValueError(f"Unknown aggregation '{unknown[0]}' (expected one of {', '.join(AGGS)})")
+
+        table = self.tables[grain]
+        index = table["sum"].index
+        lo = index.searchsorted(pd.Timestamp(start), side="left") if start else 0
+        hi = index.searchsorted(pd.Timestamp(end), side="right") if end else len(index)
+
+        sums = table["sum"][metric].to_numpy()[lo:hi]
+        counts = table["count"][metric].to_numpy()[lo:hi]
+        result = {"buckets": index[lo:hi]}
+        for agg in aggs:
+            if agg == "mean":
+                result[agg] = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+            elif agg == "sum":
+                # A bucket with no values has no sum, not a sum of 0
+                result[agg] = np.where(counts > 0, sums, np.nan)
+            else:
+                result[agg] = table[agg][metric].to_numpy()[lo:hi]
+        return result
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import CATEGORY_MAX_RATIO, CATEGORY_MAX_VALUES, CSV_ENGINE, SCHEMA_CACHE_DIR
+from storage import HAVE_PYARROW, temp_path
+
+
+# -----------------------------
+# Schema inference and compact dtypes
+# -----------------------------
+# Frames are loaded with the smallest dtypes that hold every value exactly:
+#
+#   dates        parsed while the CSV is read (Date, or any text column whose
+#                sampled values all parse as dates)
+#   integers     smallest signed width (int8/int16/int32); float columns
+#                that only hold whole numbers and no missing values too
+#   floats       kept as float64: float32 would round values and the sums
+#                built from them
+#   text         category when it has few distinct values (at most
+#                CATEGORY_MAX_VALUES, and CATEGORY_MAX_RATIO of the rows)
+#
+# Arithmetic on the narrow integer columns must go through float (as the
+# metrics engine, rollups and summaries do), since int16 * 100 wraps.
+#
+# The inferred schema is recorded under SCHEMA_CACHE_DIR, one file per
+# absolute path of the data file, tagged with that path and the file's size
+# and mtime, so later loads of the same file pass the dtypes straight to the
+# reader instead of inferring them again. Nothing is written next to the
+# inputs themselves.
+
+SCHEMA_VERSION = 1
+DATE_SAMPLE_ROWS = 1000
+
+
+def schema_path_for(path):
+    path = os.path.abspath(path)
+    digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(SCHEMA_CACHE_DIR, f"{os.path.basename(path)}.{digest}.schema.json")
+
+
+def _source(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _is_dates(series):
+    sample = series.dropna().head(DATE_SAMPLE_ROWS)
+    if len(sample) == 0 or not pd.api.types.is_string_dtype(sample):
+        return False
+    try:
+        pd.to_datetime(sample, format="mixed")
+    except (ValueError, TypeError, OverflowError):
+        return False
+    return True
+
+
+def _integer_dtype(lo, hi):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype).name
+    return None
+
+
+def infer_column(series):
+    # dtype name for one column of a fully loaded frame
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime64"
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return "category"
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_integer_dtype(series):
+        if len(series) == 0 or series.hasnans:
+            return series.dtype.name
+        return _integer_dtype(int(series.min()), int(series.max()))
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy()
+        if len(values) and not np.isnan(values).any() and np.all(np.isfinite(values)) \
+                and np.array_equal(values, np.round(values)) and abs(values).max() < 2 ** 53:
+            return _integer_dtype(int(values.min()), int(values.max())) or "float64"
+        return "float64"
+    if series.name == "Date" or _is_dates(series):
+        return "datetime64"
+    distinct = series.nunique()
+    if distinct <= CATEGORY_MAX_VALUES and distinct <= CATEGORY_MAX_RATIO * len(series):
+        return "category"
+    return series.dtype.name
+
+
+def infer_schema(df):
+    return {column: infer_column(df[column]) for column in df.columns}
+
+
+def apply_schema(df, schema):
+    # Casts df's columns in place to `schema` (columns it lacks are left as is)
+    for column, dtype in schema.items():
+        if column not in df.columns or df[column].dtype.name == dtype:
+            continue
+        if dtype == "datetime64":
+            if not pd.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = pd.to_datetime(df[column], format="mixed", errors="coerce")
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def save_schema(path, schema):
+    target = schema_path_for(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = temp_path(target)
+    with open(tmp, "w") as fh:
+        json.dump({"version": SCHEMA_VERSION, "source": _source(path), "columns": schema}, fh, indent=1)
+    os.replace(tmp, target)
+
+
+def load_schema(path):
+    # The recorded schema of `path`, or None if there is none or the file
+    # has changed since it was recorded
+    try:
+        with open(schema_path_for(path)) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if data.get("version") != SCHEMA_VERSION or data.get("source") != _source(path):
+        return None
+    return data["columns"]
+
+
+def forget_schema(path):
+    # For data files that are deleted
+    try:
+        os.remove(schema_path_for(path))
+    except FileNotFoundError:
+        pass
+
+
+def compact(df, path=None, record=True):
+    # Applies the recorded schema of `path`, or infers one from df and (if
+    # `record` and df holds the whole file) records it for the next load
+    schema = load_schema(path) if path else None
+    if schema is None:
+        schema = infer_schema(df)
+        if path and record:
+            try:
+                save_schema(path, schema)
+            except OSError:
+                pass        # read-only location: infer again next time
+    return apply_schema(df, schema)
+
+
+# -----------------------------
+# CSV reader
+# -----------------------------
+def csv_engine(engine=None):
+    engine = engine or CSV_ENGINE
+    if engine == "pyarrow" and not HAVE_PYARROW:
+        return "c"
+    return engine
+
+
+def read_csv(path, usecols=None, engine=None, compact_dtypes=True, float_precision=None, names=None):
+    # With a recorded schema the dtypes and date columns go straight to
+    # pd.read_csv; otherwise the file is read with Date parsed, inferred,
+    # cast and the schema recorded. With `names` the input has no header
+    # line (e.g. rows appended to a file, as a buffer): it is parsed the
+    # same way but nothing is recorded.
+    engine = csv_engine(engine)
+    schema = load_schema(path) if compact_dtypes and names is None else None
+    kwargs = {"usecols": usecols, "engine": engine}
+    if names is not None:
+        kwargs.update(header=None, names=list(names))
+    if engine == "c" and float_precision:
+        kwargs["float_precision"] = float_precision
+
+    if schema is not None:
+        wanted = schema if usecols is None else {c: schema[c] for c in usecols if c in schema}
+        dates = [c for c, dtype in wanted.items() if dtype == "datetime64"]
+        dtypes = {c: dtype for c, dtype in wanted.items() if dtype != "datetime64"}
+        return pd.read_csv(path, dtype=dtypes, parse_dates=dates or None, **kwargs)
+
+    if usecols is not None:
+        header = usecols
+    else:
+        header = list(names) if names is not None else list(pd.read_csv(path, nrows=0).columns)
+    df = pd.read_csv(path, parse_dates=["Date"] if "Date" in header else None, **kwargs)
+    if not compact_dtypes:
+        return df
+    return compact(df, None if names is not None else path, record=usecols is None)
@@ -0,0 +1,411 @@
+import base64
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from config import HLL_PRECISION, KLL_K, SKETCH_BUCKET_COLUMNS, SKETCH_DISTINCT_COLUMNS, SUMMARY_QUANTILES
+from rollups import DATE_PARTS
+from summary import quantile_name
+
+
+# -----------------------------
+# Mergeable sketches
+# -----------------------------
+# Small fixed-size summaries that are filled row by row during ingestion and
+# can be merged, so a distinct count or a box plot over any date range is
+# answered from a few KB instead of the full column.
+#
+# HyperLogLog (distinct counts)
+#   2^HLL_PRECISION one-byte registers (4 KB at p=12). Relative standard
+#   error 1.04 / sqrt(2^p): 1.6% at p=12, so 95% of estimates fall within
+#   +-3.3%. Small cardinalities (below ~2.5 * 2^p) use linear counting and
+#   are close to exact.
+#
+# KLL (quantiles, histograms)
+#   A stack of compactors with capacity KLL_K at the top level, shrinking by
+#   2/3 per level below; about 3 * KLL_K values are kept. The rank error of
+#   any quantile is O(1/KLL_K): at K=200, about 1% of n in the worst case
+#   (e.g. the reported median lies between the true 49th and 51st
+#   percentiles). Datasets smaller than the capacity are stored exactly;
+#   min and max are always exact.
+#
+# Sketches are serialized as zlib-compressed base64 so they fit in the JSON
+# state sidecar.
+
+def _pack(array):
+    return base64.b64encode(zlib.compress(np.ascontiguousarray(array).tobytes())).decode()
+
+
+def _unpack(text, dtype):
+    return np.frombuffer(zlib.decompress(base64.b64decode(text)), dtype=dtype).copy()
+
+
+def _hash(values):
+    # 64-bit hash of every non-missing value; numbers are hashed as float64
+    # so 32 and 32.0 agree
+    values = pd.Series(values).dropna().to_numpy()
+    if values.dtype.kind in "iufb":
+        values = values.astype(np.float64)
+    elif values.dtype.kind != "O":
+        values = values.astype(object)
+    return pd.util.hash_array(values)
+
+
+def _bit_length(x):
+    # Exact bit length of uint64 values, 32 bits at a time through frexp
+    hi = (x >> np.uint64(32)).astype(np.float64)
+    lo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+class HyperLogLog:
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return float(1.04 / np.sqrt(len(self.registers)))
+
+    @staticmethod
+    def positions(hashes, p=HLL_PRECISION):
+        # (register index, rank) of each hash. Rank = leading zeros of the
+        # remaining 64-p bits + 1; the sentinel bit caps it at 64 - p + 1.
+        p = np.uint64(p)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        return index, (65 - _bit_length(rest)).astype(np.uint8)
+
+    def update(self, values):
+        hashes = _hash(values)
+        if len(hashes):
+            np.maximum.at(self.registers, *self.positions(hashes, self.p))
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)
+        return float(raw)
+
+    def copy(self):
+        return HyperLogLog(self.p).merge(self)
+
+    def to_dict(self):
+        return {"p": self.p, "registers": _pack(self.registers)}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["p"])
+        sketch.registers = _unpack(data["registers"], np.uint8)
+        return sketch
+
+
+class KLLSketch:
+    def __init__(self, k=KLL_K, seed=0):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]     # level h items weigh 2^h
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def _compress(self):
+        # Halve every over-full level into the one above: sort, keep every
+        # other item from a random offset (an odd one out stays behind).
+        # Adding a level shrinks the capacities below it, so repeat.
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) <= self._capacity(h):
+                h += 1
+                continue
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(level)
+            odd = len(level) % 2
+            promoted = level[odd + int(self._rng.integers(2))::2]
+            self.levels[h] = level[:odd]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h = 0
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, level in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def copy(self):
+        return KLLSketch(self.k).merge(self)
+
+    def _weighted(self):
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantiles(self, qs):
+        qs = np.asarray(qs, dtype=float)
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        items, weights = self._weighted()
+        cumulative = np.cumsum(weights)
+        idx = np.searchsorted(cumulative, qs * cumulative[-1], side="left").clip(0, len(items) - 1)
+        out = items[idx]
+        out[qs <= 0] = self.min
+        out[qs >= 1] = self.max
+        return out
+
+    def histogram(self, bins=20, value_range=None):
+        # (estimated counts, bin edges) over [min, max] unless given
+        if self.n == 0:
+            return np.zeros(bins), np.linspace(0, 1, bins + 1)
+        items, weights = self._weighted()
+        counts, edges = np.histogram(items, bins=bins, range=value_range or (self.min, self.max), weights=weights)
+        return counts * (self.n / weights.sum()), edges
+
+    def box(self):
+        # matplotlib Axes.bxp stats: quartiles, Tukey whiskers clipped to the data
+        q1, med, q3 = self.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        return {
+            "q1": q1, "med": med, "q3": q3,
+            "whislo": max(self.min, q1 - 1.5 * iqr),
+            "whishi": min(self.max, q3 + 1.5 * iqr),
+            "mean": None, "fliers": [],
+        }
+
+    @property
+    def rank_error(self):
+        # Worst-case normalized rank error, see the module comment
+        return 2.0 / self.k
+
+    def to_dict(self):
+        return {
+            "k": self.k, "n": self.n,
+            "min": None if self.n == 0 else self.min,
+            "max": None if self.n == 0 else self.max,
+            "levels": [_pack(level) for level in self.levels],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["k"])
+        sketch.n = data["n"]
+        sketch.min = np.inf if data["min"] is None else data["min"]
+        sketch.max = -np.inf if data["max"] is None else data["max"]
+        sketch.levels = [_unpack(level, np.float64) for level in data["levels"]]
+        return sketch
+
+
+# -----------------------------
+# Per-dataset / per-month sketch collection
+# -----------------------------
+# quantiles  one KLL per numeric column over the whole dataset, plus one per
+#            month for SKETCH_BUCKET_COLUMNS
+# distinct   one HyperLogLog per SKETCH_DISTINCT_COLUMNS column, for the
+#            whole dataset and per month
+# Range queries merge the monthly sketches of the months in the range.
+
+def month_key(timestamp):
+    return pd.Timestamp(timestamp).strftime("%Y-%m")
+
+
+class SketchSet:
+    def __init__(self):
+        self.quantiles = {}             # column -> KLLSketch
+        self.distinct = {}              # column -> HyperLogLog
+        self.months = {}                # "YYYY-MM" -> {"quantiles": {...}, "distinct": {...}}
+
+    def _month(self, key):
+        key = int(key)
+        return self.months.setdefault(f"{key // 100:04d}-{key % 100:02d}", {"quantiles": {}, "distinct": {}})
+
+    def update(self, df, skip=()):
+        numeric = [c for c in df.select_dtypes(include="number").columns
+                   if c not in DATE_PARTS and c not in skip]
+        values = {c: df[c].to_numpy(dtype=float, na_value=np.nan) for c in numeric}
+        for column in numeric:
+            self.quantiles.setdefault(column, KLLSketch()).update(values[column])
+        distinct_cols = [c for c in SKETCH_DISTINCT_COLUMNS if c in df.columns]
+        for column in distinct_cols:
+            self.distinct.setdefault(column, HyperLogLog()).update(df[column])
+
+        bucket_cols = [c for c in SKETCH_BUCKET_COLUMNS if c in numeric]
+        if "Date" not in df.columns or not (bucket_cols or distinct_cols):
+            return
+        # Rows grouped by month once; each month's rows are contiguous in `order`
+        dates = df["Date"]
+        keys = (dates.dt.year * 100 + dates.dt.month).to_numpy(dtype=float, na_value=np.nan)
+        codes, months = pd.factorize(keys, use_na_sentinel=True)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(months) + 1))
+        for column in bucket_cols:
+            for i, key in enumerate(months):
+                rows = order[bounds[i]:bounds[i + 1]]
+                self._month(key)["quantiles"].setdefault(column, KLLSketch()).update(values[column][rows])
+        for column in distinct_cols:
+            # One (month x register) table per chunk instead of a hash pass per month
+            present = (df[column].notna() & dates.notna()).to_numpy()
+            index, rank = HyperLogLog.positions(_hash(df[column][present]))
+            table = np.zeros((len(months), 1 << HLL_PRECISION), dtype=np.uint8)
+            np.maximum.at(table, (codes[present], index), rank)
+            for i, key in enumerate(months):
+                sketch = self._month(key)["distinct"].setdefault(column, HyperLogLog())
+                np.maximum(sketch.registers, table[i], out=sketch.registers)
+
+    def _range(self, kind, column, start=None, end=None):
+        if start is None and end is None:
+            sketch = getattr(self, kind).get(column)
+            if sketch is None:
+                raise ValueError(f"No {kind} sketch for column '{column}'")
+            return sketch
+        lo = month_key(start) if start else "0000-00"
+        hi = month_key(end) if end else "9999-99"
+        merged = None
+        found = False
+        for key in sorted(self.months):
+            sketch = self.months[key][kind].get(column)
+            if sketch is not None:
+                found = True
+                if lo <= key <= hi:
+                    merged = sketch.copy() if merged is None else merged.merge(sketch)
+        if not found:
+            raise ValueError(f"No per-month {kind} sketch for column '{column}'")
+        if merged is None:
+            merged = KLLSketch() if kind == "quantiles" else HyperLogLog()
+        return merged
+
+    def quantile_sketch(self, column, start=None, end=None):
+        # Month granularity: start/end select whole calendar months
+        return self._range("quantiles", column, start, end)
+
+    def distinct_sketch(self, column, start=None, end=None):
+        return self._range("distinct", column, start, end)
+
+    def to_dict(self):
+        return {
+            "quantiles": {c: s.to_dict() for c, s in self.quantiles.items()},
+            "distinct": {c: s.to_dict() for c, s in self.distinct.items()},
+            "months": {
+                key: {
+                    "quantiles": {c: s.to_dict() for c, s in month["quantiles"].items()},
+                    "distinct": {c: s.to_dict() for c, s in month["distinct"].items()},
+                }
+                for key, month in self.months.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls()
+        sketches.quantiles = {c: KLLSketch.from_dict(s) for c, s in data["quantiles"].items()}
+        sketches.distinct = {c: HyperLogLog.from_dict(s) for c, s in data["distinct"].items()}
+        sketches.months = {
+            key: {
+                "quantiles": {c: KLLSketch.from_dict(s) for c, s in month["quantiles"].items()},
+                "distinct": {c: HyperLogLog.from_dict(s) for c, s in month["distinct"].items()},
+            }
+            for key, month in data["months"].items()
+        }
+        return sketches
+
+
+# -----------------------------
+# API responses (/api/distinct, /api/distribution)
+# -----------------------------
+# Both endpoints take column, start and end (month granularity, see
+# SketchSet); /api/distribution also takes q (comma-separated fractions)
+# and bins. Parameters come from any mapping, like charts.chart_params().
+
+def distinct_params(params):
+    return {
+        "column": params.get("column") or "Customers",
+        "start": params.get("start") or None,
+        "end": params.get("end") or None,
+    }
+
+
+def distribution_params(params):
+    q = params.get("q")
+    quantiles = [float(v) for v in q.split(",") if v] if q else list(SUMMARY_QUANTILES)
+    if any(not 0 <= v <= 1 for v in quantiles):
+        raise ValueError("Quantiles must lie between 0 and 1")
+    bins = int(params.get("bins", 20))
+    if bins < 1:
+        raise ValueError("'bins' must be positive")
+    return {
+        "column": params.get("column") or "Sales",
+        "quantiles": quantiles,
+        "bins": bins,
+        "start": params.get("start") or None,
+        "end": params.get("end") or None,
+    }
+
+
+def _plain(value):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else value
+
+
+def distinct_report(sketches, column, start=None, end=None):
+    sketch = sketches.distinct_sketch(column, start, end)
+    estimate = sketch.estimate()
+    error = sketch.relative_error
+    return {
+        "column": column,
+        "start": start,
+        "end": end,
+        "estimate": int(round(estimate)),
+        "relative_error": round(error, 4),
+        # ~95% of estimates fall within two standard errors
+        "interval_95": [int(estimate * (1 - 2 * error)), int(np.ceil(estimate * (1 + 2 * error)))],
+    }
+
+
+def distribution_report(sketches, column, quantiles=SUMMARY_QUANTILES, bins=20, start=None, end=None):
+    sketch = sketches.quantile_sketch(column, start, end)
+    counts, edges = sketch.histogram(bins)
+    box = sketch.box()
+    return {
+        "column": column,
+        "start": start,
+        "end": end,
+        "count": sketch.n,
+        "min": _plain(sketch.min),
+        "max": _plain(sketch.max),
+        "quantiles": {quantile_name(q): _plain(v) for q, v in zip(quantiles, sketch.quantiles(quantiles))},
+        "box": {name: _plain(box[name]) for name in ("whislo", "q1", "med", "q3", "whishi")},
+        "histogram": {"counts": [int(round(c)) for c in counts], "edges": [float(e) for e in edges]},
+        # Every quantile/box value is within this fraction of ranks of the truth
+        "rank_error": sketch.rank_error,
+    }
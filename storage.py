@@ -0,0 +1,216 @@
+import os
+import threading
+
+import pandas as pd
+
+from config import METRICS_BASENAME, METRICS_FORMAT
+from perf import perf
+
+try:
+    import pyarrow  # noqa: F401  (needed by the feather / parquet formats)
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+
+# -----------------------------
+# Storage formats for calculated metrics
+# -----------------------------
+# feather  Arrow IPC, written uncompressed so readers can memory-map it
+# parquet  compressed columnar, smaller on disk, good for exchange
+# csv      plain text export, kept for spreadsheets and older tooling
+FORMATS = {
+    'feather': '.feather',
+    'parquet': '.parquet',
+    'csv': '.csv',
+}
+
+
+def resolve_format(fmt=None):
+    fmt = (fmt or METRICS_FORMAT).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown storage format '{fmt}' (expected one of {', '.join(FORMATS)})")
+    if fmt != 'csv' and not HAVE_PYARROW:
+        print(f"⚠️ pyarrow is not installed → writing CSV instead of {fmt}.")
+        return 'csv'
+    return fmt
+
+
+def format_of(path):
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError(f"Cannot tell the storage format of '{path}'")
+
+
+def metrics_path(fmt=None, basename=METRICS_BASENAME):
+    # Where the metrics job writes (fmt given), or where readers should look:
+    # the configured format first, then whatever other format exists on disk.
+    if fmt is not None:
+        return basename + FORMATS[resolve_format(fmt)]
+    preferred = basename + FORMATS[resolve_format()]
+    if os.path.exists(preferred):
+        return preferred
+    for fmt_ext in FORMATS.values():
+        candidate = basename + fmt_ext
+        if os.path.exists(candidate):
+            return candidate
+    return preferred
+
+
+# -----------------------------
+# Write
+# -----------------------------
+# Whole-file writes go to a temporary file next to the target and are
+# renamed over it once complete, so readers see either the previous file or
+# the new one, never a partial write. (Readers that memory-mapped the old
+# feather file keep reading the old version until they reopen it.)
+def temp_path(path):
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def save_frame(df, path, fmt=None):
+    fmt = resolve_format(fmt or format_of(path))
+    path = os.path.splitext(path)[0] + FORMATS[fmt]
+    tmp = temp_path(path)
+    try:
+        if fmt == 'feather':
+            df.reset_index(drop=True).to_feather(tmp, compression='uncompressed')
+        elif fmt == 'parquet':
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_csv(tmp, index=False)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def append_frame(df, path):
+    # Only CSV can be appended to in place; columns must match the file's.
+    # Not atomic: a concurrent reader may see a partly written last line.
+    if format_of(path) != 'csv':
+        raise ValueError(f"Cannot append to '{path}': only CSV output supports appends")
+    df.to_csv(path, mode='a', header=False, index=False)
+    return path
+
+
+class FrameWriter:
+    # Streams DataFrame chunks into one output file so a large result never
+    # has to be held in memory. Every chunk must have the same columns; the
+    # first chunk fixes the schema and later chunks are cast to it. Chunks go
+    # to a temporary file that replaces `path` only when the `with` block
+    # exits cleanly; on error it is discarded and `path` is left untouched.
+    # Chunks without rows still count: they leave an empty file with the
+    # columns, as saving an empty frame would.
+    def __init__(self, path, fmt=None):
+        self.fmt = resolve_format(fmt or format_of(path))
+        self.path = os.path.splitext(path)[0] + FORMATS[self.fmt]
+        self.tmp_path = temp_path(self.path)
+        self.rows = 0
+        self.chunks = 0
+        self._schema = None
+        self._writer = None
+        self._sink = None
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.tmp_path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.fmt == 'feather':
+                    import pyarrow.ipc
+                    self._sink = pa.OSFile(self.tmp_path, 'wb')
+                    self._writer = pyarrow.ipc.new_file(self._sink, self._schema)
+                else:
+                    import pyarrow.parquet
+                    self._writer = pyarrow.parquet.ParquetWriter(self.tmp_path, self._schema)
+            self._writer.write_table(table)
+        self.rows += len(df)
+        self.chunks += 1
+
+    def close(self, commit=True):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        if not os.path.exists(self.tmp_path):
+            return
+        if commit and self.chunks:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+
+# -----------------------------
+# Read
+# -----------------------------
+def read_columns(path):
+    fmt = format_of(path)
+    if fmt == 'feather':
+        import pyarrow.ipc
+        with pyarrow.memory_map(path) as source:
+            return pyarrow.ipc.open_file(source).schema.names
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        return pyarrow.parquet.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def read_schema(path):
+    # {column: type name}, read from the file footer/header only (CSV types
+    # are inferred from the first rows)
+    fmt = format_of(path)
+    if fmt == 'feather':
+        import pyarrow.ipc
+        with pyarrow.memory_map(path) as source:
+            schema = pyarrow.ipc.open_file(source).schema
+        return {field.name: str(field.type) for field in schema}
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        return {field.name: str(field.type) for field in pyarrow.parquet.read_schema(path)}
+    return {name: str(dtype) for name, dtype in pd.read_csv(path, nrows=1000).dtypes.items()}
+
+
+def load_frame(path, columns=None, round_trip=False, compact_dtypes=True):
+    # `columns` is a projection: only those columns are read, and names that
+    # are not in the file are skipped so callers can ask for optional metrics.
+    # round_trip=True parses CSV floats exactly (slower); use it when the
+    # frame is going to be written back. compact_dtypes loads with the
+    # file's recorded (or inferred) compact schema -- see schema.py.
+    from schema import compact, read_csv
+    fmt = format_of(path)
+    if columns is not None:
+        available = set(read_columns(path))
+        columns = [c for c in dict.fromkeys(columns) if c in available]
+
+    with perf.span('load'):
+        if fmt == 'csv':
+            return read_csv(path, usecols=columns, compact_dtypes=compact_dtypes,
+                            float_precision='round_trip' if round_trip else None)
+        if fmt == 'feather':
+            import pyarrow.feather
+            df = pyarrow.feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+        else:
+            df = pd.read_parquet(path, columns=columns)
+        return compact(df, path, record=columns is None) if compact_dtypes else df
+
+
+def load_metrics(columns=None):
+    path = metrics_path()
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found! Run metrics_calculator.py first.")
+    return load_frame(path, columns=columns)
@@ -0,0 +1,150 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from config import SUMMARY_BLOCK_ROWS, SUMMARY_QUANTILES, SUMMARY_SAMPLE_ROWS
+
+
+# -----------------------------
+# Summary statistics engine
+# -----------------------------
+# One pass over the rows, SUMMARY_BLOCK_ROWS at a time, computes for every
+# numeric column at once: count, null count, sum, mean, min, max and std.
+# The per-block partial results (count, mean, sum of squared deviations) are
+# merged with Chan's parallel update, so std stays accurate without a
+# second pass and memory is bounded by the block size.
+#
+# Quantiles (p25/p50/p75 by default) are approximate: they are read from a
+# uniform random sample of SUMMARY_SAMPLE_ROWS rows (exact for smaller
+# datasets). With k sampled rows the rank error is about 1/sqrt(k), i.e.
+# about 0.3 percentiles at the default 100k.
+#
+# app.py memoizes the result per dataset version (dataset_cache.derived),
+# so /api/summary only pays for this once.
+
+AGGS = ('count', 'null_count', 'sum', 'mean', 'min', 'max', 'std')
+
+
+def quantile_name(q):
+    return f"p{q * 100:g}"
+
+
+def _moments(df, columns, block_rows):
+    k = len(columns)
+    count = np.zeros(k)
+    mean = np.zeros(k)
+    m2 = np.zeros(k)
+    total = np.zeros(k)
+    lo = np.full(k, np.inf)
+    hi = np.full(k, -np.inf)
+
+    col_idx = df.columns.get_indexer(columns)
+    for start in range(0, len(df), block_rows):
+        x = df.iloc[start:start + block_rows, col_idx].to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(x)
+        n_b = valid.sum(axis=0).astype(float)
+        sum_b = np.where(valid, x, 0.0).sum(axis=0)
+        mean_b = np.divide(sum_b, n_b, out=np.zeros(k), where=n_b > 0)
+        m2_b = np.where(valid, (x - mean_b) ** 2, 0.0).sum(axis=0)
+
+        n = count + n_b
+        delta = mean_b - mean
+        safe_n = np.where(n > 0, n, 1.0)
+        mean = mean + delta * n_b / safe_n
+        m2 = m2 + m2_b + delta ** 2 * count * n_b / safe_n
+        count = n
+        total += sum_b
+        lo = np.fmin(lo, np.where(valid, x, np.inf).min(axis=0))
+        hi = np.fmax(hi, np.where(valid, x, -np.inf).max(axis=0))
+
+    empty = count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(m2 / (count - 1))
+    return {
+        'count': count,
+        'sum': total,
+        'mean': np.where(empty, np.nan, mean),
+        'min': np.where(empty, np.nan, lo),
+        'max': np.where(empty, np.nan, hi),
+        'std': np.where(count > 1, std, np.nan),
+    }
+
+
+def _sample_quantiles(df, columns, quantiles, sample_rows, seed=0):
+    col_idx = df.columns.get_indexer(columns)
+    if len(df) > sample_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(len(df), sample_rows, replace=False))
+    else:
+        rows = slice(None)
+    x = df.iloc[rows, col_idx].to_numpy(dtype=float, na_value=np.nan)
+    if len(x) == 0:
+        return np.full((len(quantiles), len(columns)), np.nan)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)     # all-NaN columns
+        return np.nanquantile(x, quantiles, axis=0)
+
+
+def summarize(df, aggs=AGGS, quantiles=SUMMARY_QUANTILES, block_rows=SUMMARY_BLOCK_ROWS,
+              sample_rows=SUMMARY_SAMPLE_ROWS):
+    # aggs: any of AGGS; quantiles: fractions, reported as p25, p50, ...
+    numeric = list(df.select_dtypes(include='number').columns)
+    categorical = [c for c in df.columns if c not in numeric and c != 'Date'
+                   and not pd.api.types.is_datetime64_any_dtype(df[c])]
+
+    stats = {}
+    if numeric:
+        moments = _moments(df, numeric, block_rows)
+        moments['null_count'] = len(df) - moments['count']
+        if quantiles:
+            qs = _sample_quantiles(df, numeric, list(quantiles), sample_rows)
+            for i, q in enumerate(quantiles):
+                moments[quantile_name(q)] = qs[i]
+        names = [a for a in aggs if a in AGGS] + [quantile_name(q) for q in quantiles]
+        for j, column in enumerate(numeric):
+            stats[column] = {name: _plain(moments[name][j]) for name in names}
+            for name in ('count', 'null_count'):
+                if name in stats[column]:
+                    stats[column][name] = int(stats[column][name])
+
+    return {
+        'rows': len(df),
+        'numeric_columns': numeric,
+        'categorical_columns': categorical,
+        'quantiles': 'approximate' if len(df) > sample_rows else 'exact',
+        'columns': stats,
+    }
+
+
+def _plain(value):
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+def headline(summary):
+    # The four figures the dashboard cards show
+    cols = summary['columns']
+    sales, profit = cols.get('Sales', {}), cols.get('Profit', {})
+    return {
+        'total_sales': sales.get('sum'),
+        'avg_profit': profit.get('mean'),
+        'max_profit': profit.get('max'),
+        'min_profit': profit.get('min'),
+    }
+
+
+def select(summary, columns=None, aggs=None):
+    # Narrow a memoized summary to some columns / aggregates (no recompute)
+    stats = summary['columns']
+    if columns:
+        missing = [c for c in columns if c not in stats]
+        if missing:
+            raise ValueError(f"Unknown numeric column '{missing[0]}'")
+        stats = {c: stats[c] for c in columns}
+    if aggs:
+        known = next(iter(summary['columns'].values()), {})
+        missing = [a for a in aggs if a not in known]
+        if missing:
+            raise ValueError(f"Unknown aggregate '{missing[0]}'")
+        stats = {c: {a: values[a] for a in aggs} for c, values in stats.items()}
+    return {**headline(summary), **summary, 'columns': stats}
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Metrics files, sidecars and the render cache all go under the cwd
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from charts import png_params
+from config import CHART_PNG_MAX_PIXELS
+from storage import save_frame
+
+
+# -----------------------------
+# /api/chart with several metrics
+# -----------------------------
+@pytest.fixture
+def client(workdir):
+    rng = np.random.default_rng(0)
+    rows = 20_000
+    df = pd.DataFrame({
+        "Date": pd.date_range("2020-01-01", periods=rows, freq="h"),
+        "Sales": rng.normal(5_000, 1_500, rows),
+        "Profit": rng.normal(800, 600, rows),
+    })
+    # Gaps in different rows, so each metric alone would keep other rows
+    df.loc[rng.random(rows) < 0.05, "Sales"] = np.nan
+    df.loc[rng.random(rows) < 0.05, "Profit"] = np.nan
+    save_frame(df, "calculated_metrics.feather", fmt="feather")
+
+    import app
+    return app.app.test_client(), df.set_index("Date")
+
+
+@pytest.mark.parametrize("chart_type", ["line", "bar"])
+def test_metrics_of_one_request_share_labels(client, chart_type):
+    client, df = client
+    body = client.post("/api/chart", json={"metrics": ["Sales", "Profit"], "type": chart_type,
+                                           "points": 500}).get_json()
+    labels, series = body["labels"], body["series"]
+
+    assert 3 <= len(labels) <= 500
+    assert len(series["Sales"]) == len(series["Profit"]) == len(labels)
+    assert body["values"] == series["Sales"]
+    # Every (Sales, Profit) pair is one row of the data
+    rows = df.loc[pd.to_datetime(labels)]
+    np.testing.assert_array_equal(rows["Sales"].to_numpy(), series["Sales"])
+    np.testing.assert_array_equal(rows["Profit"].to_numpy(), series["Profit"])
+
+
+def test_bad_metrics_are_rejected(client):
+    client, _ = client
+    assert client.post("/api/chart", json={"metrics": ["Sales", "Nope"]}).status_code == 400
+    assert client.post("/api/chart", json={"metrics": "Sales,Profit"}).status_code == 200
+    assert client.post("/api/chart", json={"metrics": [1, 2]}).status_code == 400
+
+
+# -----------------------------
+# /api/chart.png image options
+# -----------------------------
+@pytest.mark.parametrize("style", ["/etc/passwd", "https://example.com/x.mplstyle", "no-such-style", ["ggplot"]])
+def test_png_style_must_be_a_named_style(style):
+    with pytest.raises(ValueError):
+        png_params({"style": style})
+
+
+def test_png_size_is_clamped():
+    p = png_params({"style": "ggplot", "width": 100_000, "height": "100000"})
+    assert (p["style"], p["width"], p["height"]) == ("ggplot", CHART_PNG_MAX_PIXELS, CHART_PNG_MAX_PIXELS)
+    assert png_params({})["style"] == "default"
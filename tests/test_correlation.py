@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from correlation import correlate, to_json
+
+
+# -----------------------------
+# Matches DataFrame.corr()
+# -----------------------------
+# The shift and scale come from the first block; later blocks that look
+# nothing like it must not cost precision.
+
+def drifting(rows=50_000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(rows)
+    frame = pd.DataFrame({
+        "Sales": rng.normal(100, 5, rows) + t * 0.5,
+        "Profit": rng.normal(0, 1, rows) + np.where(t < 1_000, 0, 1e7),
+        "Cost": rng.normal(1e8, 1e3, rows) - t * 40.0,
+    })
+    frame.loc[frame.index % 7 == 0, "Profit"] = np.nan
+    return frame
+
+
+def test_blocked_correlation_matches_pandas():
+    frame = drifting()
+    result = correlate(frame, block_rows=1_000)
+    np.testing.assert_allclose(result["matrix"], frame.corr().to_numpy(), rtol=0, atol=1e-9)
+
+
+def test_top_pairs_are_rounded_like_the_matrix():
+    body = to_json(correlate(drifting()), top=3)
+    matrix = dict(((a, b), r) for a, row in zip(body["columns"], body["matrix"]) for b, r in zip(body["columns"], row))
+    for pair in body["top_pairs"]:
+        assert pair["r"] == matrix[(pair["a"], pair["b"])]
@@ -0,0 +1,61 @@
+import hashlib
+
+import pytest
+
+from datasets import DatasetNotFound, DatasetRegistry
+
+
+# -----------------------------
+# Registry shared by several processes
+# -----------------------------
+# Two registries over one directory stand in for two server processes:
+# neither may lose the other's changes to registry.json.
+
+def upload(tmp_path, name, content):
+    path = tmp_path / f"{name}.upload"
+    path.write_bytes(content)
+    return str(path), name, hashlib.sha256(content).hexdigest()
+
+
+@pytest.fixture
+def registries(tmp_path, monkeypatch):
+    # Registration alone; processing would start a metrics job
+    monkeypatch.setattr(DatasetRegistry, "process", lambda self, dataset_id: self.get(dataset_id))
+    directory = str(tmp_path / "datasets")
+    return DatasetRegistry(directory), DatasetRegistry(directory)
+
+
+def test_registrations_from_two_processes_are_both_kept(tmp_path, registries):
+    first, second = registries
+    assert first.list() == []
+    a, _ = first.add(*upload(tmp_path, "a.csv", b"Date,Sales\n2024-01-01,1\n"))
+    b, _ = second.add(*upload(tmp_path, "b.csv", b"Date,Sales\n2024-01-02,2\n"))
+    c, _ = first.add(*upload(tmp_path, "c.csv", b"Date,Sales\n2024-01-03,3\n"))
+
+    for registry in registries:
+        assert [r["id"] for r in registry.list()] == [a["id"], b["id"], c["id"]]
+
+
+def test_delete_is_seen_by_the_other_process(tmp_path, registries):
+    first, second = registries
+    a, _ = first.add(*upload(tmp_path, "a.csv", b"Date,Sales\n2024-01-01,1\n"))
+    b, _ = first.add(*upload(tmp_path, "b.csv", b"Date,Sales\n2024-01-02,2\n"))
+    assert second.get(a["id"])["name"] == "a.csv"
+
+    second.delete(a["id"])
+    first._update(b["id"], status="ready")
+
+    with pytest.raises(DatasetNotFound):
+        first.get(a["id"])
+    assert [r["id"] for r in second.list()] == [b["id"]]
+    assert second.get(b["id"])["status"] == "ready"
+
+
+def test_find_returns_the_latest_upload_of_a_name(tmp_path, registries):
+    first, second = registries
+    first.add(*upload(tmp_path, "sales.csv", b"Date,Sales\n2024-01-01,1\n"))
+    latest, _ = second.add(*upload(tmp_path, "sales.csv", b"Date,Sales\n2024-01-01,2\n"))
+
+    assert first.find("sales.csv")["id"] == latest["id"]
+    with pytest.raises(DatasetNotFound):
+        first.find("other.csv")
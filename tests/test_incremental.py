@@ -0,0 +1,108 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import metrics_calculator
+from metrics_calculator import append_rows, main
+from metrics_state import load_state, state_path_for
+from storage import load_frame
+
+
+# -----------------------------
+# Incremental runs match a full recompute
+# -----------------------------
+# The input grows by appended batches; after each one `main(incremental=True)`
+# must leave the same output file and state as a full run over the whole
+# input. Sales brings in Contribution_% (per_row=False), which forces the
+# output to be rewritten; without it a csv output is appended to in place.
+
+def details(rows, start, seed, with_sales=True):
+    rng = np.random.default_rng(seed)
+    sales = rng.integers(100, 10_000, rows)
+    frame = {
+        "Date": pd.date_range(start, periods=rows, freq="D").strftime("%Y-%m-%d"),
+        "Sales": sales,
+        "Cost": (sales * rng.uniform(0.3, 0.9, rows)).astype(int),
+        "Profit": rng.integers(-500, 3_000, rows),
+        "Customers": rng.integers(1, 500, rows),
+        "Conversions": rng.integers(0, 100, rows),
+        "Revenue": rng.integers(1_000, 20_000, rows),
+        "Marketing_Spend": rng.integers(100, 2_000, rows),
+        "Total_Debt": np.round(rng.uniform(0, 1_000_000, rows), 2),
+        "Total_Equity": np.round(rng.uniform(10_000, 2_000_000, rows), 2),
+    }
+    if not with_sales:
+        del frame["Sales"]
+    return pd.DataFrame(frame)
+
+
+def quiet(fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+@pytest.fixture
+def appends(monkeypatch):
+    # Counts the runs that took the append-in-place branch
+    calls = []
+    append_frame = metrics_calculator.append_frame
+    monkeypatch.setattr(metrics_calculator, "append_frame",
+                        lambda df, path: calls.append(len(df)) or append_frame(df, path))
+    return calls
+
+
+@pytest.mark.parametrize("fmt", ["csv", "feather"])
+@pytest.mark.parametrize("with_sales", [True, False])
+def test_incremental_matches_full_recompute(workdir, appends, fmt, with_sales):
+    batches = [details(400, "2020-01-01", 0, with_sales),
+               details(250, "2021-02-04", 1, with_sales),
+               details(300, "2021-10-12", 2, with_sales)]
+    batches[0].to_csv("Details.csv", index=False)
+    incremental = quiet(main, "Details.csv", f"incremental.{fmt}", fmt=fmt)
+    for batch in batches[1:]:
+        batch.to_csv("Details.csv", mode="a", header=False, index=False)
+        incremental = quiet(main, "Details.csv", incremental, fmt=fmt, incremental=True)
+    full = quiet(main, "Details.csv", f"full.{fmt}", fmt=fmt)
+
+    # Only a csv output without whole-column metrics is appended to
+    assert appends == ([250, 300] if fmt == "csv" and not with_sales else [])
+    assert ("Contribution_%" in load_frame(full).columns) == with_sales
+    pd.testing.assert_frame_equal(load_frame(incremental, compact_dtypes=False),
+                                  load_frame(full, compact_dtypes=False))
+
+    _, inc_state = load_state(state_path_for(incremental))
+    _, full_state = load_state(state_path_for(full))
+    assert inc_state.rows == full_state.rows == 950
+    assert inc_state.basic() == full_state.basic()
+    assert inc_state.time_intelligence() == full_state.time_intelligence()
+
+
+def test_rewritten_input_falls_back_to_full_run(workdir, appends):
+    details(300, "2020-01-01", 0).to_csv("Details.csv", index=False)
+    output = quiet(main, "Details.csv", "metrics.csv", fmt="csv")
+    # Same size, different bytes: not an append, so everything is recomputed
+    details(300, "2020-01-01", 5).to_csv("Details.csv", index=False)
+    output = quiet(main, "Details.csv", output, fmt="csv", incremental=True)
+    full = quiet(main, "Details.csv", "full.csv", fmt="csv")
+
+    assert appends == []
+    pd.testing.assert_frame_equal(load_frame(output, compact_dtypes=False), load_frame(full, compact_dtypes=False))
+
+
+@pytest.mark.parametrize("fmt, with_sales, mode", [
+    ("csv", False, "append"),
+    ("csv", True, "rewrite"),
+    ("feather", False, "rewrite"),
+])
+def test_append_report_says_when_the_output_was_rewritten(workdir, fmt, with_sales, mode):
+    details(200, "2020-01-01", 0, with_sales).to_csv("Details.csv", index=False)
+    output = quiet(main, "Details.csv", f"metrics.{fmt}", fmt=fmt)
+    details(50, "2020-07-19", 1, with_sales).to_csv("Details.csv", mode="a", header=False, index=False)
+
+    source, state = load_state(state_path_for(output))
+    _, _, report = quiet(append_rows, "Details.csv", output, state_path_for(output), source, state, fmt=fmt)
+    assert (report["rows"], report["mode"]) == (50, mode)
+    assert (report["reason"] is None) == (mode == "append")
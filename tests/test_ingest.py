@@ -0,0 +1,80 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+
+from ingest import ingest_csv
+from metrics_calculator import main
+from metrics_state import load_state, state_path_for
+from storage import load_frame
+
+
+# -----------------------------
+# Chunked ingestion matches metrics_calculator.main
+# -----------------------------
+def details_with_gaps(rows, seed=0):
+    # Details.csv rows where some dates are missing or not dates at all
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2020-01-01", periods=rows, freq="D").strftime("%Y-%m-%d").to_numpy(dtype=object)
+    dates[rng.random(rows) < 0.05] = None
+    dates[rng.random(rows) < 0.02] = "not a date"
+    dates[0] = "2020-01-01"             # the date format is inferred from the first value
+    return pd.DataFrame({
+        "Date": dates,
+        "Sales": rng.integers(100, 10_000, rows),
+        "Profit": rng.integers(-500, 3_000, rows),
+        "Customers": rng.integers(1, 500, rows),
+        "Conversions": rng.integers(0, 100, rows),
+    })
+
+
+def test_chunked_ingest_matches_full_run_with_missing_dates(workdir):
+    df = details_with_gaps(1000)
+    df.to_csv("Details.csv", index=False)
+    dated = int(pd.to_datetime(df["Date"], format="%Y-%m-%d", errors="coerce").notna().sum())
+    assert dated < len(df)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = main("Details.csv", "full.feather", fmt="feather")
+    report, _ = ingest_csv("Details.csv", "chunked.feather", fmt="feather", chunksize=128)
+
+    assert report["rows"] == dated
+    assert report["dropped_rows"] == len(df) - dated
+    expected = load_frame(full, compact_dtypes=False)
+    actual = load_frame(report["output"], compact_dtypes=False)
+    assert len(expected) == dated
+    # Chunked ingestion stores numbers as float64; the values must match
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    _, full_state = load_state(state_path_for(full))
+    _, chunked_state = load_state(state_path_for(report["output"]))
+    assert chunked_state.rows == full_state.rows
+    assert chunked_state.basic() == full_state.basic()
+
+
+def test_text_column_empty_in_first_chunk_keeps_its_values(workdir):
+    rows = 1000
+    pd.DataFrame({
+        "Date": pd.date_range("2020-01-01", periods=rows, freq="h").strftime("%Y-%m-%d %H:%M:%S"),
+        "Sales": np.arange(rows),
+        "Region": [None] * 200 + ["North", "South"] * 400,
+    }).to_csv("Details.csv", index=False)
+
+    for fmt in ("feather", "csv"):
+        report, _ = ingest_csv("Details.csv", f"chunked.{fmt}", fmt=fmt, chunksize=128)
+        region = load_frame(report["output"], compact_dtypes=False)["Region"]
+        assert report["invalid_values"] == {}
+        assert region.notna().sum() == 800
+        assert set(region.dropna()) == {"North", "South"}
+
+
+def test_no_dated_rows_writes_an_empty_output_like_a_full_run(workdir):
+    pd.DataFrame({"Date": [None, "not a date"], "Sales": [1, 2]}).to_csv("Details.csv", index=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = main("Details.csv", "full.feather", fmt="feather")
+    report, _ = ingest_csv("Details.csv", "chunked.feather", fmt="feather")
+
+    assert report["rows"] == 0 and report["dropped_rows"] == 2
+    assert list(load_frame(report["output"]).columns) == list(load_frame(full).columns)
+    assert len(load_frame(report["output"])) == 0
@@ -0,0 +1,42 @@
+import threading
+
+from jobs import JobRunner
+
+
+# -----------------------------
+# Job status across processes
+# -----------------------------
+# Two runners over one directory stand in for two server processes: a job
+# submitted to one is reported by the other, progress included.
+
+def test_other_process_sees_status_and_progress(tmp_path):
+    directory = str(tmp_path / "jobs")
+    first, second = JobRunner(workers=1, directory=directory), JobRunner(workers=1, directory=directory)
+    halfway, release = threading.Event(), threading.Event()
+
+    def work(job, rows):
+        job.report(rows_done=rows // 2)
+        halfway.set()
+        release.wait(5)
+        return {"rows": rows}
+
+    try:
+        job, created = first.submit("count", work, {"rows": 10})
+        assert created
+        assert halfway.wait(5)
+        seen = second.get(job.id)
+        assert seen.to_dict()["status"] == "running"
+        assert seen.to_dict()["progress"] == {"rows_done": 5}
+
+        release.set()
+        first.shutdown()
+        seen = second.get(job.id).to_dict()
+        assert seen["status"] == "succeeded"
+        assert seen["result"] == {"rows": 10}
+        assert [j.id for j in second.recent()] == [job.id]
+        assert second.get("0123456789ab") is None
+        assert second.get("../jobs") is None
+    finally:
+        release.set()
+        first.shutdown()
+        second.shutdown()
@@ -0,0 +1,26 @@
+import os
+
+import pandas as pd
+
+from schema import load_schema, read_csv, schema_path_for
+
+
+# -----------------------------
+# Recorded schemas
+# -----------------------------
+# Schemas are cached away from the data: nothing appears next to an input,
+# and a file is only matched with the schema recorded for its own path.
+
+def test_schema_is_recorded_in_the_cache_not_next_to_the_input(workdir):
+    os.makedirs("uploads")
+    frame = pd.DataFrame({"Date": ["2024-01-01", "2024-01-02"], "Sales": [1, 2], "Region": ["N", "S"]})
+    frame.to_csv("Details.csv", index=False)
+    frame.to_csv(os.path.join("uploads", "Details.csv"), index=False)
+
+    first = read_csv("Details.csv")
+    assert sorted(os.listdir(workdir)) == ["Details.csv", "cache", "uploads"]
+    assert os.path.exists(schema_path_for("Details.csv"))
+    assert load_schema(os.path.join("uploads", "Details.csv")) is None
+
+    pd.testing.assert_frame_equal(read_csv("Details.csv"), first)
+    assert os.listdir("uploads") == ["Details.csv"]
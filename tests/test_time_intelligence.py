@@ -0,0 +1,39 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from metrics_calculator import main
+from metrics_state import load_state, state_path_for
+from rollups import RollupStore
+from storage import load_frame
+from time_intelligence import series
+
+
+# -----------------------------
+# Same growth as the pipeline
+# -----------------------------
+# The latest yoy (year grain) and mom (month grain) of the full series must
+# equal the pipeline's yoy_growth / mom_growth, including when the base is
+# negative.
+
+@pytest.mark.parametrize("offset", [1_000, -2_000])
+def test_latest_growth_matches_pipeline(workdir, offset):
+    rng = np.random.default_rng(0)
+    rows = 800
+    pd.DataFrame({
+        "Date": pd.date_range("2022-03-01", periods=rows, freq="D").strftime("%Y-%m-%d"),
+        "Sales": rng.integers(0, 1_000, rows) + offset,
+    }).to_csv("Details.csv", index=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = main("Details.csv", "metrics.csv", fmt="csv")
+    _, state = load_state(state_path_for(output))
+    expected = state.time_intelligence()
+
+    store = RollupStore(load_frame(output))
+    yearly = series(store, ["Sales"], grain="year")["Sales"]["yoy"]
+    monthly = series(store, ["Sales"], grain="month")["Sales"]["mom"]
+    assert yearly[-1] == pytest.approx(expected["yoy_growth"])
+    assert monthly[-1] == pytest.approx(expected["mom_growth"])
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from rollups import GRAINS
+
+
+# -----------------------------
+# Time intelligence as full series
+# -----------------------------
+# Every figure is computed for every period of a grain, for several metrics
+# at once, from the per-bucket sums of a RollupStore (rows are grouped and
+# sorted by date once, when the store is built). Buckets without data are
+# filled with 0 so each series is calendar-regular:
+#
+#   total        sum of the metric in the period
+#   mtd/qtd/ytd  month/quarter/year to date: grouped cumulative sums of the
+#                totals (only the ones coarser than the grain)
+#   <x>o<x>      growth % over the previous period (mom at month grain,
+#                qoq at quarter grain, ...)
+#   yoy          growth % over the same period one year earlier
+#   cagr         compound annual growth % of the period total against the
+#                first period's
+#   rolling_N    mean of the last N period totals
+#
+# Growth is (current - base) / base * 100 against the signed base, the
+# formula of yoy_growth / mom_growth in metrics_state.py, so the figures for
+# the latest periods agree with the pipeline's; with a negative base a rise
+# reads as a negative growth. Growth figures are null where the base period
+# is 0 or missing. start/end only trim the returned periods; to-date sums
+# and growth rates still see the whole history.
+#
+#   series(store, ["Sales", "Profit"], grain="month", window=3)
+
+TO_DATE = {"mtd": "M", "qtd": "Q", "ytd": "Y"}
+GRAIN_ORDER = ["day", "week", "month", "quarter", "year"]
+PERIOD_GROWTH = {"day": "dod", "week": "wow", "month": "mom", "quarter": "qoq", "year": "yoy"}
+PERIODS_PER_YEAR = {"week": 52, "month": 12, "quarter": 4, "year": 1}
+
+
+def _to_date_keys(grain):
+    # mtd/qtd/ytd that are meaningful at this grain
+    rank = GRAIN_ORDER.index(grain)
+    return [name for name, level in zip(TO_DATE, ["month", "quarter", "year"]) if GRAIN_ORDER.index(level) > rank]
+
+
+def _growth(current, base):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = (current - base) / base * 100
+    return out.where(base != 0)
+
+
+def series(store, metrics, grain="month", window=3, start=None, end=None):
+    # {"periods": DatetimeIndex, metric: {figure: ndarray}} for the periods
+    # that start inside [start, end]
+    if grain not in GRAINS:
+        raise ValueError(f"Unknown grain '{grain}' (expected one of {', '.join(GRAINS)})")
+    unknown = [m for m in metrics if m not in store.metrics]
+    if unknown:
+        raise ValueError(f"Unknown metric '{unknown[0]}'")
+    if window < 1:
+        raise ValueError("'window' must be positive")
+
+    sums = store.tables[grain]["sum"][list(metrics)]
+    if len(sums) == 0:
+        return {"periods": sums.index, **{m: {} for m in metrics}}
+    periods = pd.period_range(sums.index[0], sums.index[-1], freq=GRAINS[grain])
+    totals = sums.reindex(periods.start_time, fill_value=0.0)
+    index = totals.index
+
+    figures = {"total": totals}
+    for name in _to_date_keys(grain):
+        figures[name] = totals.groupby(index.to_period(TO_DATE[name]).start_time).cumsum()
+    figures[PERIOD_GROWTH[grain]] = _growth(totals, totals.shift(1))
+    if grain != "year":
+        if grain == "day":
+            last_year = totals.reindex(index - pd.DateOffset(years=1)).set_axis(index)
+        else:
+            last_year = totals.shift(PERIODS_PER_YEAR[grain])
+        figures["yoy"] = _growth(totals, last_year)
+
+    years = ((index - index[0]).days / 365.25).to_numpy()[:, None]
+    first = totals.iloc[0].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = totals.to_numpy() / first
+        cagr = (np.power(ratio, 1 / np.where(years > 0, years, 1)) - 1) * 100
+    cagr[(years == 0).ravel()] = np.nan
+    cagr[(ratio <= 0) | ~np.isfinite(cagr)] = np.nan
+    figures["cagr"] = pd.DataFrame(cagr, index=index, columns=totals.columns)
+    figures[f"rolling_{window}"] = totals.rolling(window, min_periods=window).mean()
+
+    lo = index.searchsorted(pd.Timestamp(start), side="left") if start else 0
+    hi = index.searchsorted(pd.Timestamp(end), side="right") if end else len(index)
+    result = {"periods": index[lo:hi]}
+    for metric in metrics:
+        result[metric] = {name: frame[metric].to_numpy(dtype=float)[lo:hi] for name, frame in figures.items()}
+    return result
+
+
+def to_json(result):
+    # Columnar body for /api/time-intelligence; NaN becomes null
+    metrics = {metric: {name: [None if np.isnan(v) else v for v in values.tolist()]
+                        for name, values in figures.items()}
+               for metric, figures in result.items() if metric != "periods"}
+    return {"periods": result["periods"].strftime("%Y-%m-%d").tolist(), "metrics": metrics}
@@ -0,0 +1,73 @@
+import os
+import time
+
+from config import WARM_DATASETS, WARM_DERIVED
+from correlation import correlate
+from data_cache import dataset_cache
+from datasets import DatasetError, dataset_registry
+from metrics_query import date_sorted
+from perf import perf
+from rollups import RollupStore
+from storage import load_frame, metrics_path
+from summary import summarize
+
+
+# -----------------------------
+# Startup warm-up
+# -----------------------------
+# Loads metrics files into dataset_cache and builds their derived values
+# (sorted dates, summary, rollups, correlation) with the same names and
+# builders the routes use, so the first request finds them cached. Run it
+# in the parent process before server workers fork (gunicorn.conf.py):
+# the workers then share the frames' pages copy-on-write instead of each
+# parsing its own copy.
+#
+#   python warmup.py                 default calculated_metrics file
+#   MORPH_WARM=all python warmup.py  plus every ready dataset
+
+BUILDERS = {
+    'date_sorted': date_sorted,
+    'summary': summarize,
+    'rollups': RollupStore,
+    'correlation': correlate,
+}
+
+
+def warm_paths(which=WARM_DATASETS):
+    if which == 'none':
+        return []
+    paths = [metrics_path()]
+    if which == 'all':
+        for record in dataset_registry.list():
+            try:
+                paths.append(dataset_registry.metrics_path(record['id']))
+            except DatasetError:
+                continue
+    return [p for p in paths if os.path.exists(p)]
+
+
+def warm(which=WARM_DATASETS, derived=WARM_DERIVED):
+    # -> [{'path', 'seconds', 'built', 'error'}], one per metrics file
+    report = []
+    for path in warm_paths(which):
+        start = time.perf_counter()
+        entry = {'path': path, 'built': [], 'error': None}
+        with perf.trace('warmup'):
+            try:
+                dataset_cache.get(path, load_frame)
+                for name in derived:
+                    dataset_cache.derived(path, name, BUILDERS[name], load_frame)
+                    entry['built'].append(name)
+            except Exception as e:
+                # A file the server cannot read should not stop it starting;
+                # its requests will report the error as usual
+                entry['error'] = str(e)
+        entry['seconds'] = round(time.perf_counter() - start, 3)
+        report.append(entry)
+    return report
+
+
+if __name__ == '__main__':
+    for entry in warm():
+        status = f"error: {entry['error']}" if entry['error'] else ', '.join(entry['built'])
+        print(f"{entry['path']}: {entry['seconds']:.3f}s ({status})")